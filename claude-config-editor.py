@@ -3,34 +3,3601 @@
 Claude Config Editor - Полноценный редактор .claude.json
 """
 
+import argparse
+import bisect
+import errno
+import hashlib
+import heapq
 import http.server
+import ipaddress
 import socketserver
 import json
+import statistics
+import tempfile
+import lzma
 import os
+import queue
+import re
+import shutil
+import socket
+import sqlite3
+import stat
+import subprocess
+import threading
+import time
+import urllib.request
+from array import array
+from decimal import Decimal
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import count, islice
 from pathlib import Path
 from urllib.parse import parse_qs, urlparse
 
+# Необязательные быстрые JSON-библиотеки; без них работает stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
 CLAUDE_CONFIG_PATH = Path.home() / '.claude.json'
+STATE_DIR = Path.home() / '.claude-config-editor'
 PORT = 8765
+# Редактор запускает команды MCP серверов из конфига, поэтому по умолчанию
+# слушает только localhost; с других адресов доступны лишь маршруты парка
+HOST = '127.0.0.1'
+REMOTE_ROUTES = {'/fleet', '/api/fleet/summary', '/api/fleet/rollup', '/api/fleet/ingest'}
+
+# Web Worker: загрузка, разбор и подсчёт размеров вне UI-потока.
+# Полный конфиг живёт только здесь, странице уходят компактные сводки.
+CONFIG_WORKER_JS = '''
+let config = null;
+let projectSizes = new Map();
+// Правки применяет сервер в рабочей копии сессии, сюда приходят патчи
+let session = null;
+// Конфиг из реестра сервера: страница передаёт ?config= в адресе воркера
+const CONFIG_NAME = new URLSearchParams(self.location.search).get('config');
+
+function apiUrl(url) {
+    return CONFIG_NAME ? url + (url.includes('?') ? '&' : '?') + 'config=' + encodeURIComponent(CONFIG_NAME) : url;
+}
+
+self.onmessage = async (event) => {
+    const { id, type, payload } = event.data;
+    try {
+        const result = await handlers[type](payload || {});
+        self.postMessage({ id, result });
+    } catch (error) {
+        self.postMessage({ id, error: error.message });
+    }
+};
+
+function progress(stage, loaded, total) {
+    self.postMessage({ type: 'progress', stage, loaded, total });
+}
+
+function decodeListing(data) {
+    // Колонки сервера -> массив путей и типизированные массивы без объекта на проект
+    const paths = new Array(data.count);
+    let previous = '';
+    for (let i = 0; i < data.count; i++) {
+        previous = previous.slice(0, data.paths.prefix[i]) + data.paths.suffix[i];
+        paths[i] = previous;
+    }
+    return {
+        version: data.version,
+        paths,
+        size: Uint32Array.from(data.size),
+        historyCount: Uint32Array.from(data.historyCount)
+    };
+}
+
+function listingFromConfig() {
+    const entries = Object.entries(config.projects || {});
+    const listing = {
+        paths: entries.map(([path]) => path),
+        size: new Uint32Array(entries.length),
+        historyCount: new Uint32Array(entries.length)
+    };
+    entries.forEach(([, project], i) => {
+        listing.size[i] = JSON.stringify(project).length;
+        listing.historyCount[i] = project.history ? project.history.length : 0;
+    });
+    return listing;
+}
+
+function setProjectSizes(listing) {
+    projectSizes = new Map();
+    listing.paths.forEach((path, i) => projectSizes.set(path, listing.size[i]));
+}
+
+async function sessionCall(action, body) {
+    const response = await fetch(apiUrl('/api/session/' + action), {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ session, ...body })
+    });
+    const data = await response.json();
+    if (!response.ok || data.error) throw new Error(data.error || response.statusText);
+    return data;
+}
+
+function applyPatches(patches) {
+    // Патч заменяет или удаляет значение по пути; дальше пересчитываются размеры проектов
+    const changedProjects = new Set();
+    const changedKeys = new Set();
+    for (const { path, value, deleted } of patches) {
+        let parent = config;
+        for (const key of path.slice(0, -1)) parent = parent[key];
+        const key = path[path.length - 1];
+        if (deleted) delete parent[key];
+        else parent[key] = value;
+        if (path[0] === 'projects' && path.length > 1) changedProjects.add(path[1]);
+        else changedKeys.add(path[0]);
+    }
+
+    const result = { projects: [], removedProjects: [], keys: {} };
+    for (const path of changedProjects) {
+        const project = config.projects && config.projects[path];
+        if (project === undefined) {
+            projectSizes.delete(path);
+            result.removedProjects.push(path);
+            continue;
+        }
+        const size = JSON.stringify(project).length;
+        projectSizes.set(path, size);
+        result.projects.push({ path, historyCount: project.history ? project.history.length : 0, size });
+    }
+    for (const key of changedKeys) result.keys[key] = config[key];
+    result.totalSize = totalSize();
+    return result;
+}
+
+async function edit(op, payload) {
+    const data = await sessionCall('edit', { op, ...payload });
+    return { ...applyPatches(data.patches), ...data.result, state: data.state };
+}
+
+const handlers = {
+    async load() {
+        if (session) sessionCall('close', {}).catch(() => {});
+        const created = await (await fetch(apiUrl('/api/session'), { method: 'POST' })).json();
+        if (created.error) throw new Error(created.error);
+        session = created.session;
+
+        // Сначала компактный список проектов: таблица рисуется до загрузки конфига
+        progress('listing', 0, 0);
+        const listingResponse = await fetch(apiUrl('/api/projects?format=columnar'));
+        const listingData = await listingResponse.json();
+        if (listingData.error) throw new Error(listingData.error);
+        const listing = decodeListing(listingData);
+        setProjectSizes(listing);
+        self.postMessage({ type: 'listing', listing });
+
+        const response = await fetch(apiUrl('/api/config?session=' + session));
+        const total = Number(response.headers.get('Content-Length')) || 0;
+        const reader = response.body.getReader();
+        const chunks = [];
+        let loaded = 0;
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            chunks.push(value);
+            loaded += value.length;
+            progress('download', loaded, total);
+        }
+
+        progress('parse', loaded, total);
+        const bytes = new Uint8Array(loaded);
+        let offset = 0;
+        for (const chunk of chunks) {
+            bytes.set(chunk, offset);
+            offset += chunk.length;
+        }
+        const data = JSON.parse(new TextDecoder().decode(bytes));
+        if (data.error) throw new Error(data.error);
+        config = data.config;
+
+        let fresh = null;
+        if (data.version !== listing.version) {
+            // Файл изменился между запросами: список строится по загруженному конфигу
+            progress('analyze', 0, 0);
+            fresh = listingFromConfig();
+            setProjectSizes(fresh);
+        }
+
+        return { session, path: data.path, version: data.version, config: shell(), listing: fresh, totalSize: totalSize() };
+    },
+
+    deleteProjects({ paths }) {
+        return edit('deleteProjects', { paths });
+    },
+
+    setKey({ key, value }) {
+        return edit('setKey', { key, value });
+    },
+
+    editPath({ path, action, keep }) {
+        return edit('editPath', { path, action, keep });
+    },
+
+    removeHistoryEntries({ removals }) {
+        return edit('removeHistoryEntries', { removals });
+    },
+
+    async undo() {
+        const data = await sessionCall('undo', {});
+        return { ...applyPatches(data.patches), state: data.state };
+    },
+
+    async redo() {
+        const data = await sessionCall('redo', {});
+        return { ...applyPatches(data.patches), state: data.state };
+    },
+
+    pretty() {
+        return JSON.stringify(config, null, 2);
+    },
+
+    async save({ force, overwrite }) {
+        // Ответ отдаётся как есть: при ошибках проверки в нём список ошибок,
+        // при изменении файла на диске - conflict и текущая версия
+        const response = await fetch(apiUrl('/api/session/commit'), {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ session, force: !!force, overwrite: overwrite || null })
+        });
+        return response.json();
+    }
+};
+
+function shell() {
+    const { projects, ...rest } = config;
+    return rest;
+}
+
+function totalSize() {
+    // Длина JSON.stringify(config) без повторной сериализации проектов
+    let size = JSON.stringify(shell()).length;
+    if (config.projects && typeof config.projects === 'object') {
+        let projectsSize = 2 + Math.max(0, projectSizes.size - 1);
+        for (const [path, projectSize] of projectSizes) {
+            projectsSize += JSON.stringify(path).length + 1 + projectSize;
+        }
+        size += (size > 2 ? 1 : 0) + '"projects":'.length + projectsSize;
+    }
+    return size;
+}
+'''
+
+class StdlibJson:
+    """Эталон формата файла: json.dump(indent=2, ensure_ascii=False) в UTF-8."""
+
+    name = 'json'
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, value):
+        return json.dumps(value).encode('utf-8')
+
+    def dumps_pretty(self, value):
+        return json.dumps(value, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+class OrjsonJson(StdlibJson):
+    """orjson с откатом на stdlib там, где вывод или поведение расходятся.
+
+    Отличается только запись float в экспоненте (1e-05 / 0.00001, 1e+16 /
+    1e16), поэтому при таком числе в выводе документ пересериализуется
+    через stdlib. Записать int больше 64 бит orjson не может - тоже откат.
+    При чтении такие int становятся float, как и в JSON.parse самого
+    Claude Code.
+    """
+
+    name = 'orjson'
+    # Число с экспонентой или 0.0000... на месте значения поля и элемента массива;
+    # два шаблона с литеральным началом ищутся в разы быстрее одного с альтернативой
+    UNSAFE_VALUE = re.compile(rb': -?(?:\d[\d.]*e|0\.0000)')
+    UNSAFE_ITEM = re.compile(rb'\n +-?(?:\d[\d.]*e|0\.0000)')
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return json.loads(data)
+
+    def dumps(self, value):
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            return super().dumps(value)
+
+    def dumps_pretty(self, value):
+        try:
+            text = orjson.dumps(value, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            return super().dumps_pretty(value)
+        if self.UNSAFE_VALUE.search(text) or self.UNSAFE_ITEM.search(text):
+            return super().dumps_pretty(value)
+        return text
+
+
+class UjsonJson(StdlibJson):
+    name = 'ujson'
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+    def dumps(self, value):
+        return ujson.dumps(value, ensure_ascii=False).encode('utf-8')
+
+    def dumps_pretty(self, value):
+        return ujson.dumps(value, indent=2, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+
+def json_probe_documents():
+    """Документы для проверки совместимости: [(документ, сверять ли разбор)].
+
+    Первый - типичный конфиг, он же используется для замера.
+    """
+    typical = {
+        'numStartups': 42,
+        'theme': 'dark',
+        'autoUpdates': True,
+        'projects': {
+            f'/home/user/проект-{i}': {
+                'allowedTools': [],
+                'history': [
+                    {'display': f'исправь тест {j} 😀 "кавычки" \\ / \t', 'pastedContents': {}}
+                    for j in range(10)
+                ],
+                'mcpServers': {},
+                'hasTrustDialogAccepted': i % 2 == 0,
+                'lastCost': 0.0123 * i,
+                'lastDuration': 1000 + i,
+                'lastSessionId': f'3e4f{i:04d}-1e5a-4e2f-9b1c-0d2e3f4a5b6c',
+                'exampleFiles': None
+            }
+            for i in range(100)
+        }
+    }
+    edge = {
+        'floats': [1e-05, 5e-07, 1e+16, 1.5e+300, -0.0, 0.0001, 100.0, 1e+21, 1.2345678901234568e+16],
+        'strings': ['\x00\x1f\x7f', '\u2028\u2029', 'é😀', '</script>', ''],
+        'empty': [{}, [], [[]]],
+        'nested': {'1e5': {'e': '1e5: 0.00001'}}
+    }
+    # int больше 64 бит: проверяется только запись
+    bigint = {'bigint': [2 ** 70 + 1, -2 ** 64 - 1]}
+    return [(typical, True), (edge, True), (bigint, False)]
+
+
+def measure_json_backend(backend, text, value, runs=3):
+    """Лучшее из runs время разбора text и записи value в формате файла, мс."""
+    loads_times = []
+    dumps_times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        backend.loads(text)
+        loads_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        backend.dumps_pretty(value)
+        dumps_times.append(time.perf_counter() - started)
+    return min(loads_times) * 1000, min(dumps_times) * 1000
+
+
+def select_json_backend(sample=None, runs=3):
+    """Самый быстрый из установленных бэкендов, чей вывод совпадает со stdlib байт в байт.
+
+    Возвращает (backend, отчёт по каждому кандидату). sample - документ для
+    замера; по умолчанию типичный синтетический конфиг.
+    """
+    reference = StdlibJson()
+    candidates = [reference]
+    if orjson is not None:
+        candidates.append(OrjsonJson())
+    if ujson is not None:
+        candidates.append(UjsonJson())
+
+    probes = json_probe_documents()
+    sample = probes[0][0] if sample is None else sample
+    sample_text = reference.dumps_pretty(sample)
+
+    report = []
+    for backend in candidates:
+        try:
+            compatible = all(
+                backend.dumps_pretty(doc) == reference.dumps_pretty(doc)
+                and (not check_loads or backend.loads(reference.dumps_pretty(doc)) == doc)
+                for doc, check_loads in probes
+            )
+        except Exception:
+            compatible = False
+        loads_ms, dumps_ms = measure_json_backend(backend, sample_text, sample, runs) if compatible else (None, None)
+        report.append({'name': backend.name, 'backend': backend, 'compatible': compatible,
+                       'loadsMs': loads_ms, 'dumpsMs': dumps_ms})
+
+    usable = [r for r in report if r['compatible']]
+    best = min(usable, key=lambda r: r['loadsMs'] + r['dumpsMs'])
+    base = report[0]['loadsMs'] + report[0]['dumpsMs']
+    for r in usable:
+        r['speedup'] = base / max(r['loadsMs'] + r['dumpsMs'], 1e-9)
+    return best['backend'], report
+
+
+# Выбирается в main(): замер бэкендов не нужен при импорте модуля; до выбора работает stdlib
+JSON_BACKEND = StdlibJson()
+
+
+def use_json_backend(backend):
+    """Бэкенд JSON для всего модуля."""
+    global JSON_BACKEND
+    JSON_BACKEND = backend
+
+RAW_PREVIEW_CHARS = 200
+RAW_LINE_CHARS = 2000
+RAW_NODE_LIMIT = 200
+
+
+class ConfigDocument:
+    """Разобранный конфиг и производные от него данные для текущей версии файла.
+
+    Версия - (mtime_ns, size); при её смене кэш разбора и все производные
+    (форматирование, индексы и т.п.) сбрасываются.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        # before_load(document, size) - перед разбором новой версии файла:
+        # реестр освобождает под неё место в бюджете памяти
+        self.before_load = None
+        self._lock = threading.RLock()
+        self._version = None
+        self._config = None
+        self._derived = {}
+
+    def stat_version(self):
+        st = self.path.stat()
+        return (st.st_mtime_ns, st.st_size)
+
+    @property
+    def loaded_size(self):
+        """Размер файла, разбор которого сейчас в памяти; 0 - ничего не загружено."""
+        # Без блокировки: реестр спрашивает об этом, пока другой поток разбирает файл
+        version, config = self._version, self._config
+        return version[1] if version is not None and config is not None else 0
+
+    def unload(self):
+        """Сбрасывает разбор; False, если документ сейчас занят другим потоком."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._version = None
+            self._config = None
+            self._derived = {}
+        finally:
+            self._lock.release()
+        return True
+
+    def load_copy(self):
+        # Независимая копия для изменения: кэш не должен видеть незаписанные правки
+        with open(self.path, 'rb') as f:
+            return JSON_BACKEND.loads(f.read())
+
+    def load(self):
+        with self._lock:
+            version = self.stat_version()
+            if version != self._version:
+                if self.before_load is not None:
+                    self.before_load(self, version[1])
+                with open(self.path, 'rb') as f:
+                    data = f.read()
+                self._derived = {}
+                self._config = JSON_BACKEND.loads(data)
+                self._version = version
+            return self._config
+
+    def derived(self, name, build):
+        with self._lock:
+            config = self.load()
+            if name not in self._derived:
+                self._derived[name] = build(config)
+            return self._derived[name]
+
+    def version_tag(self):
+        """Метка текущей версии файла без его чтения."""
+        return '%d-%d' % self.stat_version()
+
+    def snapshot(self, name=None, build=None):
+        """Конфиг (или производные данные) вместе с меткой версии файла."""
+        with self._lock:
+            value = self.derived(name, build) if build else self.load()
+            return value, '%d-%d' % self._version
+
+
+class PrettyRendering:
+    """Конфиг, отформатированный как json.dump(indent=2), с индексом начала строк."""
+
+    def __init__(self, config):
+        self.text = JSON_BACKEND.dumps_pretty(config)
+        self.offsets = array('Q', [0])
+        self.offsets.extend(m.end() for m in re.finditer(b'\n', self.text))
+
+    @property
+    def line_count(self):
+        return len(self.offsets)
+
+    def lines(self, start, count):
+        start = max(0, min(start, self.line_count))
+        end = min(self.line_count, start + max(0, count))
+        result = []
+        for i in range(start, end):
+            line_end = self.offsets[i + 1] - 1 if i + 1 < self.line_count else len(self.text)
+            line = self.text[self.offsets[i]:line_end].decode('utf-8', errors='replace')
+            if len(line) > RAW_LINE_CHARS:
+                line = line[:RAW_LINE_CHARS] + f' … (+{len(line) - RAW_LINE_CHARS} симв.)'
+            result.append(line)
+        return result
+
+
+def resolve_json_path(config, path):
+    node = config
+    for key in path:
+        if isinstance(node, list):
+            node = node[int(key)]
+        elif isinstance(node, dict):
+            node = node[key]
+        else:
+            raise KeyError(key)
+    return node
+
+
+def describe_json_node(key, value):
+    if isinstance(value, dict):
+        return {'key': key, 'type': 'object', 'count': len(value)}
+    if isinstance(value, list):
+        return {'key': key, 'type': 'array', 'count': len(value)}
+
+    text = json.dumps(value, ensure_ascii=False)
+    node = {'key': key, 'type': 'string' if isinstance(value, str) else 'scalar', 'value': text}
+    if len(text) > RAW_PREVIEW_CHARS:
+        node['value'] = text[:RAW_PREVIEW_CHARS]
+        node['truncated'] = len(text)
+    return node
+
+
+def json_node_children(config, path, offset=0, limit=RAW_NODE_LIMIT):
+    node = resolve_json_path(config, path)
+    if isinstance(node, dict):
+        items = islice(node.items(), offset, offset + limit)
+    elif isinstance(node, list):
+        items = ((i, node[i]) for i in range(offset, min(len(node), offset + limit)))
+    else:
+        raise ValueError('Узел не является объектом или массивом')
+
+    return {
+        'path': path,
+        'total': len(node),
+        'offset': offset,
+        'children': [describe_json_node(key, value) for key, value in items]
+    }
+
+
+TREEMAP_DEPTH = 3
+TREEMAP_MAX_DEPTH = 6
+TREEMAP_MAX_CHILDREN = 40
+
+
+def json_scalar_size(value):
+    return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+def json_pretty_size(value, level=0):
+    """Размер value в байтах в json.dump(indent=2) на уровне вложенности level."""
+    if isinstance(value, dict):
+        if not value:
+            return 2
+        indent = 2 * (level + 1)
+        size = 2 + 2 * (len(value) - 1) + 2 + 2 * level
+        for key, child in value.items():
+            size += indent + json_scalar_size(key) + 2 + json_pretty_size(child, level + 1)
+        return size
+    if isinstance(value, list):
+        if not value:
+            return 2
+        indent = 2 * (level + 1)
+        size = 2 + 2 * (len(value) - 1) + 2 + 2 * level
+        for child in value:
+            size += indent + json_pretty_size(child, level + 1)
+        return size
+    return json_scalar_size(value)
+
+
+def utf16_length(text):
+    return len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+
+def js_number_text(value):
+    """Число так, как его печатает JSON.stringify."""
+    if isinstance(value, int) or value != value or value in (float('inf'), float('-inf')):
+        return json.dumps(value)
+    if value == 0:
+        return '0'
+    sign = '-' if value < 0 else ''
+    # repr даёт те же кратчайшие цифры, что и JS; отличается только запись
+    _, digit_tuple, exponent = Decimal(repr(abs(value))).as_tuple()
+    digits = ''.join(map(str, digit_tuple)).rstrip('0')
+    exponent += len(digit_tuple) - len(digits)
+    digits = digits.lstrip('0')
+    # n - позиция десятичной точки относительно первой значащей цифры
+    n = len(digits) + exponent
+    k = len(digits)
+    if k <= n <= 21:
+        return sign + digits + '0' * (n - k)
+    if 0 < n <= 21:
+        return sign + digits[:n] + '.' + digits[n:]
+    if -6 < n <= 0:
+        return sign + '0.' + '0' * -n + digits
+    rest = '.' + digits[1:] if k > 1 else ''
+    return '%s%s%se%+d' % (sign, digits[0], rest, n - 1)
+
+
+def json_compact_size(value):
+    """Длина JSON.stringify(value) в JS: UTF-16 единицы, числа в формате JS."""
+    if isinstance(value, dict):
+        size = 2 + max(0, len(value) - 1)
+        for key, child in value.items():
+            size += json_compact_size(key) + 1 + json_compact_size(child)
+        return size
+    if isinstance(value, list):
+        return 2 + max(0, len(value) - 1) + sum(map(json_compact_size, value))
+    if isinstance(value, str):
+        return utf16_length(json.dumps(value, ensure_ascii=False))
+    if isinstance(value, float):
+        return len(js_number_text(value))
+    return len(json.dumps(value))
+
+
+def build_project_listing(config):
+    """Список проектов колонками; пути сжаты по общему префиксу с предыдущим.
+
+    prefix[i] - сколько UTF-16 единиц взять из предыдущего пути, suffix[i] -
+    остаток. size совпадает с JSON.stringify(project).length в воркере.
+    """
+    prefix = []
+    suffix = []
+    sizes = []
+    counts = []
+    previous = ''
+    for project_path, project in (config.get('projects') or {}).items():
+        common = os.path.commonprefix([previous, project_path])
+        prefix.append(utf16_length(common))
+        suffix.append(project_path[len(common):])
+        history = project.get('history') if isinstance(project, dict) else None
+        counts.append(len(history) if isinstance(history, list) else 0)
+        sizes.append(json_compact_size(project))
+        previous = project_path
+    return {
+        'count': len(sizes),
+        'paths': {'prefix': prefix, 'suffix': suffix},
+        'historyCount': counts,
+        'size': sizes
+    }
+
+
+def decode_listing_paths(listing):
+    paths = []
+    previous = ''
+    for prefix, suffix in zip(listing['paths']['prefix'], listing['paths']['suffix']):
+        # prefix в UTF-16 единицах: режем по ним же
+        previous = previous.encode('utf-16-le', 'surrogatepass')[:2 * prefix].decode('utf-16-le', 'surrogatepass') + suffix
+        paths.append(previous)
+    return paths
+
+
+TOP_VALUES_K = 20
+TOP_VALUES_MAX_K = 1000
+
+
+def top_json_values(config, k=TOP_VALUES_K, types=('string', 'array')):
+    """K самых больших строк и/или массивов за один проход с min-heap на K элементов."""
+    want_strings = 'string' in types
+    want_arrays = 'array' in types
+    heap = []
+    path = []
+    counter = count()
+
+    def offer(size, kind, length):
+        if len(heap) < k:
+            heapq.heappush(heap, (size, next(counter), tuple(path), kind, length))
+        elif size > heap[0][0]:
+            heapq.heapreplace(heap, (size, next(counter), tuple(path), kind, length))
+
+    def walk(value, level):
+        if isinstance(value, dict):
+            if not value:
+                return 2
+            indent = 2 * (level + 1)
+            size = 2 + 2 * (len(value) - 1) + 2 + 2 * level
+            for key, child in value.items():
+                path.append(key)
+                size += indent + json_scalar_size(key) + 2 + walk(child, level + 1)
+                path.pop()
+            return size
+        if isinstance(value, list):
+            size = 2
+            if value:
+                indent = 2 * (level + 1)
+                size += 2 * (len(value) - 1) + 2 + 2 * level
+                for i, child in enumerate(value):
+                    path.append(i)
+                    size += indent + walk(child, level + 1)
+                    path.pop()
+            if want_arrays:
+                offer(size, 'array', len(value))
+            return size
+        size = json_scalar_size(value)
+        if want_strings and isinstance(value, str):
+            offer(size, 'string', len(value))
+        return size
+
+    if k > 0:
+        walk(config, 0)
+    return [
+        {'path': list(p), 'size': size, 'type': kind, 'length': length}
+        for size, _, p, kind, length in sorted(heap, reverse=True)
+    ]
+
+
+class ByteAttribution:
+    """Размер в байтах каждого поддерева конфига так, как его пишет write_config.
+
+    Считается за один проход в формате json.dump(indent=2, ensure_ascii=False),
+    поэтому размер корня совпадает с размером сохранённого файла. Узлы дерева
+    строятся до заданной глубины, глубже считаются только размеры. Попутно
+    собираются категории: вставленный контент истории, остальная история,
+    настройки проектов, MCP серверы.
+    """
+
+    def __init__(self, config, path=(), depth=TREEMAP_DEPTH):
+        self.path = tuple(path)
+        self.categories = {'pastedContents': 0, 'history': 0, 'projects': 0, 'mcpServers': 0}
+        node = resolve_json_path(config, self.path)
+        self.total, self.tree = self._measure(node, self.path, len(self.path), depth + len(self.path))
+
+    def _measure(self, value, path, level, depth):
+        build = len(path) <= depth
+        build_children = len(path) < depth
+        # Категории нужны только на путях вида projects/*/history/*/pastedContents
+        track = len(path) <= 5 and (len(path) == 0 or path[0] in ('projects', 'mcpServers'))
+
+        if isinstance(value, dict):
+            items = value.items()
+        elif isinstance(value, list):
+            items = enumerate(value)
+        else:
+            size = json_scalar_size(value)
+            self._categorize(path, size)
+            return size, ({'name': path[-1] if path else None, 'size': size} if build else None)
+
+        indent = 2 * (level + 1)
+        is_dict = isinstance(value, dict)
+        size = 2
+        count = 0
+        children = [] if build_children else None
+        for key, child in items:
+            if build_children or track:
+                child_size, child_node = self._measure(child, path + (key,), level + 1, depth)
+            else:
+                child_size, child_node = json_pretty_size(child, level + 1), None
+            size += indent + child_size
+            if is_dict:
+                size += json_scalar_size(key) + 2
+            if children is not None:
+                child_node['name'] = key
+                children.append(child_node)
+            count += 1
+
+        if count:
+            size += 2 * (count - 1) + 2 + 2 * level
+        self._categorize(path, size)
+
+        if not build:
+            return size, None
+        node = {'name': path[-1] if path else None, 'size': size}
+        if children is not None:
+            node['children'] = self._top_children(children)
+        else:
+            node['container'] = True
+        return size, node
+
+    def _categorize(self, path, size):
+        if len(path) == 2 and path[0] == 'projects':
+            self.categories['projects'] += size
+        elif len(path) == 3 and path[0] == 'projects' and path[2] == 'history':
+            self.categories['history'] += size
+        elif len(path) == 5 and path[0] == 'projects' and path[2] == 'history' and path[4] == 'pastedContents':
+            self.categories['pastedContents'] += size
+        elif len(path) == 1 and path[0] == 'mcpServers':
+            self.categories['mcpServers'] += size
+
+    @staticmethod
+    def _top_children(children):
+        children.sort(key=lambda c: c['size'], reverse=True)
+        if len(children) <= TREEMAP_MAX_CHILDREN:
+            return children
+        rest = children[TREEMAP_MAX_CHILDREN:]
+        return children[:TREEMAP_MAX_CHILDREN] + [{
+            'name': f'… ещё {len(rest)}',
+            'size': sum(c['size'] for c in rest),
+            'rest': True
+        }]
+
+    def to_json(self):
+        c = self.categories
+        return {
+            'path': list(self.path),
+            'total': self.total,
+            'tree': self.tree,
+            'categories': None if self.path else {
+                'pastedContents': c['pastedContents'],
+                'historyOther': c['history'] - c['pastedContents'],
+                'projectSettings': c['projects'] - c['history'],
+                'mcpServers': c['mcpServers'],
+                'other': self.total - c['projects'] - c['mcpServers']
+            }
+        }
+
+
+MCP_PROBE_WORKERS = 4
+MCP_PROBE_TIMEOUT = 10.0
+MCP_PROBE_HISTORY = 500
+# Журнал проверок лежит в каталоге данных своего конфига
+MCP_PROBE_LOG_NAME = 'mcp-probes.jsonl'
+MCP_PROTOCOL_VERSION = '2024-11-05'
+
+
+def probe_mcp_server(name, server, timeout=MCP_PROBE_TIMEOUT):
+    """Запускает stdio MCP сервер и замеряет время от spawn до ответа на initialize."""
+    result = {'name': name, 'ok': False, 'latencyMs': None}
+
+    if server.get('type', 'stdio') != 'stdio' or not server.get('command'):
+        result['status'] = 'skipped'
+        result['error'] = 'Проверяются только stdio серверы'
+        return result
+
+    env = dict(os.environ)
+    env.update({k: str(v) for k, v in (server.get('env') or {}).items()})
+    request = {
+        'jsonrpc': '2.0',
+        'id': 1,
+        'method': 'initialize',
+        'params': {
+            'protocolVersion': MCP_PROTOCOL_VERSION,
+            'capabilities': {},
+            'clientInfo': {'name': 'claude-config-editor', 'version': '1.0'}
+        }
+    }
+
+    started = time.perf_counter()
+    try:
+        proc = subprocess.Popen(
+            [server['command'], *[str(a) for a in server.get('args') or []]],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            cwd=server.get('cwd') or None
+        )
+    except OSError as e:
+        result['status'] = 'spawn-failed'
+        result['error'] = str(e)
+        return result
+
+    # Чтение в отдельном потоке: readline() на пайпе не умеет таймаут
+    lines = queue.Queue()
+
+    def read_stdout():
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=read_stdout, daemon=True).start()
+
+    try:
+        proc.stdin.write((json.dumps(request) + '\n').encode('utf-8'))
+        proc.stdin.flush()
+
+        deadline = started + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                result['status'] = 'timeout'
+                result['error'] = f'Нет ответа на initialize за {timeout:g} с'
+                break
+            try:
+                line = lines.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if line is None:
+                result['status'] = 'exited'
+                result['error'] = f'Процесс завершился с кодом {proc.wait()}'
+                break
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(message, dict) or message.get('id') != 1:
+                continue
+
+            result['latencyMs'] = round((time.perf_counter() - started) * 1000, 1)
+            if 'error' in message:
+                result['status'] = 'error'
+                result['error'] = str(message['error'].get('message', message['error']))
+            else:
+                info = message.get('result') or {}
+                result['ok'] = True
+                result['status'] = 'ready'
+                result['serverInfo'] = info.get('serverInfo')
+                result['protocolVersion'] = info.get('protocolVersion')
+            break
+    except OSError as e:
+        result['status'] = 'io-error'
+        result['error'] = str(e)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        for stream in (proc.stdin, proc.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    return result
+
+
+def probe_mcp_servers(servers, log_path, timeout=MCP_PROBE_TIMEOUT, workers=MCP_PROBE_WORKERS):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(probe_mcp_server, name, server, timeout)
+                   for name, server in servers.items() if isinstance(server, dict)]
+        results = [f.result() for f in futures]
+
+    record_mcp_probe(log_path, results)
+    return results
+
+
+def record_mcp_probe(log_path, results):
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    entry = {'time': time.time(), 'results': results}
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    runs = read_mcp_probe_history(log_path)
+    if len(runs) > MCP_PROBE_HISTORY:
+        with open(log_path, 'w', encoding='utf-8') as f:
+            for run in runs[-MCP_PROBE_HISTORY:]:
+                f.write(json.dumps(run, ensure_ascii=False) + '\n')
+
+
+def read_mcp_probe_history(log_path, limit=None):
+    if not log_path.exists():
+        return []
+    runs = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs[-limit:] if limit else runs
+
+
+# Имена в каталоге данных конфига (STATE_DIR или STATE_DIR/configs/<имя>)
+ARCHIVE_DIR_NAME = 'archive'
+
+
+def write_config(new_config, path=CLAUDE_CONFIG_PATH):
+    """Бэкап текущего файла и запись нового конфига в формате indent=2.
+
+    Конфиг пишется во временный файл рядом и подменяется через os.replace:
+    Claude Code, читающий файл в этот момент, не увидит его обрезанным.
+    """
+    backup_path = path.with_suffix('.json.backup')
+    tmp = path.with_suffix('.json.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(JSON_BACKEND.dumps_pretty(new_config))
+    if path.exists():
+        shutil.copy2(path, backup_path)
+        shutil.copymode(path, tmp)
+    os.replace(tmp, path)
+    return backup_path
+
+
+SAVE_COALESCE_SECONDS = 0.3
+
+
+class ConfigConflict(Exception):
+    """Файл изменился на диске после версии, поверх которой сделаны правки."""
+
+    def __init__(self, version):
+        super().__init__(f'Файл изменён на диске (версия {version})')
+        self.version = version
+
+
+class ConfigWriter:
+    """Единственный писатель конфига: все записи идут через одну очередь.
+
+    Задачи, пришедшие в пределах окна SAVE_COALESCE_SECONDS от первой,
+    выполняются по порядку. Подряд идущие update применяются к одной копии
+    файла и записываются одним бэкапом и одной записью; replace и update
+    с ожидаемой версией всегда пишутся отдельно. Future каждого вызова завершается только после записи
+    его правки: {'version', 'backup', 'coalesced', 'result'}.
+    """
+
+    def __init__(self, document, merkle, window=SAVE_COALESCE_SECONDS):
+        self.document = document
+        self.merkle = merkle
+        self.window = window
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def replace(self, new_config, expected=None):
+        """Полная замена конфига (сохранение из браузера).
+
+        expected - версия файла, поверх которой сделаны правки: если файл
+        с тех пор изменился, Future завершается ConfigConflict.
+        """
+        return self._submit('replace', (new_config, expected))
+
+    def update(self, change, expected=None):
+        """change(config) правит копию файла на месте и возвращает (changed, result).
+
+        expected - как у replace: версия проверяется прямо перед записью.
+        """
+        return self._submit('update', (change, expected))
+
+    def _submit(self, kind, payload):
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put((kind, payload, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        # Замена записывается отдельно: правки перед ней не должны в ней
+        # потеряться, а правки после неё применяются к перечитанному файлу,
+        # а не к дереву вызывающего (оно общее с кэшем разбора и сессиями)
+        updates = []
+        for job in batch:
+            if job[0] == 'replace' or job[1][1] is not None:
+                if updates:
+                    self._write(updates)
+                    updates = []
+                self._write([job])
+            else:
+                updates.append(job)
+        if updates:
+            self._write(updates)
+
+    def _write(self, jobs):
+        config = None
+        changed = False
+        done = []
+        for kind, (payload, expected), future in jobs:
+            if kind == 'replace':
+                config = payload
+                changed = True
+                done.append((future, None))
+                continue
+            try:
+                if config is None:
+                    config = self.document.load_copy()
+                modified, result = payload(config)
+                changed = changed or modified
+                done.append((future, result))
+            except Exception as e:
+                future.set_exception(e)
+
+        # Задача с ожидаемой версией всегда одна в сегменте
+        if changed and expected is not None and self.document.version_tag() != expected:
+            conflict = ConfigConflict(self.document.version_tag())
+            for future, _ in done:
+                future.set_exception(conflict)
+            return
+
+        try:
+            backup_path = write_config(config, self.document.path) if changed else None
+            version = self.document.version_tag()
+        except Exception as e:
+            for future, _ in done:
+                future.set_exception(e)
+            return
+
+        if changed:
+            self.writes += 1
+            self.merkle.remember_async(version, config)
+        for future, result in done:
+            future.set_result({
+                'version': version,
+                'backup': str(backup_path) if backup_path else None,
+                'coalesced': len(jobs),
+                'result': result
+            })
+
+
+class ProjectArchive:
+    """Холодный архив истории: по одному .json.xz на проект и общий manifest.json.
+
+    Архивируются проекты целиком или только старые записи history. Запись
+    архива проекта: {'path', 'project': настройки без history или None,
+    'history': [...]}; history в архиве старше той, что осталась в конфиге,
+    поэтому при восстановлении она добавляется в конец.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / 'manifest.json'
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_name(project_path):
+        digest = hashlib.sha1(project_path.encode('utf-8')).hexdigest()[:16]
+        name = re.sub(r'[^A-Za-z0-9._-]+', '_', Path(project_path).name)[:40] or 'project'
+        return f'{name}-{digest}.json.xz'
+
+    def manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        tmp = self.manifest_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def _read(self, project_path):
+        try:
+            with lzma.open(self.directory / self.file_name(project_path), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, project_path, data):
+        path = self.directory / self.file_name(project_path)
+        tmp = path.with_suffix('.tmp')
+        text = json.dumps(data, ensure_ascii=False)
+        with lzma.open(tmp, 'wt', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+        return len(text.encode('utf-8')), path.stat().st_size
+
+    def archive(self, config, project_paths, keep_history=None):
+        """Переносит проекты (или history старше keep_history записей) из config в архив."""
+        projects = config.get('projects') or {}
+        archived = []
+
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            manifest = self.manifest()
+
+            for project_path in project_paths:
+                project = projects.get(project_path)
+                if not isinstance(project, dict):
+                    continue
+                history = project.get('history') if isinstance(project.get('history'), list) else []
+
+                if keep_history is None:
+                    moved = history
+                    settings = {k: v for k, v in project.items() if k != 'history'}
+                else:
+                    moved = history[keep_history:]
+                    settings = None
+                    if not moved:
+                        continue
+
+                data = self._read(project_path) or {'path': project_path, 'project': None, 'history': []}
+                data['history'] = moved + data['history']
+                if settings is not None:
+                    data['project'] = settings
+                data['archivedAt'] = time.time()
+                size, compressed = self._write(project_path, data)
+
+                if keep_history is None:
+                    del projects[project_path]
+                else:
+                    project['history'] = history[:keep_history]
+
+                manifest[project_path] = {
+                    'file': self.file_name(project_path),
+                    'archivedAt': data['archivedAt'],
+                    'entries': len(data['history']),
+                    'whole': data['project'] is not None,
+                    'size': size,
+                    'compressed': compressed
+                }
+                archived.append(project_path)
+
+            self._write_manifest(manifest)
+        return archived
+
+    def restore(self, config, project_path):
+        """Возвращает проект из архива в config и удаляет его архив."""
+        with self._lock:
+            data = self._read(project_path)
+            if data is None:
+                raise KeyError(project_path)
+
+            projects = config.setdefault('projects', {})
+            project = projects.get(project_path)
+            if not isinstance(project, dict):
+                project = dict(data['project'] or {})
+                projects[project_path] = project
+            if data['history'] or 'history' in project:
+                project['history'] = (project.get('history') or []) + data['history']
+            return data
+
+    def forget(self, project_path):
+        with self._lock:
+            manifest = self.manifest()
+            manifest.pop(project_path, None)
+            self._write_manifest(manifest)
+            try:
+                (self.directory / self.file_name(project_path)).unlink()
+            except FileNotFoundError:
+                pass
+
+
+PROJECT_SCAN_WORKERS = 16
+PROJECT_SCAN_CACHE = STATE_DIR / 'project-scan.json'
+
+
+def stat_project_dir(path):
+    """exists: True/False, None - папку не удалось проверить (нет доступа, том не смонтирован)."""
+    result = {'exists': False, 'mtime': None, 'git': False, 'scannedAt': time.time()}
+    try:
+        st = os.stat(path)
+    except ValueError:
+        return result
+    except OSError as e:
+        if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+            result['exists'] = None
+            result['error'] = e.strerror or str(e)
+        return result
+
+    result['exists'] = stat.S_ISDIR(st.st_mode)
+    result['mtime'] = st.st_mtime
+    result['git'] = os.path.exists(os.path.join(path, '.git'))
+    return result
+
+
+class ProjectScanner:
+    """Фоновая проверка папок проектов: существует ли, когда менялась, git ли это.
+
+    Результаты кэшируются по пути в памяти и на диске, так что после
+    перезапуска таблица сразу получает последние известные данные.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._results = {}
+        self._running = False
+        self._done = 0
+        self._total = 0
+        # Растёт при каждом новом результате: по нему видно, что данные о папках изменились
+        self.revision = 0
+        self._loaded = False
+
+    def _load(self):
+        # Кэш читается при первом обращении, а не при импорте модуля: его повторяют процессы пула разбора
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                self._results = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def start(self, paths):
+        paths = list(paths)
+        with self._lock:
+            self._load()
+            if self._running:
+                return False
+            self._running = True
+            self._done = 0
+            self._total = len(paths)
+
+        threading.Thread(target=self._run, args=(paths,), daemon=True).start()
+        return True
+
+    def _run(self, paths):
+        try:
+            with ThreadPoolExecutor(max_workers=PROJECT_SCAN_WORKERS) as pool:
+                for path, result in zip(paths, pool.map(stat_project_dir, paths)):
+                    with self._lock:
+                        self._results[path] = result
+                        self._done += 1
+                        self.revision += 1
+            self._save()
+        finally:
+            with self._lock:
+                self._running = False
+
+    def _save(self):
+        with self._lock:
+            data = json.dumps(self._results, ensure_ascii=False)
+        STATE_DIR.mkdir(exist_ok=True)
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+
+    def results(self, paths):
+        with self._lock:
+            self._load()
+            return {path: self._results[path] for path in paths if path in self._results}
+
+    def status(self, paths):
+        with self._lock:
+            progress = {'running': self._running, 'done': self._done, 'total': self._total}
+        progress['results'] = self.results(paths)
+        return progress
+
+
+DUPLICATE_GROUPS_LIMIT = 100
+DUPLICATE_COPIES_LIMIT = 20
+HISTORY_ENTRY_LEVEL = 4
+
+
+def history_entry_strings(value, out):
+    if isinstance(value, str):
+        out.append(value)
+    elif isinstance(value, dict):
+        for child in value.values():
+            history_entry_strings(child, out)
+    elif isinstance(value, list):
+        for child in value:
+            history_entry_strings(child, out)
+    return out
+
+
+class HistoryDuplicates:
+    """Группы одинаковых и почти одинаковых записей history во всех проектах.
+
+    Каждая запись хэшируется дважды: точный хэш канонического JSON и хэш
+    нормализованного текста (регистр и пробелы не учитываются). Группировка
+    идёт по второму хэшу через словарь, без попарных сравнений. Новейшей
+    копией считается запись с меньшим индексом (history хранится от новых к
+    старым), а между проектами - запись проекта с более свежей папкой.
+    """
+
+    def __init__(self, config, activity=None):
+        activity = activity or {}
+        groups = {}
+        self.entries = 0
+
+        for project_path, project in (config.get('projects') or {}).items():
+            history = project.get('history') if isinstance(project, dict) else None
+            if not isinstance(history, list):
+                continue
+            mtime = (activity.get(project_path) or {}).get('mtime') or 0
+            for index, entry in enumerate(history):
+                self.entries += 1
+                canonical = json.dumps(entry, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+                text = '\x00'.join(history_entry_strings(entry, []))
+                normalized = ' '.join(text.split()).casefold()
+                near = hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+                exact = hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).digest()
+                size = json_pretty_size(entry, HISTORY_ENTRY_LEVEL) + 2 * HISTORY_ENTRY_LEVEL + 2
+                display = entry.get('display') if isinstance(entry, dict) else None
+                groups.setdefault(near, []).append(((-mtime, index), project_path, index, size, exact, display))
+
+        self.groups = []
+        self.removals = {}
+        self.duplicate_entries = 0
+        self.duplicate_bytes = 0
+
+        for near, copies in groups.items():
+            if len(copies) < 2:
+                continue
+            copies.sort(key=lambda c: c[0])
+            keep, rest = copies[0], copies[1:]
+            wasted = sum(c[3] for c in rest)
+            self.duplicate_entries += len(rest)
+            self.duplicate_bytes += wasted
+            for _, project_path, index, _, _, display in rest:
+                self.removals.setdefault(project_path, []).append([index, display])
+            self.groups.append({
+                'hash': near.hex(),
+                'count': len(copies),
+                'projects': len({c[1] for c in copies}),
+                'exact': len({c[4] for c in copies}) == 1,
+                'duplicateBytes': wasted,
+                'preview': (keep[5] or '')[:RAW_PREVIEW_CHARS] if isinstance(keep[5], str) else '',
+                'keep': {'project': keep[1], 'index': keep[2]},
+                'copies': [{'project': c[1], 'index': c[2]} for c in rest[:DUPLICATE_COPIES_LIMIT]]
+            })
+
+        self.groups.sort(key=lambda g: g['duplicateBytes'], reverse=True)
+
+    def summary(self):
+        return {
+            'entries': self.entries,
+            'groups': len(self.groups),
+            'duplicateEntries': self.duplicate_entries,
+            'duplicateBytes': self.duplicate_bytes,
+            'top': self.groups[:DUPLICATE_GROUPS_LIMIT]
+        }
+
+
+SHADOW_INDEX_NAME = 'index.sqlite'
+SHADOW_SCHEMA_VERSION = '1'
+QUERY_ROWS_LIMIT = 1000
+QUERY_TIMEOUT_SECONDS = 5
+
+SHADOW_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE projects (
+    path TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    digest BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    history_count INTEGER NOT NULL,
+    history_bytes INTEGER NOT NULL,
+    mcp_count INTEGER NOT NULL,
+    settings TEXT NOT NULL,
+    dir_exists INTEGER,
+    dir_mtime REAL,
+    dir_git INTEGER
+);
+CREATE TABLE history (
+    project TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    display TEXT,
+    size INTEGER NOT NULL,
+    pasted_count INTEGER NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (project, position)
+) WITHOUT ROWID;
+CREATE TABLE mcp_servers (
+    scope TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT,
+    command TEXT,
+    url TEXT,
+    definition TEXT NOT NULL,
+    PRIMARY KEY (scope, name)
+) WITHOUT ROWID;
+"""
+
+# Для запросов разрешено только чтение таблиц и вызов функций
+QUERY_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def mcp_server_rows(scope, servers):
+    rows = []
+    for name, server in (servers or {}).items():
+        server = server if isinstance(server, dict) else {}
+        rows.append((
+            scope, name, server.get('type') or ('stdio' if 'command' in server else None),
+            server.get('command'), server.get('url'), JSON_BACKEND.dumps(server).decode('utf-8')
+        ))
+    return rows
+
+
+class ShadowIndex:
+    """SQLite-копия конфига для произвольных запросов: projects, history, mcp_servers.
+
+    Обновляется перед каждым запросом, если файл изменился, и только по
+    изменившимся проектам: для каждого проекта хранится хэш его JSON, он же
+    переживает перезапуск. Проект без истории лежит в projects.settings
+    (JSON, доступен через json_extract), данные о папке - из PROJECT_SCANNER.
+    В mcp_servers scope '' - глобальные серверы, иначе путь проекта.
+    """
+
+    def __init__(self, path, document, scanner):
+        self.path = Path(path)
+        self.document = document
+        self.scanner = scanner
+        self._lock = threading.Lock()
+        self._db = None
+        self._reader = None
+        self._version = None
+        self._scan_revision = None
+
+    def connection(self):
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            try:
+                row = db.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is None or row[0] != SHADOW_SCHEMA_VERSION:
+                db.close()
+                self.path.unlink(missing_ok=True)
+                db = sqlite3.connect(self.path, check_same_thread=False)
+                with db:
+                    db.executescript(SHADOW_SCHEMA)
+                    db.execute("INSERT INTO meta VALUES ('schema', ?)", (SHADOW_SCHEMA_VERSION,))
+            self._db = db
+            row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            self._version = row[0] if row else None
+        return self._db
+
+    def _project_rows(self, path, position, digest, project):
+        project = project if isinstance(project, dict) else {}
+        history = project.get('history') if isinstance(project.get('history'), list) else []
+        history_rows = []
+        for index, entry in enumerate(history):
+            display = entry.get('display') if isinstance(entry, dict) else None
+            pasted = entry.get('pastedContents') if isinstance(entry, dict) else None
+            history_rows.append((
+                path, index, display if isinstance(display, str) else None,
+                json_pretty_size(entry, HISTORY_ENTRY_LEVEL) + 2 * HISTORY_ENTRY_LEVEL + 2,
+                len(pasted) if isinstance(pasted, (dict, list)) else 0,
+                JSON_BACKEND.dumps(entry).decode('utf-8')
+            ))
+        settings = {key: value for key, value in project.items() if key != 'history'}
+        mcp_servers = project.get('mcpServers') if isinstance(project.get('mcpServers'), dict) else {}
+        project_row = (
+            path, position, digest, json_compact_size(project), len(history_rows),
+            sum(row[3] for row in history_rows), len(mcp_servers),
+            JSON_BACKEND.dumps(settings).decode('utf-8')
+        )
+        return project_row, history_rows, mcp_server_rows(path, mcp_servers)
+
+    def refresh(self):
+        """Приводит индекс к текущему файлу; возвращает, сколько проектов пришлось обновить."""
+        with self._lock:
+            started = time.perf_counter()
+            config, version = self.document.snapshot()
+            db = self.connection()
+            scan_revision = self.scanner.revision
+            stats = {'version': version, 'changedProjects': 0, 'removedProjects': 0}
+            if version == self._version and scan_revision == self._scan_revision:
+                stats['elapsedMs'] = round((time.perf_counter() - started) * 1000, 2)
+                return stats
+
+            changed = []
+            if version != self._version:
+                projects = config.get('projects') or {}
+                known = dict(db.execute('SELECT path, digest FROM projects'))
+                positions = []
+                with db:
+                    for position, (path, project) in enumerate(projects.items()):
+                        digest = hashlib.blake2b(JSON_BACKEND.dumps(project), digest_size=16).digest()
+                        if known.pop(path, None) == digest:
+                            positions.append((position, path))
+                            continue
+                        project_row, history_rows, mcp_rows = self._project_rows(path, position, digest, project)
+                        db.execute('DELETE FROM history WHERE project = ?', (path,))
+                        db.execute('DELETE FROM mcp_servers WHERE scope = ?', (path,))
+                        db.execute('INSERT OR REPLACE INTO projects (path, position, digest, size, history_count, '
+                                   'history_bytes, mcp_count, settings) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', project_row)
+                        db.executemany('INSERT INTO history VALUES (?, ?, ?, ?, ?, ?)', history_rows)
+                        db.executemany('INSERT INTO mcp_servers VALUES (?, ?, ?, ?, ?, ?)', mcp_rows)
+                        changed.append(path)
+
+                    removed = [(path,) for path in known]
+                    db.executemany('DELETE FROM projects WHERE path = ?', removed)
+                    db.executemany('DELETE FROM history WHERE project = ?', removed)
+                    db.executemany('DELETE FROM mcp_servers WHERE scope = ?', removed)
+                    # Удаление проекта сдвигает позиции остальных
+                    db.executemany('UPDATE projects SET position = ? WHERE path = ? AND position != ?1', positions)
+                    db.execute("DELETE FROM mcp_servers WHERE scope = ''")
+                    global_servers = config.get('mcpServers') if isinstance(config.get('mcpServers'), dict) else {}
+                    db.executemany('INSERT INTO mcp_servers VALUES (?, ?, ?, ?, ?, ?)', mcp_server_rows('', global_servers))
+                    db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+                stats['changedProjects'] = len(changed)
+                stats['removedProjects'] = len(removed)
+
+            # Данные о папках: для всех проектов, если сканер что-то узнал, иначе только для обновлённых
+            if scan_revision != self._scan_revision:
+                changed = [row[0] for row in db.execute('SELECT path FROM projects')]
+            dirs = self.scanner.results(changed)
+            with db:
+                db.executemany(
+                    'UPDATE projects SET dir_exists = ?, dir_mtime = ?, dir_git = ? WHERE path = ?',
+                    ((info.get('exists'), info.get('mtime'), info.get('git'), path) for path, info in dirs.items())
+                )
+
+            self._version = version
+            self._scan_revision = scan_revision
+            stats['elapsedMs'] = round((time.perf_counter() - started) * 1000, 2)
+            return stats
+
+    @staticmethod
+    def _authorize(action, table, *args):
+        # Табличные функции (json_each) при создании "пишут" в sqlite_master; соединение и так только для чтения
+        if action in QUERY_ALLOWED_ACTIONS or (action == sqlite3.SQLITE_UPDATE and table == 'sqlite_master'):
+            return sqlite3.SQLITE_OK
+        return sqlite3.SQLITE_DENY
+
+    def query(self, sql, params=(), limit=QUERY_ROWS_LIMIT):
+        """Один SELECT по индексу: {columns, rows, truncated, elapsedMs, index}."""
+        index = self.refresh()
+        with self._lock:
+            if self._reader is None:
+                self._reader = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+                self._reader.set_authorizer(self._authorize)
+            deadline = time.monotonic() + QUERY_TIMEOUT_SECONDS
+            self._reader.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+            started = time.perf_counter()
+            cursor = self._reader.execute(sql, params)
+            rows = cursor.fetchmany(limit + 1)
+            columns = [column[0] for column in cursor.description or ()]
+            cursor.close()
+        return {
+            'columns': columns,
+            'rows': [[value.hex() if isinstance(value, bytes) else value for value in row] for row in rows[:limit]],
+            'truncated': len(rows) > limit,
+            'elapsedMs': round((time.perf_counter() - started) * 1000, 2),
+            'index': index
+        }
+
+
+METRICS_NAME = 'metrics.json'
+METRICS_SAMPLE_SECONDS = 300
+METRICS_COLUMNS = ('t', 'size', 'projects', 'historyEntries', 'largestProject')
+# (шаг, сколько хранить, с): замеры как есть 2 дня, максимум за час 60 дней, за сутки - всегда
+METRICS_TIERS = ((0, 2 * 86400), (3600, 60 * 86400), (86400, None))
+METRICS_FORECAST_DAYS = 7
+ALERT_THRESHOLDS = {'size': 5 * 1024 * 1024, 'projects': None, 'historyEntries': None, 'largestProject': None}
+ALERT_WEBHOOK_TIMEOUT = 5
+
+
+class MetricsSeries:
+    """Временной ряд размеров конфига в metrics.json, с прореживанием по ярусам.
+
+    Точка - [t, size, projects, historyEntries, largestProject]. В ярусах с
+    шагом точка за интервал одна и хранит максимум замеров в нём, так что
+    пики не теряются. Старые точки ярусов удаляются по сроку хранения.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.tiers = data.get('tiers') or [[] for _ in METRICS_TIERS]
+        self.largest_path = data.get('largestPath')
+        # Последний отправленный уровень тревоги по каждой метрике
+        self.alerts = data.get('alerts') or {}
+
+    def _save(self):
+        data = json.dumps({'tiers': self.tiers, 'largestPath': self.largest_path, 'alerts': self.alerts},
+                          ensure_ascii=False, separators=(',', ':'))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def add(self, row, largest_path):
+        with self._lock:
+            for (step, keep), points in zip(METRICS_TIERS, self.tiers):
+                if not step:
+                    points.append(list(row))
+                else:
+                    bucket = row[0] // step * step
+                    if points and points[-1][0] == bucket:
+                        points[-1] = [bucket] + [max(a, b) for a, b in zip(points[-1][1:], row[1:])]
+                    else:
+                        points.append([bucket] + list(row[1:]))
+                if keep is not None:
+                    del points[:bisect.bisect_left(points, [row[0] - keep])]
+            self.largest_path = largest_path
+            self._save()
+
+    def set_alert(self, column, level):
+        with self._lock:
+            self.alerts[column] = level
+            self._save()
+
+    def points(self, seconds=None, now=None):
+        """Точки за последние seconds секунд из самого подробного яруса, который их ещё хранит."""
+        now = now or time.time()
+        with self._lock:
+            for (step, keep), points in zip(METRICS_TIERS, self.tiers):
+                if keep is None or (seconds is not None and seconds <= keep):
+                    break
+            start = 0 if seconds is None else bisect.bisect_left(points, [now - seconds])
+            return step, points[start:]
+
+    def forecast(self, now=None):
+        """Рост каждой метрики в сутки по часовым точкам последних METRICS_FORECAST_DAYS дней."""
+        step, points = self.points(METRICS_FORECAST_DAYS * 86400, now)
+        if len(points) < 2 or points[0][0] == points[-1][0]:
+            return {}
+        days = [point[0] / 86400 for point in points]
+        return {
+            column: statistics.linear_regression(days, [point[i] for point in points]).slope
+            for i, column in enumerate(METRICS_COLUMNS) if i
+        }
+
+
+def alert_level(value, threshold, per_day):
+    if threshold is None:
+        return None
+    if value >= threshold:
+        return 'exceeded'
+    if per_day and per_day > 0 and (threshold - value) / per_day <= METRICS_FORECAST_DAYS:
+        return 'forecast'
+    return None
+
+
+def post_json(url, payload, timeout=ALERT_WEBHOOK_TIMEOUT):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status
+
+
+class MetricsSampler:
+    """Замеры конфига (раз в interval секунд, их запускает ConfigRegistry) и тревоги по порогам.
+
+    Файл разбирается только если изменился с прошлого замера, иначе
+    повторяются прежние значения. Тревога уходит POST-запросом на webhook
+    один раз на каждый новый уровень: 'forecast' - при текущем росте порог
+    будет пройден за METRICS_FORECAST_DAYS дней, 'exceeded' - уже пройден.
+    """
+
+    def __init__(self, series, document, interval=METRICS_SAMPLE_SECONDS):
+        self.series = series
+        self.document = document
+        self.interval = interval
+        self.thresholds = dict(ALERT_THRESHOLDS)
+        self.webhook = None
+        self._version = None
+        self._row = None
+        self._largest_path = None
+
+    def sample(self, now=None):
+        now = int(now or time.time())
+        version = self.document.version_tag()
+        if version != self._version or self._row is None:
+            listing, version = self.document.snapshot('project-listing', build_project_listing)
+            sizes = listing['size']
+            largest = max(range(listing['count']), key=sizes.__getitem__, default=None)
+            self._largest_path = None if largest is None else decode_listing_paths(listing)[largest]
+            self._row = [int(version.rsplit('-', 1)[1]), listing['count'], sum(listing['historyCount']),
+                         0 if largest is None else sizes[largest]]
+            self._version = version
+        row = [now] + self._row
+        self.series.add(row, self._largest_path)
+        self.check_alerts(row, now)
+        return row
+
+    def check_alerts(self, row, now=None):
+        forecast = self.series.forecast(now)
+        sent = []
+        for i, column in enumerate(METRICS_COLUMNS):
+            if not i:
+                continue
+            level = alert_level(row[i], self.thresholds.get(column), forecast.get(column))
+            previous = self.series.alerts.get(column)
+            if level == previous or (previous == 'exceeded' and level == 'forecast'):
+                continue
+            if level is None or not self.webhook:
+                self.series.set_alert(column, level)
+                continue
+            payload = {
+                'config': str(self.document.path), 'metric': column, 'level': level,
+                'value': row[i], 'threshold': self.thresholds[column],
+                'perDay': forecast.get(column), 't': row[0]
+            }
+            if column == 'largestProject':
+                payload['project'] = self.series.largest_path
+            try:
+                post_json(self.webhook, payload)
+            except OSError as e:
+                # Не отправилось - уровень не запоминаем, попробуем на следующем замере
+                print(f"⚠️  Webhook {self.webhook}: {e}")
+                continue
+            self.series.set_alert(column, level)
+            sent.append(payload)
+        return sent
+
+
+STARTUP_PARSE_RUNS = 5
+STARTUP_MAX_RUNS = 50
+
+NODE_PARSE_SCRIPT = """
+const fs = require('fs');
+const text = fs.readFileSync(process.argv[1], 'utf8');
+const times = [];
+for (let i = 0; i < Number(process.argv[2]); i++) {
+    const start = process.hrtime.bigint();
+    JSON.parse(text);
+    times.push(Number(process.hrtime.bigint() - start) / 1e6);
+}
+console.log(JSON.stringify(times));
+"""
+
+
+def apply_prune_scenario(config, scenario, duplicates=None):
+    """Конфиг после сценария очистки; исходный config не меняется.
+
+    Сценарий: removeProjects - удалить/архивировать проекты целиком,
+    dedupe - убрать дубликаты истории, keepHistory - оставить N записей.
+    """
+    projects = dict(config.get('projects') or {})
+    for project_path in scenario.get('removeProjects') or []:
+        projects.pop(project_path, None)
+
+    if scenario.get('dedupe') and duplicates is not None:
+        for project_path, removals in duplicates.removals.items():
+            project = projects.get(project_path)
+            if not isinstance(project, dict):
+                continue
+            drop = {index for index, _ in removals}
+            projects[project_path] = {**project, 'history': [
+                entry for i, entry in enumerate(project.get('history') or []) if i not in drop
+            ]}
+
+    keep = scenario.get('keepHistory')
+    if keep is not None:
+        for project_path, project in projects.items():
+            history = project.get('history') if isinstance(project, dict) else None
+            if isinstance(history, list) and len(history) > keep:
+                projects[project_path] = {**project, 'history': history[:keep]}
+
+    result = dict(config)
+    if 'projects' in config:
+        result['projects'] = projects
+    return result
+
+
+def measure_parse_time(text, runs=STARTUP_PARSE_RUNS):
+    """Медиана времени разбора JSON, мс.
+
+    Claude Code - Node.js приложение, поэтому при наличии node замер идёт
+    через JSON.parse; иначе через json.loads как приближение.
+    """
+    node = shutil.which('node')
+    if node:
+        with tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8', delete=False) as f:
+            f.write(text)
+        try:
+            output = subprocess.run(
+                [node, '-e', NODE_PARSE_SCRIPT, f.name, str(runs + 1)],
+                capture_output=True, text=True, check=True, timeout=600
+            ).stdout
+            return statistics.median(json.loads(output)[1:]), 'node'
+        except (OSError, subprocess.SubprocessError, ValueError):
+            pass
+        finally:
+            os.unlink(f.name)
+
+    json.loads(text)
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        json.loads(text)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), 'python'
+
+
+def estimate_startup_impact(config, scenarios, runs=STARTUP_PARSE_RUNS, duplicates=None):
+    text = json.dumps(config, indent=2, ensure_ascii=False)
+    baseline_ms, engine = measure_parse_time(text, runs)
+    baseline_bytes = len(text.encode('utf-8'))
+
+    results = []
+    for scenario in scenarios:
+        pruned = json.dumps(apply_prune_scenario(config, scenario, duplicates), indent=2, ensure_ascii=False)
+        parse_ms, _ = measure_parse_time(pruned, runs)
+        size = len(pruned.encode('utf-8'))
+        results.append({
+            'name': scenario.get('name', ''),
+            'bytes': size,
+            'parseMs': round(parse_ms, 2),
+            'savedBytes': baseline_bytes - size,
+            'savedMs': round(baseline_ms - parse_ms, 2)
+        })
+
+    return {
+        'engine': engine,
+        'runs': runs,
+        'baseline': {'bytes': baseline_bytes, 'parseMs': round(baseline_ms, 2)},
+        'scenarios': results
+    }
+
+
+class ProjectStatsTable:
+    """Колоночная таблица статистики проектов для быстрого «что если».
+
+    Один проход по конфигу раскладывает проекты в параллельные массивы:
+    вклад записи в projects, число и размер history и префиксные суммы
+    размеров записей истории (новые первыми). Любая политика после этого
+    считается по массивам, без сериализации: размер истории из первых N
+    записей - это 8 + 10 * N + prefix[N] байт в формате indent=2.
+    """
+
+    def __init__(self, config):
+        projects = config.get('projects') or {}
+        self.paths = list(projects)
+        self.total_bytes = json_pretty_size(config)
+        self.projects_bytes = json_pretty_size(projects, 1) if isinstance(projects, dict) else 0
+        self.entry_bytes = array('Q')
+        self.history_count = array('L')
+        self.history_bytes = array('Q')
+        self.history_start = array('Q')
+        self.history_prefix = array('Q')
+
+        for project_path, project in projects.items():
+            history = project.get('history') if isinstance(project, dict) else None
+            if not isinstance(history, list):
+                history = []
+            self.entry_bytes.append(4 + json_scalar_size(project_path) + 2 + json_pretty_size(project, 2) + 2)
+            self.history_count.append(len(history))
+            self.history_bytes.append(json_pretty_size(history, 3))
+            self.history_start.append(len(self.history_prefix))
+            running = 0
+            self.history_prefix.append(0)
+            for entry in history:
+                running += json_pretty_size(entry, HISTORY_ENTRY_LEVEL)
+                self.history_prefix.append(running)
+
+        self.by_size = array('L', sorted(range(len(self.paths)), key=self.entry_bytes.__getitem__, reverse=True))
+
+    def history_size(self, i, keep):
+        if keep <= 0:
+            return 2
+        return 8 + 10 * keep + self.history_prefix[self.history_start[i] + keep]
+
+    def select(self, policy, mtimes, now=None):
+        """Проекты, которые политика удаляет (bytearray по индексам), и сколько записей истории оставить.
+
+        Политика - словарь из любых сочетаний keepHistory, inactiveDays,
+        dropMissing и dropTopBySize. Проекты без данных сканирования
+        считаются активными.
+        """
+        now = time.time() if now is None else now
+        dropped = bytearray(len(self.paths))
+
+        top = policy.get('dropTopBySize')
+        if top:
+            for i in self.by_size[:int(top)]:
+                dropped[i] = 1
+
+        days = policy.get('inactiveDays')
+        drop_missing = policy.get('dropMissing') or days is not None
+        if drop_missing:
+            cutoff = now - float(days) * 86400 if days is not None else None
+            for i, mtime in enumerate(mtimes):
+                if mtime < 0 or (cutoff is not None and 0 < mtime < cutoff):
+                    dropped[i] = 1
+
+        keep = policy.get('keepHistory')
+        return dropped, None if keep is None else max(0, int(keep))
+
+    def plan(self, policy, mtimes, now=None):
+        """Пути удаляемых проектов и проектов, у которых обрезается история."""
+        dropped, keep = self.select(policy, mtimes, now)
+        removed = [path for i, path in enumerate(self.paths) if dropped[i]]
+        truncated = [] if keep is None else [
+            path for i, path in enumerate(self.paths) if not dropped[i] and self.history_count[i] > keep
+        ]
+        return removed, truncated, keep
+
+    def simulate(self, policy, mtimes, now=None):
+        """Размер файла и число записей после политики (см. select); конфиг не трогается."""
+        dropped, keep = self.select(policy, mtimes, now)
+        n = len(self.paths)
+        saved = 0
+        entries = 0
+        dropped_entries = 0
+        for i in range(n):
+            count = self.history_count[i]
+            if dropped[i]:
+                saved += self.entry_bytes[i]
+                dropped_entries += count
+            elif keep is not None and count > keep:
+                saved += self.history_bytes[i] - self.history_size(i, keep)
+                entries += keep
+                dropped_entries += count - keep
+            else:
+                entries += count
+
+        dropped_projects = sum(dropped)
+        if n and dropped_projects == n:
+            # пустой projects сериализуется как {}, а не как 4 байта скобок с отступом
+            saved = self.projects_bytes - 2
+        return {
+            'name': policy.get('name', ''),
+            'bytes': self.total_bytes - saved,
+            'savedBytes': saved,
+            'projects': n - dropped_projects,
+            'droppedProjects': dropped_projects,
+            'historyEntries': entries,
+            'droppedEntries': dropped_entries
+        }
+
+
+def project_mtimes(paths):
+    """mtime папок проектов для ProjectStatsTable: -1 - папки нет, 0 - неизвестно (не сканировали или нет доступа)."""
+    activity = PROJECT_SCANNER.results(paths)
+    mtimes = array('d', (
+        (-1.0 if info.get('exists') is False else info.get('mtime') or 0.0) if info else 0.0
+        for info in map(activity.get, paths)
+    ))
+    return mtimes, len(activity)
+
+
+def build_history_duplicates(config):
+    paths = (config.get('projects') or {}).keys()
+    return HistoryDuplicates(config, PROJECT_SCANNER.results(paths))
+
+
+DIFF_CHANGES_LIMIT = 1000
+MERKLE_VERSIONS = 4
+
+
+def merkle_tree(value):
+    """Дерево хэшей поддеревьев: bytes для скаляра, (hash, children) для контейнера.
+
+    children - dict по ключам или list по индексам. Хэш словаря не зависит
+    от порядка ключей, хэш списка - зависит.
+    """
+    if isinstance(value, dict):
+        children = {key: merkle_tree(child) for key, child in value.items()}
+        h = hashlib.blake2b(b'd', digest_size=16)
+        for key in sorted(children):
+            h.update(hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=16).digest())
+            h.update(merkle_digest(children[key]))
+        return h.digest(), children
+    if isinstance(value, list):
+        children = [merkle_tree(child) for child in value]
+        h = hashlib.blake2b(b'l', digest_size=16)
+        for child in children:
+            h.update(merkle_digest(child))
+        return h.digest(), children
+    text = json.dumps(value, ensure_ascii=False)
+    return hashlib.blake2b(b's' + text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def merkle_digest(node):
+    return node if isinstance(node, bytes) else node[0]
+
+
+def merkle_diff(old, new, limit=DIFF_CHANGES_LIMIT):
+    """Изменения между двумя деревьями хэшей: [{'op', 'path'}].
+
+    Спуск идёт только в поддеревья с разными хэшами. Списки сравниваются
+    через общие начало и конец, так что новые записи в начале history дают
+    только added, а не сдвиг всех индексов.
+    """
+    changes = []
+
+    def add(op, path):
+        if len(changes) < limit:
+            changes.append({'op': op, 'path': path})
+
+    def walk(a, b, path):
+        if len(changes) >= limit or merkle_digest(a) == merkle_digest(b):
+            return
+        a_children = None if isinstance(a, bytes) else a[1]
+        b_children = None if isinstance(b, bytes) else b[1]
+        if isinstance(a_children, dict) and isinstance(b_children, dict):
+            for key, child in a_children.items():
+                if key not in b_children:
+                    add('removed', path + [key])
+                else:
+                    walk(child, b_children[key], path + [key])
+            for key in b_children:
+                if key not in a_children:
+                    add('added', path + [key])
+        elif isinstance(a_children, list) and isinstance(b_children, list):
+            start = 0
+            while (start < len(a_children) and start < len(b_children)
+                   and merkle_digest(a_children[start]) == merkle_digest(b_children[start])):
+                start += 1
+            end_a, end_b = len(a_children), len(b_children)
+            while (end_a > start and end_b > start
+                   and merkle_digest(a_children[end_a - 1]) == merkle_digest(b_children[end_b - 1])):
+                end_a -= 1
+                end_b -= 1
+            if end_a - start == end_b - start:
+                for i in range(start, end_a):
+                    walk(a_children[i], b_children[i], path + [i])
+            else:
+                for i in range(start, end_a):
+                    add('removed', path + [i])
+                for i in range(start, end_b):
+                    add('added', path + [i])
+        else:
+            add('changed', path)
+
+    walk(old, new, [])
+    return changes
+
+
+class MerkleHistory:
+    """Деревья хэшей последних версий файла, которые отдавались странице.
+
+    Сам конфиг старой версии не хранится, только хэши: по ним можно понять,
+    что изменилось на диске с момента загрузки страницы.
+    """
+
+    def __init__(self, limit=MERKLE_VERSIONS):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._trees = {}
+
+    def get(self, version):
+        with self._lock:
+            return self._trees.get(version)
+
+    def remember(self, version, config):
+        if self.get(version) is None:
+            self.put(version, merkle_tree(config))
+
+    def remember_async(self, version, config):
+        threading.Thread(target=self.remember, args=(version, config), daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._trees = {}
+
+    def put(self, version, tree):
+        with self._lock:
+            self._trees.pop(version, None)
+            self._trees[version] = tree
+            while len(self._trees) > self.limit:
+                del self._trees[next(iter(self._trees))]
+
+
+VALIDATION_ERRORS_LIMIT = 50
+
+
+class ValidationRecord:
+    """Результат проверки поддерева; хранит сам узел, чтобы узнать его в следующей версии."""
+
+    __slots__ = ('node', 'errors', 'children', 'count')
+
+    def __init__(self, node, errors=(), children=None):
+        self.node = node
+        self.errors = errors
+        self.children = children or {}
+        self.count = len(errors) + sum(child.count for child in self.children.values())
+
+    def collect(self, path, result, limit):
+        for message in self.errors:
+            if len(result) < limit:
+                result.append({'path': path, 'message': message})
+        for key, child in self.children.items():
+            if child.count and len(result) < limit:
+                child.collect(path + [key], result, limit)
+        return result
+
+
+class ScalarSchema:
+    def __init__(self, name, test):
+        self.name = name
+        self.test = test
+
+    def validate(self, value, old):
+        # Скаляры не кэшируются: запись нужна только для ошибки
+        return None if self.test(value) else ValidationRecord(value, (f'ожидается {self.name}',))
+
+
+class ObjectSchema:
+    """Объект с известными полями; values - схема для всех остальных ключей.
+
+    Необязательное известное поле может быть null: Claude Code так пишет
+    незаполненные поля (например, exampleFiles). Поля из not_null null
+    быть не могут.
+    """
+
+    def __init__(self, fields=None, required=(), values=None, not_null=()):
+        self.fields = fields or {}
+        self.required = required
+        self.values = values
+        self.not_null = not_null
+
+    def validate(self, value, old):
+        if old is not None and old.node is value:
+            return old
+        if not isinstance(value, dict):
+            return ValidationRecord(value, ('ожидается объект',))
+
+        errors = tuple(f'нет обязательного поля "{key}"' for key in self.required if key not in value)
+        previous = old.children if old is not None and isinstance(old.node, dict) else {}
+        children = {}
+        for key, child in value.items():
+            if child is None and key in self.fields and key not in self.required and key not in self.not_null:
+                continue
+            schema = self.fields.get(key, self.values)
+            if schema is not None:
+                record = schema.validate(child, previous.get(key))
+                if record is not None:
+                    children[key] = record
+        return ValidationRecord(value, errors, children)
+
+
+class ArraySchema:
+    def __init__(self, items):
+        self.items = items
+
+    def validate(self, value, old):
+        if old is not None and old.node is value:
+            return old
+        if not isinstance(value, list):
+            return ValidationRecord(value, ('ожидается массив',))
+
+        # Элементы сопоставляются по identity: сдвиг индексов (новая запись в начале history)
+        # не заставляет перепроверять старые элементы
+        previous = {}
+        if old is not None and isinstance(old.node, list):
+            previous = {id(record.node): record for record in old.children.values()}
+        children = {}
+        for index, child in enumerate(value):
+            record = self.items.validate(child, previous.get(id(child)))
+            if record is not None:
+                children[index] = record
+        return ValidationRecord(value, (), children)
+
+
+class McpServerSchema:
+    """Сервер MCP: stdio с command или sse/http с url.
+
+    Остальные типы (sse-ide, ws-ide и будущие) не проверяются.
+    """
+
+    def __init__(self, stdio, remote):
+        self.stdio = stdio
+        self.remote = remote
+
+    def validate(self, value, old):
+        if not isinstance(value, dict):
+            return ValidationRecord(value, ('ожидается объект',))
+        server_type = value.get('type') or 'stdio'
+        if server_type == 'stdio':
+            return self.stdio.validate(value, old)
+        if server_type in ('sse', 'http'):
+            return self.remote.validate(value, old)
+        return None
+
+
+STRING = ScalarSchema('строка', lambda v: isinstance(v, str))
+BOOLEAN = ScalarSchema('true/false', lambda v: isinstance(v, bool))
+INTEGER = ScalarSchema('целое число', lambda v: isinstance(v, int) and not isinstance(v, bool))
+NUMBER = ScalarSchema('число', lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+STRING_LIST = ArraySchema(STRING)
+STRING_MAP = ObjectSchema(values=STRING)
+
+MCP_SERVERS_SCHEMA = ObjectSchema(values=McpServerSchema(
+    ObjectSchema({'type': STRING, 'command': STRING, 'args': STRING_LIST, 'env': STRING_MAP}, required=('command',)),
+    ObjectSchema({'type': STRING, 'url': STRING, 'headers': STRING_MAP}, required=('url',))
+))
+
+HISTORY_ENTRY_SCHEMA = ObjectSchema({
+    'display': STRING,
+    'pastedContents': ObjectSchema(values=ObjectSchema({'id': INTEGER, 'type': STRING, 'content': STRING}))
+})
+
+PROJECT_SCHEMA = ObjectSchema({
+    'allowedTools': STRING_LIST,
+    'history': ArraySchema(HISTORY_ENTRY_SCHEMA),
+    'mcpServers': MCP_SERVERS_SCHEMA,
+    'mcpContextUris': STRING_LIST,
+    'enabledMcpjsonServers': STRING_LIST,
+    'disabledMcpjsonServers': STRING_LIST,
+    'exampleFiles': STRING_LIST,
+    'hasTrustDialogAccepted': BOOLEAN,
+    'hasClaudeMdExternalIncludesApproved': BOOLEAN,
+    'hasClaudeMdExternalIncludesWarningShown': BOOLEAN,
+    'dontCrawlDirectory': BOOLEAN,
+    'projectOnboardingSeenCount': INTEGER,
+    'lastCost': NUMBER,
+    'lastDuration': NUMBER,
+    'lastSessionId': STRING
+})
+
+# Известная часть .claude.json; незнакомые ключи не проверяются
+CONFIG_SCHEMA = ObjectSchema({
+    'numStartups': INTEGER,
+    'installMethod': STRING,
+    'autoUpdates': BOOLEAN,
+    'autoCompactEnabled': BOOLEAN,
+    'theme': STRING,
+    'verbose': BOOLEAN,
+    'userID': STRING,
+    'firstStartTime': STRING,
+    'hasCompletedOnboarding': BOOLEAN,
+    'projects': ObjectSchema(values=PROJECT_SCHEMA),
+    'mcpServers': MCP_SERVERS_SCHEMA,
+    'tipsHistory': ObjectSchema(values=INTEGER),
+    'customApiKeyResponses': ObjectSchema({'approved': STRING_LIST, 'rejected': STRING_LIST})
+}, not_null=('projects',))
+
+# Прошлых результатов проверки: по одному на рабочую копию и на версию файла, с которой она начата
+VALIDATION_RECORDS_LIMIT = 16
+
+
+class ConfigValidator:
+    """Проверка конфига по CONFIG_SCHEMA с переиспользованием прошлого результата.
+
+    Дерево ValidationRecord повторяет конфиг и держит ссылки на проверенные
+    узлы. Поддерево, которое осталось тем же объектом (рабочие копии делят
+    неизменённые части), берётся из прошлой проверки без спуска в него.
+    Прошлый результат хранится по ключу: id сессии или версия файла, с
+    которой сессия начата; проверка одной вкладки не сбрасывает кэш другой.
+    """
+
+    def __init__(self, schema=CONFIG_SCHEMA, limit=VALIDATION_RECORDS_LIMIT):
+        self.schema = schema
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._records = {}
+
+    def validate(self, config, key=None, base=None, limit=VALIDATION_ERRORS_LIMIT):
+        """key - под каким ключом запомнить результат; base - ключ, от которого начать, если по key ещё ничего нет."""
+        with self._lock:
+            started = time.perf_counter()
+            record = self.schema.validate(config, self._records.get(key) or self._records.get(base))
+            if key is not None:
+                self._records.pop(key, None)
+                self._records[key] = record
+                while len(self._records) > self.limit:
+                    del self._records[next(iter(self._records))]
+            elapsed = time.perf_counter() - started
+        return {
+            'valid': record.count == 0,
+            'count': record.count,
+            'errors': record.collect([], [], limit),
+            'elapsedUs': round(elapsed * 1e6)
+        }
+
+    def warm(self, config, key):
+        threading.Thread(target=self.validate, args=(config, key), daemon=True).start()
+
+    def forget(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+
+TRUNCATED_MARK = ' … [обрезано]'
+SESSION_LIMIT = 8
+SESSION_MAX_STEPS = 1000
+
+
+class PathCopy:
+    """Правка неизменяемого дерева копированием пути.
+
+    container(path) копирует контейнер по пути и всех его предков (каждый
+    не больше одного раза за правку), остальные поддеревья остаются общими
+    с предыдущей версией. Исходное дерево не меняется.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._owned = set()
+
+    def _own(self, value):
+        if not isinstance(value, (dict, list)):
+            raise TypeError('не контейнер')
+        if id(value) in self._owned:
+            return value
+        copy = dict(value) if isinstance(value, dict) else list(value)
+        self._owned.add(id(copy))
+        return copy
+
+    def container(self, path):
+        self.root = self._own(self.root)
+        node = self.root
+        for key in path:
+            child = self._own(node[key])
+            node[key] = child
+            node = child
+        return node
+
+
+def session_delete_projects(edit, payload):
+    projects = edit.container(['projects'])
+    touched = []
+    for project_path in payload.get('paths') or []:
+        if project_path in projects:
+            del projects[project_path]
+            touched.append(['projects', project_path])
+    return touched, {}
+
+
+def session_set_key(edit, payload):
+    key = payload['key']
+    root = edit.container([])
+    # value отсутствует, если в браузере он undefined: ключ удаляется
+    if 'value' in payload:
+        root[key] = payload['value']
+    else:
+        root.pop(key, None)
+    return [[key]], {}
+
+
+def session_edit_path(edit, payload):
+    path = payload.get('path') or []
+    if not path or (path[0] == 'projects' and len(path) < 3):
+        raise ValueError('Проекты целиком удаляются на вкладке проектов')
+    try:
+        parent = edit.container(path[:-1])
+        key = path[-1]
+        value = parent[key]
+    except (KeyError, IndexError, TypeError):
+        raise ValueError('Значение не найдено: конфиг уже изменён')
+
+    if payload.get('action') == 'delete':
+        del parent[key]
+        # после удаления из массива индексы сдвигаются: отдаём массив целиком
+        return [path[:-1] if isinstance(parent, list) else path], {}
+
+    keep = int(payload.get('keep', 0))
+    if isinstance(value, str):
+        if len(value) > keep:
+            parent[key] = value[:keep] + TRUNCATED_MARK
+    elif isinstance(value, list):
+        parent[key] = value[:keep]
+    else:
+        raise ValueError('Обрезать можно только строку или массив')
+    return [path], {}
+
+
+def session_remove_history_entries(edit, payload):
+    # Запись удаляется, только если её display совпадает с ожидаемым
+    removed = 0
+    skipped = 0
+    touched = []
+    for project_path, entries in (payload.get('removals') or {}).items():
+        project = (edit.root.get('projects') or {}).get(project_path)
+        history = project.get('history') if isinstance(project, dict) else None
+        if not isinstance(history, list):
+            skipped += len(entries)
+            continue
+        drop = set()
+        for index, display in entries:
+            entry = history[index] if 0 <= index < len(history) else None
+            if entry and (entry.get('display') if isinstance(entry, dict) else None) == display:
+                drop.add(index)
+            else:
+                skipped += 1
+        if not drop:
+            continue
+        edit.container(['projects', project_path])['history'] = [
+            entry for i, entry in enumerate(history) if i not in drop
+        ]
+        removed += len(drop)
+        touched.append(['projects', project_path, 'history'])
+    return touched, {'removed': removed, 'skipped': skipped}
+
+
+SESSION_OPS = {
+    'deleteProjects': session_delete_projects,
+    'setKey': session_set_key,
+    'editPath': session_edit_path,
+    'removeHistoryEntries': session_remove_history_entries
+}
+
+
+class WorkingCopy:
+    """Рабочая копия конфига одной вкладки браузера с undo/redo.
+
+    Каждый шаг - корень новой версии дерева и пути, которые он затронул.
+    Версии делят неизменённые поддеревья, поэтому шаг стоит столько,
+    сколько контейнеров на пути к правке. Браузер получает не конфиг
+    целиком, а патчи по затронутым путям.
+    """
+
+    def __init__(self, config, version, writer):
+        self.version = version
+        self.writer = writer
+        self.steps = [(config, [])]
+        self.position = 0
+        self.saved = 0
+        self.lock = threading.Lock()
+        self.touched_at = time.time()
+
+    @property
+    def current(self):
+        return self.steps[self.position][0]
+
+    def state(self):
+        return {
+            'position': self.position,
+            'steps': len(self.steps) - 1,
+            'dirty': self.position != self.saved,
+            'canUndo': self.position > 0,
+            'canRedo': self.position < len(self.steps) - 1
+        }
+
+    def patches(self, paths):
+        result = []
+        seen = set()
+        for path in paths:
+            marker = json.dumps(path)
+            if marker in seen:
+                continue
+            seen.add(marker)
+            try:
+                result.append({'path': path, 'value': resolve_json_path(self.current, path)})
+            except (KeyError, IndexError, ValueError):
+                result.append({'path': path, 'deleted': True})
+        return result
+
+    def edit(self, op, payload):
+        if op not in SESSION_OPS:
+            raise ValueError(f'Неизвестная правка: {op}')
+        edit = PathCopy(self.current)
+        touched, result = SESSION_OPS[op](edit, payload)
+
+        del self.steps[self.position + 1:]
+        if self.saved > self.position:
+            self.saved = -1
+        self.steps.append((edit.root, touched))
+        self.position += 1
+        if len(self.steps) > SESSION_MAX_STEPS + 1:
+            del self.steps[0]
+            self.position -= 1
+            self.saved -= 1
+        return self.patches(touched), result
+
+    def undo(self):
+        if self.position == 0:
+            return []
+        touched = self.steps[self.position][1]
+        self.position -= 1
+        return self.patches(touched)
+
+    def redo(self):
+        if self.position == len(self.steps) - 1:
+            return []
+        self.position += 1
+        return self.patches(self.steps[self.position][1])
+
+    def commit(self, base=None):
+        """Записывает копию, если файл не менялся с версии base (по умолчанию - версии копии)."""
+        written = self.writer.replace(self.current, base or self.version).result()
+        self.saved = self.position
+        self.version = written['version']
+        return written
+
+
+class WorkingCopies:
+    """Рабочие копии по id сессии, не больше SESSION_LIMIT.
+
+    Сверх лимита вытесняется самая давняя копия без несохранённых правок;
+    если правки есть во всех, новая сессия не создаётся.
+    """
+
+    def __init__(self, document, validator, writer, limit=SESSION_LIMIT):
+        self.document = document
+        self.validator = validator
+        self.writer = writer
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._copies = {}
+
+    def create(self):
+        evicted = []
+        with self._lock:
+            while len(self._copies) >= self.limit:
+                clean = [s for s, copy in self._copies.items() if copy.position == copy.saved]
+                if not clean:
+                    raise ValueError(f'Открыто {len(self._copies)} вкладок с несохранёнными правками: '
+                                     'сохраните или закройте одну из них')
+                oldest = min(clean, key=lambda key: self._copies[key].touched_at)
+                del self._copies[oldest]
+                evicted.append(oldest)
+        for session in evicted:
+            self.validator.forget(session)
+
+        config, version = self.document.snapshot()
+        # Первая полная проверка - сразу, чтобы при сохранении проверялись только правки
+        self.validator.warm(config, version)
+        session = os.urandom(8).hex()
+        with self._lock:
+            self._copies[session] = WorkingCopy(config, version, self.writer)
+        return session, version
+
+    def get(self, session):
+        with self._lock:
+            copy = self._copies.get(session)
+        if copy is None:
+            raise KeyError(session)
+        copy.touched_at = time.time()
+        return copy
+
+    def close(self, session):
+        with self._lock:
+            self._copies.pop(session, None)
+        self.validator.forget(session)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._copies)
+
+    def dirty(self):
+        with self._lock:
+            return any(copy.position != copy.saved for copy in self._copies.values())
+
+    def drop_clean(self):
+        """Закрывает копии без несохранённых правок; они держат дерево своей версии файла."""
+        with self._lock:
+            for session in [s for s, copy in self._copies.items() if copy.position == copy.saved]:
+                del self._copies[session]
+                self.validator.forget(session)
+
+
+DEFAULT_CONFIG_NAME = 'default'
+# Имя становится папкой в STATE_DIR/configs: без точек, чтобы не было . и ..
+CONFIG_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]*$')
+CONFIG_MEMORY_BUDGET = 1024 * 1024 * 1024
+# Во сколько раз разобранный конфиг с кэшами больше файла - грубая оценка для бюджета
+CONFIG_MEMORY_FACTOR = 3
+# С конфигом, к которому обращались за это время, работают: он не выгружается
+CONFIG_ACTIVE_SECONDS = 10 * 60
+
+
+class ConfigEntry:
+    """Всё, что редактор держит для одного файла конфига.
+
+    У каждого файла свои разбор и производные данные, бэкап, писатель,
+    рабочие копии, проверка, архив, SQL-индекс и замеры. Данные на диске
+    основного конфига лежат прямо в STATE_DIR, остальных - в STATE_DIR/configs/<имя>.
+    """
+
+    def __init__(self, name, path, state_dir):
+        self.name = name
+        self.path = Path(path)
+        self.state_dir = Path(state_dir)
+        self.doc = ConfigDocument(self.path)
+        self.backup = ConfigDocument(self.path.with_suffix('.json.backup'))
+        self.merkle = MerkleHistory()
+        self.writer = ConfigWriter(self.doc, self.merkle)
+        self.validator = ConfigValidator()
+        self.sessions = WorkingCopies(self.doc, self.validator, self.writer)
+        self.archive = ProjectArchive(state_dir / ARCHIVE_DIR_NAME)
+        self.index = ShadowIndex(state_dir / SHADOW_INDEX_NAME, self.doc, PROJECT_SCANNER)
+        self.metrics = MetricsSampler(MetricsSeries(state_dir / METRICS_NAME), self.doc)
+        self.mcp_log = state_dir / MCP_PROBE_LOG_NAME
+        # AutoCompactor, если включена автоочистка
+        self.compactor = None
+        self.used_at = 0.0
+
+    def memory(self):
+        """Оценка памяти под разобранные версии файла и его бэкапа."""
+        return (self.doc.loaded_size + self.backup.loaded_size) * CONFIG_MEMORY_FACTOR
+
+    def unload(self):
+        """Выгружает разбор; False, если конфиг сейчас разбирается или читается."""
+        if not self.doc.unload():
+            return False
+        self.sessions.drop_clean()
+        self.backup.unload()
+        self.validator.reset()
+        self.merkle.clear()
+        return True
+
+    def status(self):
+        return {
+            'name': self.name,
+            'path': str(self.path),
+            'exists': self.path.exists(),
+            'loaded': self.doc.loaded_size > 0,
+            'memory': self.memory(),
+            'sessions': len(self.sessions),
+            'usedAt': self.used_at or None
+        }
+
+
+class ConfigRegistry:
+    """Именованные файлы конфигов с общим бюджетом памяти на их разбор.
+
+    Место освобождается только перед разбором новой версии файла: давно
+    не использовавшиеся конфиги выгружаются (остаются пути и данные на
+    диске) и при следующем обращении разбираются заново. Конфиг, с которым
+    работали последние CONFIG_ACTIVE_SECONDS, или с несохранёнными правками
+    не выгружается, даже если бюджет превышен.
+    """
+
+    def __init__(self, budget=CONFIG_MEMORY_BUDGET):
+        self.budget = budget
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def register(self, name, path):
+        if not CONFIG_NAME_PATTERN.match(name):
+            raise ValueError(f'Недопустимое имя конфига: {name} (латиница, цифры, _ и -, первый символ - буква или цифра)')
+        state_dir = STATE_DIR if name == DEFAULT_CONFIG_NAME else STATE_DIR / 'configs' / name
+        with self._lock:
+            if name in self._entries:
+                raise ValueError(f'Конфиг {name} уже зарегистрирован')
+            entry = self._entries[name] = ConfigEntry(name, Path(path).expanduser(), state_dir)
+        entry.doc.before_load = entry.backup.before_load = (
+            lambda document, size: self._make_room(entry, document, size))
+        return entry
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    def get(self, name=None):
+        """Конфиг по имени (без имени - основной или первый); отмечается как недавно использованный.
+
+        Фоновые задачи берут конфиги через entries() и used_at не меняют.
+        """
+        with self._lock:
+            if name is None:
+                name = DEFAULT_CONFIG_NAME if DEFAULT_CONFIG_NAME in self._entries else next(iter(self._entries), None)
+            entry = self._entries.get(name)
+            if entry is None:
+                raise KeyError(name)
+            entry.used_at = time.time()
+        return entry
+
+    def _make_room(self, entry, document, size):
+        # Вызывается из document.load() под блокировкой документа, поэтому
+        # занятые документы других конфигов пропускаются (unload не ждёт)
+        with self._lock:
+            others = sorted(
+                (other for other in self._entries.values() if other is not entry and other.memory()),
+                key=lambda other: other.used_at
+            )
+            active = time.time() - CONFIG_ACTIVE_SECONDS
+            total = (entry.memory() + (size - document.loaded_size) * CONFIG_MEMORY_FACTOR
+                     + sum(other.memory() for other in others))
+            for other in others:
+                if total <= self.budget:
+                    break
+                memory = other.memory()
+                if other.used_at > active or other.sessions.dirty() or not other.unload():
+                    continue
+                total -= memory
+                self.evictions += 1
+
+    def status(self):
+        entries = [entry.status() for entry in self.entries()]
+        return {
+            'configs': entries,
+            'budget': self.budget,
+            'used': sum(entry['memory'] for entry in entries),
+            'evictions': self.evictions
+        }
+
+    def _sample(self, interval):
+        while True:
+            for entry in self.entries():
+                try:
+                    entry.metrics.sample()
+                except Exception as e:
+                    print(f"⚠️  Замер {entry.name}: {e}")
+            time.sleep(interval)
+
+    def start_sampling(self, interval=METRICS_SAMPLE_SECONDS):
+        threading.Thread(target=self._sample, args=(interval,), daemon=True).start()
+
+
+COMPACT_POLL_SECONDS = 30
+COMPACT_QUIET_SECONDS = 120
+COMPACT_MIN_INTERVAL = 6 * 3600
+COMPACT_SCAN_TIMEOUT = 120
+COMPACT_LOG_NAME = 'compactions.jsonl'
+COMPACT_LOG_LIMIT = 20
+COMPACT_POLICY_KEYS = {'name', 'keepHistory', 'inactiveDays', 'dropMissing', 'dropTopBySize', 'archive'}
+# Без dropMissing: демон работает без присмотра, а папка может быть временно недоступна
+DEFAULT_COMPACT_POLICY = {'name': 'auto', 'keepHistory': 100, 'archive': True}
+
+
+def parse_compact_policy(text):
+    """Политика автоочистки из JSON или @файла: ключи политик ProjectStatsTable и archive."""
+    if text is None:
+        return dict(DEFAULT_COMPACT_POLICY)
+    if text.startswith('@'):
+        with open(text[1:], 'r', encoding='utf-8') as f:
+            text = f.read()
+    policy = json.loads(text)
+    if not isinstance(policy, dict):
+        raise ValueError('Политика должна быть объектом')
+    unknown = set(policy) - COMPACT_POLICY_KEYS
+    if unknown:
+        raise ValueError(f'Неизвестные ключи политики: {", ".join(sorted(unknown))}')
+    return policy
+
+
+class AutoCompactor:
+    """Автоочистка одного конфига по политике, когда он перерос пороги.
+
+    Очистка начинается, только если файл не менялся COMPACT_QUIET_SECONDS
+    (Claude Code пишет его при каждом запросе) и с прошлой очистки прошло
+    min_interval. План строится по ProjectStatsTable, правка идёт через
+    ConfigWriter; если файл успел измениться между планом и записью, она
+    отменяется до следующей проверки. Удалённое уходит в архив после
+    записи, если в политике не указано archive: false. Каждая очистка пишется в
+    compactions.jsonl рядом с остальными данными конфига.
+    """
+
+    def __init__(self, entry, policy, thresholds, quiet=COMPACT_QUIET_SECONDS, min_interval=COMPACT_MIN_INTERVAL):
+        self.entry = entry
+        self.policy = policy
+        self.thresholds = thresholds
+        self.quiet = quiet
+        self.min_interval = min_interval
+        self.log_path = entry.state_dir / COMPACT_LOG_NAME
+        self.state = 'idle'
+        runs = self.runs()
+        self.last_run = runs[-1]['t'] if runs else 0.0
+
+    def runs(self, limit=None):
+        if not self.log_path.exists():
+            return []
+        runs = []
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    continue
+        return runs[-limit:] if limit else runs
+
+    def _log(self, run):
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(run, ensure_ascii=False) + '\n')
+
+    def reasons(self):
+        """Какие пороги превышены сейчас; пустой список - очистка не нужна."""
+        reasons = []
+        size = self.entry.path.stat().st_size
+        if self.thresholds.get('size') is not None and size >= self.thresholds['size']:
+            reasons.append(f'size {size} >= {self.thresholds["size"]}')
+        if self.thresholds.get('historyEntries') is not None or self.thresholds.get('projects') is not None:
+            listing, _ = self.entry.doc.snapshot('project-listing', build_project_listing)
+            entries = sum(listing['historyCount'])
+            if self.thresholds.get('historyEntries') is not None and entries >= self.thresholds['historyEntries']:
+                reasons.append(f'historyEntries {entries} >= {self.thresholds["historyEntries"]}')
+            if self.thresholds.get('projects') is not None and listing['count'] >= self.thresholds['projects']:
+                reasons.append(f'projects {listing["count"]} >= {self.thresholds["projects"]}')
+        return reasons
+
+    def check(self, now=None):
+        """Один шаг: проверяет пороги и условия и при необходимости чистит; возвращает запись об очистке."""
+        now = now or time.time()
+        if now - self.last_run < self.min_interval:
+            self.state = 'rate-limited'
+            return None
+        reasons = self.reasons()
+        if not reasons:
+            self.state = 'under-threshold'
+            return None
+        if now - self.entry.path.stat().st_mtime < self.quiet:
+            self.state = 'waiting-quiet'
+            return None
+        return self.compact(reasons, now)
+
+    def _wait_for_scan(self, paths):
+        # Политикам по активности нужны данные о папках всех проектов
+        if len(PROJECT_SCANNER.results(paths)) == len(paths):
+            return
+        PROJECT_SCANNER.start(paths)
+        deadline = time.monotonic() + COMPACT_SCAN_TIMEOUT
+        while PROJECT_SCANNER.status([])['running'] and time.monotonic() < deadline:
+            time.sleep(0.5)
+
+    def compact(self, reasons, now=None):
+        now = now or time.time()
+        table, version = self.entry.doc.snapshot('project-stats', ProjectStatsTable)
+        if self.policy.get('dropMissing') or self.policy.get('inactiveDays') is not None:
+            self._wait_for_scan(table.paths)
+        mtimes, _ = project_mtimes(table.paths)
+        removed, truncated, keep = table.plan(self.policy, mtimes, now)
+        estimate = table.simulate(self.policy, mtimes, now)
+        run = {
+            't': now, 'policy': self.policy.get('name', ''), 'reasons': reasons,
+            'sizeBefore': table.total_bytes, 'droppedProjects': len(removed), 'truncatedProjects': len(truncated),
+            'droppedEntries': estimate['droppedEntries'], 'savedBytes': estimate['savedBytes']
+        }
+        self.last_run = now
+        if not removed and not truncated:
+            self.state = 'nothing-to-do'
+            run['skipped'] = 'политика ничего не убирает'
+            self._log(run)
+            return run
+
+        archive = self.policy.get('archive', True)
+        # Убранное копится здесь и уходит в архив только после записи конфига
+        dropped, cut = {}, {}
+
+        def change(config):
+            projects = config.get('projects') or {}
+            for project_path in removed:
+                project = projects.pop(project_path, None)
+                if isinstance(project, dict):
+                    dropped[project_path] = project
+            for project_path in truncated:
+                project = projects.get(project_path)
+                if isinstance(project, dict) and isinstance(project.get('history'), list):
+                    cut[project_path] = dict(project)
+                    project['history'] = project['history'][:keep]
+            return True, True
+
+        try:
+            written = self.entry.writer.update(change, expected=version).result()
+        except ConfigConflict:
+            # Файл изменился после построения плана: попробуем на следующей проверке
+            self.last_run = 0.0
+            self.state = 'changed-during-compaction'
+            return None
+        run.update({'version': written['version'], 'backup': written['backup'], 'archived': bool(archive),
+                    'sizeAfter': self.entry.path.stat().st_size})
+        if archive:
+            try:
+                self.entry.archive.archive({'projects': dropped}, list(dropped))
+                self.entry.archive.archive({'projects': cut}, list(cut), keep)
+            except OSError as e:
+                # Конфиг уже записан: убранное остаётся только в бэкапе
+                run['archiveError'] = f'{e}; убранное есть в {written["backup"]}'
+        self.state = 'compacted'
+        self._log(run)
+        return run
+
+    def status(self):
+        return {
+            'policy': self.policy,
+            'thresholds': self.thresholds,
+            'quietSeconds': self.quiet,
+            'minInterval': self.min_interval,
+            'state': self.state,
+            'lastRun': self.last_run or None,
+            'runs': self.runs(COMPACT_LOG_LIMIT)
+        }
+
+
+def run_auto_compaction(registry, interval=COMPACT_POLL_SECONDS):
+    while True:
+        for entry in registry.entries():
+            if entry.compactor is None or not entry.path.exists():
+                continue
+            try:
+                run = entry.compactor.check()
+                if run and not run.get('skipped'):
+                    print(f"🧹 {entry.name}: убрано проектов {run['droppedProjects']}, записей истории "
+                          f"{run['droppedEntries']}, {run['sizeBefore'] / 1024 / 1024:.1f} → "
+                          f"{run['sizeAfter'] / 1024 / 1024:.1f} МБ")
+            except Exception as e:
+                print(f"⚠️  Автоочистка {entry.name}: {e}")
+        time.sleep(interval)
+
+
+FLEET_DB_NAME = 'fleet.sqlite'
+FLEET_TOP_PROJECTS = 10
+FLEET_REPORT_SECONDS = 300
+FLEET_PULL_BATCH = 32
+FLEET_TIMEOUT = 10
+FLEET_STALE_SECONDS = 86400
+FLEET_HISTORY_DAYS = 90
+
+FLEET_SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    instance TEXT PRIMARY KEY,
+    -- 'push' или адрес, по которому коллектор опрашивает экземпляр
+    source TEXT NOT NULL,
+    last_seen REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS configs (
+    instance TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT,
+    version TEXT,
+    size INTEGER NOT NULL,
+    projects INTEGER NOT NULL,
+    history_entries INTEGER NOT NULL,
+    growth_per_day REAL,
+    reported_at REAL NOT NULL,
+    PRIMARY KEY (instance, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS samples (
+    instance TEXT NOT NULL,
+    name TEXT NOT NULL,
+    t REAL NOT NULL,
+    size INTEGER NOT NULL,
+    projects INTEGER NOT NULL,
+    history_entries INTEGER NOT NULL,
+    PRIMARY KEY (instance, name, t)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS top_projects (
+    instance TEXT NOT NULL,
+    name TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    history_count INTEGER NOT NULL,
+    PRIMARY KEY (instance, name, rank)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mcp_servers (
+    instance TEXT NOT NULL,
+    name TEXT NOT NULL,
+    server TEXT NOT NULL,
+    type TEXT,
+    command TEXT,
+    url TEXT,
+    PRIMARY KEY (instance, name, server)
+) WITHOUT ROWID;
+"""
+
+
+def fleet_config_summary(entry):
+    """Сводка одного конфига для коллектора: размеры, самые большие проекты, MCP серверы без env."""
+    listing, version = entry.doc.snapshot('project-listing', build_project_listing)
+    config, _ = entry.doc.snapshot()
+    sizes = listing['size']
+    top = heapq.nlargest(FLEET_TOP_PROJECTS, range(listing['count']), key=sizes.__getitem__)
+    paths = decode_listing_paths(listing) if top else []
+    servers = config.get('mcpServers') if isinstance(config.get('mcpServers'), dict) else {}
+    return {
+        'name': entry.name,
+        'path': str(entry.path),
+        'version': version,
+        'size': int(version.rsplit('-', 1)[1]),
+        'projects': listing['count'],
+        'historyEntries': sum(listing['historyCount']),
+        'growthPerDay': entry.metrics.series.forecast().get('size'),
+        'top': [{'path': paths[i], 'size': sizes[i], 'historyCount': listing['historyCount'][i]} for i in top],
+        'mcpServers': [
+            {'name': row[1], 'type': row[2], 'command': row[3], 'url': row[4]}
+            for row in mcp_server_rows('', servers)
+        ]
+    }
+
+
+class FleetAgent:
+    """Сторона экземпляра редактора: сводка всех его конфигов и отправка её коллектору."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.instance = socket.gethostname()
+        # Имя конфига -> (версия файла, сводка): неизменённый файл не разбирается
+        # заново ни при опросе, ни после выгрузки из памяти
+        self._summaries = {}
+
+    def config_summary(self, entry):
+        cached = self._summaries.get(entry.name)
+        if cached is None or cached[0] != entry.doc.version_tag():
+            summary = fleet_config_summary(entry)
+            cached = self._summaries[entry.name] = (summary['version'], summary)
+        return dict(cached[1], growthPerDay=entry.metrics.series.forecast().get('size'))
+
+    def summary(self):
+        configs = []
+        for entry in self.registry.entries():
+            if not entry.path.exists():
+                continue
+            configs.append(self.config_summary(entry))
+        return {'instance': self.instance, 'generatedAt': time.time(), 'configs': configs}
+
+    def _push(self, url, interval):
+        while True:
+            try:
+                post_json(url.rstrip('/') + '/api/fleet/ingest', {'summaries': [self.summary()]}, FLEET_TIMEOUT)
+            except Exception as e:
+                print(f"⚠️  Отправка сводки на {url}: {e}")
+            time.sleep(interval)
+
+    def start_push(self, url, interval=FLEET_REPORT_SECONDS):
+        threading.Thread(target=self._push, args=(url, interval), daemon=True).start()
+
+
+def check_fleet_summary(summary):
+    """Сводка экземпляра с приведёнными типами; ValueError, если она не по формату."""
+    if not isinstance(summary, dict):
+        raise ValueError('сводка должна быть объектом')
+    instance = summary.get('instance')
+    if not isinstance(instance, str) or not instance or not isinstance(summary.get('configs'), list):
+        raise ValueError('сводка должна содержать instance и configs')
+    configs = []
+    for config in summary['configs']:
+        try:
+            if not isinstance(config.get('name'), str):
+                raise KeyError('name')
+            configs.append({
+                'name': config['name'],
+                'path': config.get('path'),
+                'version': config.get('version'),
+                'size': int(config['size']),
+                'projects': int(config['projects']),
+                'historyEntries': int(config['historyEntries']),
+                'growthPerDay': None if config.get('growthPerDay') is None else float(config['growthPerDay']),
+                'top': [{'path': str(project['path']), 'size': int(project['size']),
+                         'historyCount': int(project.get('historyCount') or 0)} for project in config.get('top') or []],
+                'mcpServers': [{'name': str(server['name']), 'type': server.get('type'), 'command': server.get('command'),
+                                'url': server.get('url')} for server in config.get('mcpServers') or []]
+            })
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            name = config.get('name') if isinstance(config, dict) else None
+            problem = f'нет поля {e.args[0]}' if isinstance(e, KeyError) else str(e)
+            raise ValueError(f'конфиг {name!r} в сводке {instance}: {problem}')
+    return {'instance': instance, 'configs': configs}
+
+
+class FleetStore:
+    """SQLite-хранилище сводок коллектора.
+
+    Последняя сводка каждого конфига лежит в configs, top_projects и
+    mcp_servers; при неизменной версии файла обновляется только время
+    отчёта. В samples - точка на каждую новую версию, по ним строится
+    размер парка по дням.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._db:
+            self._db.executescript(FLEET_SCHEMA)
+
+    def ingest(self, summaries, sources, now=None):
+        """Пакет сводок в одной транзакции; возвращает, сколько конфигов изменилось.
+
+        sources[i] - откуда пришла сводка: 'push' или адрес опроса. Сводки не
+        по формату пропускаются и перечисляются в rejected (индекс в пакете
+        и ошибка), остальные записываются.
+        """
+        now = now or time.time()
+        received = changed = 0
+        checked = []
+        rejected = []
+        for index, summary in enumerate(summaries):
+            try:
+                checked.append((check_fleet_summary(summary), sources[index]))
+            except ValueError as e:
+                rejected.append({'index': index, 'error': str(e)})
+        with self._lock, self._db as db:
+            for summary, source in checked:
+                instance = summary['instance']
+                # Экземпляр, который раньше не отвечал, был известен только по адресу
+                db.execute('DELETE FROM instances WHERE instance = ? AND last_seen IS NULL', (source,))
+                db.execute('INSERT OR REPLACE INTO instances VALUES (?, ?, ?, NULL)', (instance, source, now))
+                names = []
+                for config in summary['configs']:
+                    name = config['name']
+                    names.append(name)
+                    received += 1
+                    row = db.execute('SELECT version FROM configs WHERE instance = ? AND name = ?', (instance, name)).fetchone()
+                    if row is not None and row[0] == config.get('version'):
+                        db.execute('UPDATE configs SET reported_at = ?, growth_per_day = ? WHERE instance = ? AND name = ?',
+                                   (now, config.get('growthPerDay'), instance, name))
+                        continue
+                    changed += 1
+                    db.execute('INSERT OR REPLACE INTO configs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                        instance, name, config['path'], config['version'], config['size'],
+                        config['projects'], config['historyEntries'], config['growthPerDay'], now
+                    ))
+                    db.execute('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)', (
+                        instance, name, now, config['size'], config['projects'], config['historyEntries']
+                    ))
+                    db.execute('DELETE FROM top_projects WHERE instance = ? AND name = ?', (instance, name))
+                    db.executemany('INSERT INTO top_projects VALUES (?, ?, ?, ?, ?, ?)', [
+                        (instance, name, rank, project['path'], project['size'], project['historyCount'])
+                        for rank, project in enumerate(config['top'])
+                    ])
+                    db.execute('DELETE FROM mcp_servers WHERE instance = ? AND name = ?', (instance, name))
+                    db.executemany('INSERT OR REPLACE INTO mcp_servers VALUES (?, ?, ?, ?, ?, ?)', [
+                        (instance, name, server['name'], server['type'], server['command'], server['url'])
+                        for server in config['mcpServers']
+                    ])
+                # Конфиг, которого больше нет в сводке экземпляра, удалён из его реестра
+                stale = db.execute('SELECT name FROM configs WHERE instance = ?', (instance,)).fetchall()
+                for (name,) in stale:
+                    if name not in names:
+                        for table in ('configs', 'top_projects', 'mcp_servers'):
+                            db.execute(f'DELETE FROM {table} WHERE instance = ? AND name = ?', (instance, name))
+        return {'summaries': len(checked), 'configs': received, 'changed': changed, 'rejected': rejected}
+
+    def record_error(self, source_url, error):
+        """Ошибка опроса записывается на экземпляр с этим адресом; до первого ответа он известен только по адресу."""
+        with self._lock, self._db as db:
+            updated = db.execute('UPDATE instances SET error = ? WHERE source = ? AND last_seen IS NOT NULL',
+                                 (error, source_url)).rowcount
+            if not updated:
+                db.execute('INSERT OR REPLACE INTO instances VALUES (?, ?, NULL, ?)', (source_url, source_url, error))
+
+    def rollup(self, threshold=None, limit=10, now=None):
+        """Сводка по парку: итоги, перцентили размера, худшие конфиги и проекты, популярные MCP серверы."""
+        threshold = ALERT_THRESHOLDS['size'] if threshold is None else threshold
+        now = now or time.time()
+        with self._lock:
+            db = self._db
+            sizes = [row[0] for row in db.execute('SELECT size FROM configs ORDER BY size')]
+            totals = db.execute('SELECT count(DISTINCT instance), count(*), sum(size), sum(projects), '
+                                'sum(history_entries), sum(growth_per_day) FROM configs').fetchone()
+            top_configs = db.execute(
+                'SELECT instance, name, path, size, projects, history_entries, growth_per_day, reported_at '
+                'FROM configs ORDER BY size DESC LIMIT ?', (limit,)).fetchall()
+            top_projects = db.execute(
+                'SELECT instance, name, path, size, history_count FROM top_projects ORDER BY size DESC LIMIT ?',
+                (limit,)).fetchall()
+            servers = db.execute(
+                'SELECT server, type, coalesce(command, url), count(*), count(DISTINCT instance) FROM mcp_servers '
+                'GROUP BY 1, 2, 3 ORDER BY 4 DESC LIMIT ?', (limit * 2,)).fetchall()
+            instances = db.execute(
+                'SELECT instance, source, last_seen, error FROM instances '
+                'WHERE error IS NOT NULL OR last_seen IS NULL OR last_seen < ? ORDER BY instance',
+                (now - FLEET_STALE_SECONDS,)).fetchall()
+            since = now - FLEET_HISTORY_DAYS * 86400
+            current = set(db.execute('SELECT instance, name FROM configs'))
+            # Точки за период и последняя точка каждого конфига до него
+            samples = db.execute(
+                'SELECT instance, name, t, size FROM samples WHERE t >= ? '
+                'UNION ALL SELECT instance, name, max(t), size FROM samples WHERE t < ? GROUP BY 1, 2 '
+                'ORDER BY t', (since, since)).fetchall()
+
+        def percentile(q):
+            return sizes[round(q * (len(sizes) - 1))] if sizes else None
+
+        # Размер парка по дням. Точка пишется только при новой версии файла,
+        # поэтому конфиг, не менявшийся за день, идёт с последним известным
+        # размером; удалённый из парка - только в дни, когда от него были точки
+        history = []
+        last = {}
+        seen_today = set()
+        first_day = int(since // 86400)
+        day = None
+        for instance, name, t, size in samples + [(None, None, now, None)]:
+            sample_day = max(int(t // 86400), first_day)
+            while day is not None and day < sample_day:
+                kept = [value for key, value in last.items() if key in current or key in seen_today]
+                if kept:
+                    history.append([day * 86400, sum(kept), len(kept)])
+                seen_today = set()
+                day += 1
+            if day is None:
+                day = sample_day
+            if instance is not None:
+                last[(instance, name)] = size
+                seen_today.add((instance, name))
+        kept = [value for key, value in last.items() if key in current or key in seen_today]
+        if kept:
+            history.append([day * 86400, sum(kept), len(kept)])
+
+        return {
+            'instances': totals[0],
+            'configs': totals[1],
+            'totalSize': totals[2] or 0,
+            'projects': totals[3] or 0,
+            'historyEntries': totals[4] or 0,
+            'growthPerDay': totals[5] or 0,
+            'size': {'p50': percentile(0.5), 'p90': percentile(0.9), 'p99': percentile(0.99), 'max': percentile(1)},
+            'threshold': threshold,
+            'overThreshold': len(sizes) - bisect.bisect_right(sizes, threshold),
+            'topConfigs': [dict(zip(('instance', 'name', 'path', 'size', 'projects', 'historyEntries',
+                                     'growthPerDay', 'reportedAt'), row)) for row in top_configs],
+            'topProjects': [dict(zip(('instance', 'name', 'path', 'size', 'historyCount'), row)) for row in top_projects],
+            'mcpServers': [dict(zip(('name', 'type', 'target', 'configs', 'instances'), row)) for row in servers],
+            'problems': [dict(zip(('instance', 'source', 'lastSeen', 'error'), row)) for row in instances],
+            'history': history
+        }
+
+
+def fetch_fleet_summary(url):
+    with urllib.request.urlopen(url.rstrip('/') + '/api/fleet/summary', timeout=FLEET_TIMEOUT) as response:
+        return JSON_BACKEND.loads(response.read())
+
+
+class FleetCollector:
+    """Коллектор: принимает сводки (POST /api/fleet/ingest) и сам опрашивает экземпляры из sources.
+
+    Опрос идёт пачками по FLEET_PULL_BATCH параллельных запросов, все
+    полученные сводки записываются одной транзакцией. Ошибка (нет ответа
+    или сводка не по формату) записывается на адрес своего экземпляра.
+    """
+
+    def __init__(self, store, sources=()):
+        self.store = store
+        self.sources = list(sources)
+
+    def pull(self):
+        urls = []
+        summaries = []
+        with ThreadPoolExecutor(max_workers=FLEET_PULL_BATCH) as pool:
+            futures = {url: pool.submit(fetch_fleet_summary, url) for url in self.sources}
+            for url, future in futures.items():
+                try:
+                    summaries.append(future.result())
+                    urls.append(url)
+                except Exception as e:
+                    self.store.record_error(url, str(e))
+        if not summaries:
+            return None
+        try:
+            result = self.store.ingest(summaries, urls)
+        except Exception as e:
+            for url in urls:
+                self.store.record_error(url, f'запись сводки: {e}')
+            raise
+        for item in result['rejected']:
+            self.store.record_error(urls[item['index']], 'сводка не по формату: ' + item['error'])
+        return result
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.pull()
+            except Exception as e:
+                print(f"⚠️  Опрос экземпляров: {e}")
+            time.sleep(interval)
+
+    def start(self, interval=FLEET_REPORT_SECONDS):
+        if self.sources:
+            threading.Thread(target=self._run, args=(interval,), daemon=True).start()
+
+
+PROJECT_SCANNER = ProjectScanner(PROJECT_SCAN_CACHE)
+CONFIG_REGISTRY = ConfigRegistry()
+FLEET_AGENT = FleetAgent(CONFIG_REGISTRY)
+# Включается флагом --collector
+FLEET_COLLECTOR = None
+
+
+# Страница коллектора (/fleet): сводка по всем экземплярам из /api/fleet/rollup
+FLEET_HTML = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Claude Config Editor - парк</title>
+    <style>
+        body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif; background: #1e1e1e; color: #d4d4d4; padding: 20px; }
+        h1, h2 { color: #4ec9b0; }
+        h2 { font-size: 18px; margin: 25px 0 10px; }
+        .stats { color: #858585; font-size: 14px; }
+        .stats b { color: #d4d4d4; }
+        table { border-collapse: collapse; width: 100%; font-size: 13px; }
+        th, td { text-align: left; padding: 6px 10px; border-bottom: 1px solid #3c3c3c; }
+        th { color: #858585; font-weight: normal; }
+        .path { font-family: monospace; word-break: break-all; }
+        .bad { color: #f48771; }
+    </style>
+</head>
+<body>
+    <h1>Парк конфигов</h1>
+    <div id="fleet" class="stats">Загрузка...</div>
+    <script>
+        function formatSize(bytes) {
+            if (bytes == null) return '-';
+            if (bytes < 1024) return bytes + ' B';
+            if (bytes < 1024 * 1024) return (bytes / 1024).toFixed(1) + ' KB';
+            return (bytes / 1024 / 1024).toFixed(2) + ' MB';
+        }
+
+        function escapeHtml(text) {
+            const div = document.createElement('div');
+            div.textContent = text == null ? '' : String(text);
+            return div.innerHTML;
+        }
+
+        function table(headers, rows) {
+            return `<table><thead><tr>${headers.map(h => `<th>${h}</th>`).join('')}</tr></thead>
+                <tbody>${rows.map(r => `<tr>${r.map(c => `<td>${c}</td>`).join('')}</tr>`).join('')}</tbody></table>`;
+        }
+
+        async function loadFleet() {
+            const container = document.getElementById('fleet');
+            try {
+                const response = await fetch('/api/fleet/rollup');
+                const data = await response.json();
+                if (data.error) throw new Error(data.error);
+                container.innerHTML = `
+                    <div>Экземпляров: <b>${data.instances}</b>, конфигов: <b>${data.configs}</b>,
+                        всего <b>${formatSize(data.totalSize)}</b> (рост ${formatSize(Math.max(0, data.growthPerDay))}/сут.),
+                        проектов: <b>${data.projects}</b>, записей истории: <b>${data.historyEntries}</b></div>
+                    <div>Размер конфига: p50 ${formatSize(data.size.p50)}, p90 ${formatSize(data.size.p90)},
+                        p99 ${formatSize(data.size.p99)}, максимум ${formatSize(data.size.max)}.
+                        Больше ${formatSize(data.threshold)}: <b class="${data.overThreshold ? 'bad' : ''}">${data.overThreshold}</b></div>
+                    <h2>Самые большие конфиги</h2>
+                    ${table(['Экземпляр', 'Конфиг', 'Размер', 'Проекты', 'История', 'Рост/сут.'], data.topConfigs.map(c => [
+                        escapeHtml(c.instance), `<span class="path">${escapeHtml(c.name)}: ${escapeHtml(c.path)}</span>`,
+                        formatSize(c.size), c.projects, c.historyEntries, c.growthPerDay == null ? '-' : formatSize(Math.round(c.growthPerDay))
+                    ]))}
+                    <h2>Самые большие проекты</h2>
+                    ${table(['Экземпляр', 'Проект', 'Размер', 'История'], data.topProjects.map(p => [
+                        escapeHtml(p.instance), `<span class="path">${escapeHtml(p.path)}</span>`, formatSize(p.size), p.historyCount
+                    ]))}
+                    <h2>MCP серверы</h2>
+                    ${table(['Имя', 'Тип', 'Команда / URL', 'Конфигов', 'Экземпляров'], data.mcpServers.map(s => [
+                        escapeHtml(s.name), escapeHtml(s.type), `<span class="path">${escapeHtml(s.target)}</span>`, s.configs, s.instances
+                    ]))}
+                    ${data.problems.length ? `<h2>Нет свежих сводок</h2>` + table(['Экземпляр', 'Последняя сводка', 'Ошибка'], data.problems.map(p => [
+                        escapeHtml(p.instance), p.lastSeen ? new Date(p.lastSeen * 1000).toLocaleString() : '-', `<span class="bad">${escapeHtml(p.error || '')}</span>`
+                    ])) : ''}
+                `;
+            } catch (error) {
+                container.textContent = 'Ошибка: ' + error.message;
+            }
+        }
+
+        loadFleet();
+        setInterval(loadFleet, 60000);
+    </script>
+</body>
+</html>
+'''
+
+
+def is_loopback(host):
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return host == 'localhost'
+    if getattr(address, 'ipv4_mapped', None):
+        address = address.ipv4_mapped
+    return address.is_loopback
+
 
 class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
+    def check_access(self, route):
+        """Защита редактора от других машин и чужих страниц; False - ответ 403 уже отправлен.
+
+        - не с localhost доступны только REMOTE_ROUTES;
+        - Host должен быть localhost, иначе это может быть DNS rebinding;
+        - POST с чужим Origin (CSRF со страницы в браузере) отклоняется.
+        """
+        host = urlparse('//' + (self.headers.get('Host') or '')).hostname or ''
+        origin = self.headers.get('Origin')
+        if route not in REMOTE_ROUTES:
+            if not is_loopback(self.client_address[0]):
+                error = 'Доступно только с localhost'
+            elif not is_loopback(host):
+                error = f'Недопустимый Host: {host}'
+            else:
+                error = None
+            if error:
+                self.send_json({'error': error}, 403)
+                return False
+        if self.command == 'POST' and origin and urlparse(origin).netloc != self.headers.get('Host'):
+            self.send_json({'error': f'Запрос с чужой страницы: {origin}'}, 403)
+            return False
+        return True
+
     def do_GET(self):
         parsed_path = urlparse(self.path)
+        query = parse_qs(parsed_path.query)
+        if not self.check_access(parsed_path.path):
+            return
+        # Эти запросы не относятся к одному конфигу и не должны его загружать
+        if (parsed_path.path.startswith('/api/') and not parsed_path.path.startswith(('/api/configs', '/api/fleet/'))
+                and not self.resolve_entry(query)):
+            return
 
         if parsed_path.path == '/':
             self.send_html()
         elif parsed_path.path == '/api/config':
-            self.send_config()
+            self.send_config(query)
+        elif parsed_path.path == '/config-worker.js':
+            self.send_worker()
+        elif parsed_path.path == '/api/raw/node':
+            self.send_raw_node(query)
+        elif parsed_path.path == '/api/raw/lines':
+            self.send_raw_lines(query)
+        elif parsed_path.path == '/api/raw/text':
+            self.send_raw_text()
+        elif parsed_path.path == '/api/mcp/history':
+            self.send_json({'runs': read_mcp_probe_history(self.entry.mcp_log, limit=20)})
+        elif parsed_path.path == '/api/projects':
+            self.send_project_listing(query)
+        elif parsed_path.path == '/api/projects/scan':
+            self.send_project_scan()
+        elif parsed_path.path == '/api/treemap':
+            self.send_treemap(query)
+        elif parsed_path.path == '/api/top-values':
+            self.send_top_values(query)
+        elif parsed_path.path == '/api/duplicates':
+            self.send_duplicates(plan=False)
+        elif parsed_path.path == '/api/duplicates/plan':
+            self.send_duplicates(plan=True)
+        elif parsed_path.path == '/api/archive':
+            self.send_json({'projects': self.entry.archive.manifest()})
+        elif parsed_path.path == '/api/diff':
+            self.send_diff(query)
+        elif parsed_path.path == '/api/metrics':
+            self.send_metrics(query)
+        elif parsed_path.path == '/api/configs':
+            self.send_json(CONFIG_REGISTRY.status())
+        elif parsed_path.path == '/api/compactions':
+            compactor = self.entry.compactor
+            self.send_json({'enabled': compactor is not None, **(compactor.status() if compactor else {})})
+        elif parsed_path.path == '/api/fleet/summary':
+            self.send_fleet_summary()
+        elif parsed_path.path == '/api/fleet/rollup':
+            self.send_fleet_rollup(query)
+        elif parsed_path.path == '/fleet':
+            self.send_page(FLEET_HTML)
         else:
             super().do_GET()
 
     def do_POST(self):
-        if self.path == '/api/save':
-            self.save_config()
+        parsed_path = urlparse(self.path)
+        query = parse_qs(parsed_path.query)
+        route = parsed_path.path
+        if not self.check_access(route):
+            return
+        if route == '/api/fleet/ingest':
+            self.ingest_fleet_summaries()
+            return
+        if not self.resolve_entry(query):
+            return
+
+        if route == '/api/mcp/probe':
+            self.run_mcp_probe()
+        elif route == '/api/projects/scan':
+            self.start_project_scan()
+        elif route == '/api/archive':
+            self.archive_projects()
+        elif route == '/api/archive/restore':
+            self.restore_project()
+        elif route == '/api/session':
+            try:
+                session, version = self.entry.sessions.create()
+            except ValueError as e:
+                self.send_json({'error': str(e)}, 409)
+                return
+            self.send_json({'session': session, 'version': version})
+        elif route.startswith('/api/session/'):
+            self.session_action(route[len('/api/session/'):])
+        elif route == '/api/startup-impact':
+            self.send_startup_impact()
+        elif route == '/api/policies/simulate':
+            self.simulate_policies()
+        elif route == '/api/query':
+            self.run_query()
         else:
             self.send_response(404)
             self.end_headers()
 
+    def resolve_entry(self, query):
+        """Конфиг запроса из ?config=; False, если такого нет (ответ уже отправлен)."""
+        try:
+            self.entry = CONFIG_REGISTRY.get(query.get('config', [None])[0])
+        except KeyError as e:
+            self.send_json({'error': f'Неизвестный конфиг: {e.args[0]}'}, 404)
+            return False
+        return True
+
     def send_html(self):
         html = '''<!DOCTYPE html>
 <html lang="en">
@@ -325,6 +3892,47 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             overflow-y: auto;
         }
 
+        .raw-line {
+            white-space: nowrap;
+            line-height: 18px;
+        }
+
+        .raw-line.container {
+            cursor: pointer;
+        }
+
+        .raw-line.container:hover {
+            background: #2d2d30;
+        }
+
+        .raw-toggle {
+            display: inline-block;
+            width: 14px;
+            color: #858585;
+        }
+
+        .raw-summary {
+            color: #858585;
+        }
+
+        .raw-children {
+            padding-left: 18px;
+        }
+
+        .raw-text {
+            position: relative;
+        }
+
+        .raw-text pre {
+            position: absolute;
+            left: 0;
+            right: 0;
+            margin: 0;
+            font: inherit;
+            line-height: 18px;
+            white-space: pre;
+        }
+
         .json-key {
             color: #9cdcfe;
         }
@@ -437,107 +4045,422 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             padding: 40px;
             color: #858585;
         }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Claude Config Editor</h1>
-        <p style="color: #858585; margin-bottom: 20px;">Полный редактор конфигурации Claude Code</p>
 
-        <div class="config-path">
-            📁 Конфиг: <span id="config-path">Загрузка...</span>
-        </div>
+        .projects-viewport {
+            max-height: 70vh;
+            overflow: auto;
+        }
 
-        <div class="top-controls">
-            <button class="success" onclick="saveConfig()" id="save-btn" disabled>💾 Сохранить все изменения</button>
-            <button onclick="reloadConfig()">🔄 Перезагрузить</button>
-            <button class="danger" onclick="createBackup()">📦 Создать бэкап</button>
-            <div style="flex: 1;"></div>
-            <div style="color: #858585; font-size: 12px;">
-                Последнее сохранение: <span id="last-save">никогда</span>
-            </div>
-        </div>
+        .projects-viewport thead th {
+            position: sticky;
+            top: 0;
+            background: #2d2d30;
+            z-index: 1;
+        }
 
-        <div id="message-area"></div>
+        .project-row {
+            height: 45px;
+        }
 
-        <div class="tabs">
-            <button class="tab active" onclick="switchTab('overview')">📊 Обзор</button>
-            <button class="tab" onclick="switchTab('projects')">📁 Проекты истории</button>
-            <button class="tab" onclick="switchTab('mcp')">🔌 MCP серверы</button>
-            <button class="tab" onclick="switchTab('settings')">⚙️ Настройки</button>
-            <button class="tab" onclick="switchTab('raw')">📝 Raw JSON</button>
-        </div>
+        .project-row td {
+            padding: 0 12px;
+        }
 
-        <!-- Overview Tab -->
-        <div id="tab-overview" class="tab-content active">
-            <div class="stats-grid">
-                <div class="stat-card">
-                    <div class="stat-label">Размер конфига</div>
-                    <div class="stat-value" id="overview-size">-</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-label">Проектов</div>
-                    <div class="stat-value" id="overview-projects">-</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-label">MCP серверов</div>
-                    <div class="stat-value" id="overview-mcp">-</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-label">Запусков</div>
-                    <div class="stat-value" id="overview-startups">-</div>
-                </div>
-            </div>
+        .project-row .size-bar-fill {
+            transition: none;
+        }
 
-            <div class="section">
-                <div class="section-header">
-                    <h2>🔍 Быстрый анализ</h2>
-                </div>
-                <div id="quick-analysis"></div>
-            </div>
-        </div>
+        .project-path {
+            font-family: 'Monaco', monospace;
+            font-size: 12px;
+            white-space: nowrap;
+            overflow: hidden;
+            text-overflow: ellipsis;
+            max-width: 0;
+        }
 
-        <!-- Projects Tab -->
-        <div id="tab-projects" class="tab-content">
-            <div class="section">
-                <div class="section-header">
-                    <h2>📁 История проектов <span class="badge" id="projects-badge">0</span></h2>
-                    <div>
-                        <button onclick="selectAllProjects()">Выбрать все</button>
-                        <button onclick="deselectAllProjects()">Снять выбор</button>
-                        <button onclick="selectLargestProjects()">Топ-10 больших</button>
-                        <button class="danger" onclick="deleteSelectedProjects()">Удалить выбранное</button>
-                    </div>
-                </div>
-                <div class="search-box" style="margin-bottom: 15px;">
-                    <input type="text" id="projects-search" placeholder="Поиск по пути проекта..." onkeyup="filterProjects()">
-                </div>
-                <div style="overflow-x: auto;">
-                    <table>
-                        <thead>
-                            <tr>
-                                <th style="width: 50px;">
-                                    <input type="checkbox" id="select-all-projects" onchange="toggleAllProjects(this.checked)">
-                                </th>
-                                <th onclick="sortProjects('path')">Проект ↕</th>
-                                <th style="width: 100px;" onclick="sortProjects('history')">История ↕</th>
-                                <th style="width: 300px;" onclick="sortProjects('size')">Размер ↕</th>
-                            </tr>
-                        </thead>
-                        <tbody id="projects-body">
-                            <tr><td colspan="4" class="no-data">Загрузка...</td></tr>
-                        </tbody>
-                    </table>
-                </div>
-            </div>
-        </div>
+        .project-history {
+            text-align: center;
+            color: #858585;
+        }
+
+        .load-progress {
+            background: #252526;
+            padding: 15px;
+            border-radius: 8px;
+            margin-bottom: 20px;
+        }
+
+        .load-progress.hidden {
+            display: none;
+        }
+
+        .load-progress-label {
+            color: #858585;
+            font-size: 13px;
+            margin-bottom: 8px;
+        }
+
+        .metrics-charts {
+            display: grid;
+            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
+            gap: 15px;
+        }
+
+        .metrics-chart svg {
+            width: 100%;
+            height: 80px;
+            background: #1e1e1e;
+            border-radius: 4px;
+        }
+
+        .projects-filters {
+            display: flex;
+            gap: 10px;
+            align-items: center;
+            margin-bottom: 15px;
+        }
+
+        .projects-filters .selection-stats {
+            margin-bottom: 0;
+        }
+
+        select, input[type="number"] {
+            padding: 10px;
+            background: #3c3c3c;
+            border: 1px solid #555;
+            color: #d4d4d4;
+            border-radius: 4px;
+            font-size: 14px;
+        }
+
+        input[type="number"] {
+            width: 80px;
+        }
+
+        .project-activity {
+            color: #858585;
+            white-space: nowrap;
+        }
+
+        .project-activity.dead {
+            color: #f48771;
+        }
+
+        .value-path {
+            font-family: Monaco, monospace;
+            font-size: 12px;
+            word-break: break-all;
+        }
+
+        .treemap {
+            position: relative;
+            height: 400px;
+            background: #1e1e1e;
+            border-radius: 4px;
+            overflow: hidden;
+        }
+
+        .treemap-cell {
+            position: absolute;
+            border: 1px solid #1e1e1e;
+            overflow: hidden;
+            font-size: 11px;
+            padding: 3px;
+            color: #fff;
+            cursor: pointer;
+            white-space: nowrap;
+            text-overflow: ellipsis;
+        }
+
+        .treemap-cell:hover {
+            filter: brightness(1.2);
+        }
+
+        .treemap-cell.leaf {
+            cursor: default;
+        }
+
+        .treemap-path {
+            font-size: 12px;
+            color: #858585;
+        }
+
+        .treemap-path a {
+            color: #4ec9b0;
+            cursor: pointer;
+        }
+
+        .treemap-categories {
+            display: flex;
+            flex-wrap: wrap;
+            gap: 15px;
+            margin-bottom: 10px;
+            font-size: 12px;
+            color: #858585;
+        }
+
+        .selection-stats {
+            color: #858585;
+            font-size: 13px;
+            margin-bottom: 10px;
+        }
+
+        tbody tr.spacer-row {
+            border: none;
+        }
+
+        tbody tr.spacer-row td {
+            padding: 0;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Claude Config Editor</h1>
+        <p style="color: #858585; margin-bottom: 20px;">Полный редактор конфигурации Claude Code</p>
+
+        <div class="config-path">
+            📁 Конфиг: <span id="config-path">Загрузка...</span>
+            <select id="config-select" hidden onchange="switchConfig(this.value)" style="margin-left: 10px; padding: 4px;"></select>
+        </div>
+
+        <div class="top-controls">
+            <button class="success" onclick="saveConfig()" id="save-btn" disabled>💾 Сохранить все изменения</button>
+            <button onclick="undoEdit()" id="undo-btn" disabled title="Отменить правку">↶ Отменить</button>
+            <button onclick="redoEdit()" id="redo-btn" disabled title="Повторить правку">↷ Повторить</button>
+            <button onclick="reloadConfig()">🔄 Перезагрузить</button>
+            <button class="danger" onclick="createBackup()">📦 Создать бэкап</button>
+            <div style="flex: 1;"></div>
+            <div style="color: #858585; font-size: 12px;">
+                Последнее сохранение: <span id="last-save">никогда</span>
+            </div>
+        </div>
+
+        <div id="message-area"></div>
+
+        <div class="load-progress" id="load-progress">
+            <div class="load-progress-label" id="load-progress-label">Загрузка конфига...</div>
+            <div class="size-bar"><div class="size-bar-fill" id="load-progress-fill" style="width: 0%"></div></div>
+        </div>
+
+        <div class="tabs">
+            <button class="tab active" onclick="switchTab('overview')">📊 Обзор</button>
+            <button class="tab" onclick="switchTab('projects')">📁 Проекты истории</button>
+            <button class="tab" onclick="switchTab('mcp')">🔌 MCP серверы</button>
+            <button class="tab" onclick="switchTab('settings')">⚙️ Настройки</button>
+            <button class="tab" onclick="switchTab('raw')">📝 Raw JSON</button>
+        </div>
+
+        <!-- Overview Tab -->
+        <div id="tab-overview" class="tab-content active">
+            <div class="stats-grid">
+                <div class="stat-card">
+                    <div class="stat-label">Размер конфига</div>
+                    <div class="stat-value" id="overview-size">-</div>
+                </div>
+                <div class="stat-card">
+                    <div class="stat-label">Проектов</div>
+                    <div class="stat-value" id="overview-projects">-</div>
+                </div>
+                <div class="stat-card">
+                    <div class="stat-label">MCP серверов</div>
+                    <div class="stat-value" id="overview-mcp">-</div>
+                </div>
+                <div class="stat-card">
+                    <div class="stat-label">Запусков</div>
+                    <div class="stat-value" id="overview-startups">-</div>
+                </div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>🔍 Быстрый анализ</h2>
+                </div>
+                <div id="quick-analysis"></div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>⏱ Влияние на запуск</h2>
+                    <button onclick="measureStartupImpact()" id="startup-btn">Замерить</button>
+                </div>
+                <div class="selection-stats">
+                    Время разбора конфига сейчас и после очистки: выбранные проекты, дубликаты истории,
+                    история, урезанная до N записей (поле рядом с кнопками архива).
+                </div>
+                <div id="startup-impact"></div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>🧪 Сравнение политик очистки</h2>
+                    <button onclick="simulatePolicies()">Сравнить</button>
+                </div>
+                <div class="selection-stats">
+                    Политики в JSON: keepHistory (оставить N записей), inactiveDays (папка не менялась N дней),
+                    dropMissing (папки нет), dropTopBySize (K самых больших проектов). Файл не меняется.
+                </div>
+                <textarea id="policies-input" spellcheck="false" style="width: 100%; height: 90px; margin: 10px 0; background: #1e1e1e; color: #d4d4d4; border: 1px solid #3c3c3c; font-family: monospace;">[
+  {"name": "История: 50 записей", "keepHistory": 50},
+  {"name": "Неактивные 90 дней", "inactiveDays": 90},
+  {"name": "Топ-20 по размеру", "dropTopBySize": 20},
+  {"name": "Неактивные 90 дней + история 50", "inactiveDays": 90, "keepHistory": 50}
+]</textarea>
+                <div id="policies-result"></div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>🗄 SQL-запросы</h2>
+                    <button onclick="runQuery()">Выполнить</button>
+                </div>
+                <div class="selection-stats">
+                    Только чтение. Таблицы: projects (path, position, size, history_count, history_bytes, mcp_count,
+                    settings, dir_exists, dir_mtime, dir_git), history (project, position, display, size, pasted_count, entry),
+                    mcp_servers (scope, name, type, command, url, definition). JSON-поля - через json_extract.
+                </div>
+                <textarea id="query-input" spellcheck="false" style="width: 100%; height: 90px; margin: 10px 0; background: #1e1e1e; color: #d4d4d4; border: 1px solid #3c3c3c; font-family: monospace;">SELECT path, history_count, size
+FROM projects
+WHERE history_count > 500 AND dir_exists = 0
+ORDER BY size DESC</textarea>
+                <div id="query-result"></div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>🐘 Самые большие значения</h2>
+                    <div class="projects-filters">
+                        <select id="top-values-types">
+                            <option value="string">Строки</option>
+                            <option value="array">Массивы</option>
+                            <option value="string,array">Строки и массивы</option>
+                        </select>
+                        <input type="number" id="top-values-k" value="20" min="1" max="1000">
+                        <button onclick="loadTopValues()">Найти</button>
+                    </div>
+                </div>
+                <div id="top-values"></div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>♻️ Дубликаты в истории</h2>
+                    <button class="danger" onclick="dedupeHistory()" id="dedupe-btn" disabled>Удалить дубликаты</button>
+                </div>
+                <div class="selection-stats" id="duplicates-summary">Поиск...</div>
+                <div id="duplicates-list"></div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>📈 Рост конфига</h2>
+                    <select id="metrics-range" onchange="loadMetrics()">
+                        <option value="86400">Сутки</option>
+                        <option value="604800" selected>Неделя</option>
+                        <option value="2592000">Месяц</option>
+                        <option value="">Всё время</option>
+                    </select>
+                </div>
+                <div id="metrics-charts" class="metrics-charts"></div>
+                <div class="selection-stats" id="metrics-summary" style="margin-top: 10px;"></div>
+            </div>
+
+            <div class="section" id="compaction-section" hidden>
+                <div class="section-header">
+                    <h2>🧹 Автоочистка</h2>
+                    <button class="small" onclick="loadCompactions()">Обновить</button>
+                </div>
+                <div class="selection-stats" id="compaction-summary"></div>
+                <div id="compaction-runs"></div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>🔀 Изменения относительно резервной копии</h2>
+                    <button class="small" onclick="loadDiff()">Обновить</button>
+                </div>
+                <div id="diff-list"></div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>🧱 Из чего состоит файл</h2>
+                    <div class="treemap-path" id="treemap-path"></div>
+                </div>
+                <div class="treemap-categories" id="treemap-categories"></div>
+                <div class="treemap" id="treemap"></div>
+            </div>
+        </div>
+
+        <!-- Projects Tab -->
+        <div id="tab-projects" class="tab-content">
+            <div class="section">
+                <div class="section-header">
+                    <h2>📁 История проектов <span class="badge" id="projects-badge">0</span></h2>
+                    <div>
+                        <button onclick="selectAllProjects()">Выбрать все</button>
+                        <button onclick="deselectAllProjects()">Снять выбор</button>
+                        <button onclick="selectLargestProjects()">Топ-10 больших</button>
+                        <button onclick="archiveSelectedProjects(false)">📦 В архив</button>
+                        <button onclick="archiveSelectedProjects(true)">📦 Старую историю в архив</button>
+                        <input type="number" id="archive-keep" value="20" min="0" title="Сколько последних записей оставить">
+                        <button class="danger" onclick="deleteSelectedProjects()">Удалить выбранное</button>
+                    </div>
+                </div>
+                <div class="selection-stats">
+                    Выбрано: <span id="projects-selected-count">0</span>,
+                    освободится: <span id="projects-selected-size">0 B</span>
+                </div>
+                <div class="projects-filters">
+                    <div class="search-box">
+                        <input type="text" id="projects-search" placeholder="Поиск по пути проекта..." oninput="filterProjects()">
+                    </div>
+                    <select id="projects-activity" onchange="filterProjects()">
+                        <option value="all">Все проекты</option>
+                        <option value="dead">Папки нет</option>
+                        <option value="inactive">Неактивные дольше</option>
+                    </select>
+                    <input type="number" id="projects-inactive-days" value="90" min="1" oninput="filterProjects()">
+                    <span class="selection-stats" id="projects-scan-status"></span>
+                </div>
+                <div class="projects-viewport" id="projects-viewport">
+                    <table>
+                        <thead>
+                            <tr>
+                                <th style="width: 50px;">
+                                    <input type="checkbox" id="select-all-projects" onchange="toggleAllProjects(this.checked)">
+                                </th>
+                                <th onclick="sortProjects('path')">Проект ↕</th>
+                                <th style="width: 100px;" onclick="sortProjects('history')">История ↕</th>
+                                <th style="width: 140px;">Активность</th>
+                                <th style="width: 300px;" onclick="sortProjects('size')">Размер ↕</th>
+                            </tr>
+                        </thead>
+                        <tbody id="projects-body">
+                            <tr><td colspan="5" class="no-data">Загрузка...</td></tr>
+                        </tbody>
+                    </table>
+                </div>
+            </div>
+
+            <div class="section">
+                <div class="section-header">
+                    <h2>📦 Архив <span class="badge" id="archive-badge">0</span></h2>
+                </div>
+                <div id="archive-list"></div>
+            </div>
+        </div>
 
         <!-- MCP Tab -->
         <div id="tab-mcp" class="tab-content">
             <div class="section">
                 <div class="section-header">
                     <h2>🔌 MCP серверы <span class="badge" id="mcp-badge">0</span></h2>
-                    <button onclick="addMcpServer()">+ Добавить сервер</button>
+                    <div>
+                        <button onclick="runMcpProbe()" id="mcp-probe-btn">🩺 Проверить запуск</button>
+                        <button onclick="addMcpServer()">+ Добавить сервер</button>
+                    </div>
                 </div>
                 <div id="mcp-servers-list"></div>
             </div>
@@ -558,8 +4481,13 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             <div class="section">
                 <div class="section-header">
                     <h2>📝 Raw JSON</h2>
-                    <button onclick="copyRawJson()">📋 Копировать</button>
+                    <div>
+                        <button class="small" onclick="setRawMode('tree')">🌳 Дерево</button>
+                        <button class="small" onclick="setRawMode('text')">📄 Текст</button>
+                        <button onclick="copyRawJson()">📋 Копировать</button>
+                    </div>
                 </div>
+                <div class="selection-stats" id="raw-json-note"></div>
                 <div class="json-viewer" id="raw-json"></div>
             </div>
         </div>
@@ -567,42 +4495,248 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
 
     <script>
         let config = null;
-        let projects = [];
+        let loadedVersion = null;
+        // Сессия рабочей копии в воркере: закрывается при уходе со страницы
+        let loadedSession = null;
+        // Проекты хранятся колонками; проект - это индекс в них
+        let projectPaths = [];
+        let projectPathsLower = null;
+        let projectSizes = new Uint32Array(0);
+        let projectHistory = new Uint32Array(0);
+        let projectScans = [];
+        let projectIndex = new Map();
+        let projectsRevision = 0;
+        let selectedPaths = new Set();
+        let selectedBytes = 0;
         let sortColumn = 'size';
         let sortDirection = 'desc';
         let hasChanges = false;
+        let configSize = 0;
+        let rawJsonStale = true;
+        let mcpProbeHistory = [];
+
+        const TREEMAP_DEPTH = 3;
+        const TRUNCATE_KEEP_CHARS = 1000;
+        const TRUNCATE_KEEP_ITEMS = 50;
+        let topValues = [];
+        let treemapPath = [];
+
+        // Raw JSON: дерево с подгрузкой узлов и оконный текстовый режим
+        const RAW_LINE_HEIGHT = 18;
+        const RAW_BLOCK_LINES = 200;
+        const RAW_MAX_BLOCKS = 20;
+        let rawMode = 'tree';
+        let rawLineBlocks = new Map();
+        let rawLineTotal = 0;
+        let rawTextFrame = null;
+        let rawTextSeq = 0;
+
+        // Конфиг из реестра сервера (?config=имя); без него - основной
+        const CONFIG_NAME = new URLSearchParams(location.search).get('config');
+
+        function apiUrl(url) {
+            return CONFIG_NAME ? url + (url.includes('?') ? '&' : '?') + 'config=' + encodeURIComponent(CONFIG_NAME) : url;
+        }
+
+        let configWorker = null;
+        let workerCalls = new Map();
+        let nextWorkerCallId = 1;
+
+        // Виртуальная таблица проектов: DOM-строки создаются только для видимой области
+        const ROW_HEIGHT = 45;
+        const ROW_OVERSCAN = 10;
+        let projectView = [];
+        let maxProjectSize = 0;
+        let rowPool = [];
+        let rowsFrame = null;
+
+        // Кэш порядков сортировки и отложенная фильтрация
+        const FILTER_DEBOUNCE_MS = 150;
+        let sortOrders = {};
+        let viewState = null;
+        let filterTimer = null;
+
+        window.addEventListener('DOMContentLoaded', () => {
+            const viewport = document.getElementById('projects-viewport');
+            viewport.addEventListener('scroll', scheduleVisibleRows);
+            window.addEventListener('resize', () => {
+                rowPool = [];
+                scheduleVisibleRows();
+            });
+            document.getElementById('projects-body').addEventListener('click', (e) => {
+                const row = e.target.closest('tr.project-row');
+                if (row && row._index >= 0) toggleProject(projectPaths[row._index]);
+            });
+            startConfigWorker();
+            loadConfig();
+            loadConfigRegistry();
+        });
+
+        // Рабочая копия держит на сервере дерево конфига: отпускаем её сразу, а не по вытеснению
+        window.addEventListener('pagehide', () => {
+            if (loadedSession) navigator.sendBeacon(apiUrl('/api/session/close'), JSON.stringify({ session: loadedSession }));
+        });
+        window.addEventListener('pageshow', (event) => {
+            // Страница вернулась из кэша браузера, а её сессия уже закрыта
+            if (event.persisted && loadedSession) loadConfig();
+        });
+
+        async function loadConfigRegistry() {
+            try {
+                const data = await fetchJson('/api/configs');
+                if (data.configs.length < 2) return;
+                const select = document.getElementById('config-select');
+                const current = CONFIG_NAME || (data.configs.find(c => c.name === 'default') || data.configs[0]).name;
+                select.innerHTML = data.configs.map(c => `
+                    <option value="${escapeHtml(c.name)}" ${c.name === current ? 'selected' : ''}>
+                        ${escapeHtml(c.name)}${c.exists ? '' : ' (нет файла)'}
+                    </option>
+                `).join('');
+                select.dataset.current = current;
+                select.title = `Память под конфиги: ${formatSize(data.used)} из ${formatSize(data.budget)}, выгружено: ${data.evictions}`;
+                select.hidden = false;
+            } catch (error) {
+                // Без реестра страница работает с основным конфигом
+            }
+        }
 
-        window.addEventListener('DOMContentLoaded', loadConfig);
+        function switchConfig(name) {
+            if (hasChanges && !confirm('Есть несохранённые изменения. Переключиться на другой конфиг?')) {
+                const select = document.getElementById('config-select');
+                select.value = select.dataset.current;
+                return;
+            }
+            location.search = '?config=' + encodeURIComponent(name);
+        }
+
+        function startConfigWorker() {
+            configWorker = new Worker(apiUrl('/config-worker.js'));
+            configWorker.onmessage = (event) => {
+                const message = event.data;
+                if (message.type === 'progress') {
+                    showLoadProgress(message);
+                    return;
+                }
+                if (message.type === 'listing') {
+                    processListing(message.listing);
+                    renderProjects();
+                    return;
+                }
+                const call = workerCalls.get(message.id);
+                if (!call) return;
+                workerCalls.delete(message.id);
+                if (message.error !== undefined) call.reject(new Error(message.error));
+                else call.resolve(message.result);
+            };
+        }
+
+        function callWorker(type, payload) {
+            return new Promise((resolve, reject) => {
+                const id = nextWorkerCallId++;
+                workerCalls.set(id, { resolve, reject });
+                configWorker.postMessage({ id, type, payload });
+            });
+        }
+
+        function showLoadProgress({ stage, loaded, total }) {
+            const box = document.getElementById('load-progress');
+            const label = document.getElementById('load-progress-label');
+            const fill = document.getElementById('load-progress-fill');
+            box.classList.remove('hidden');
+
+            if (stage === 'download') {
+                label.textContent = total
+                    ? `Загрузка: ${formatSize(loaded)} из ${formatSize(total)}`
+                    : `Загрузка: ${formatSize(loaded)}`;
+                fill.style.width = (total ? loaded / total * 100 : 0) + '%';
+            } else if (stage === 'listing') {
+                label.textContent = 'Загрузка списка проектов...';
+            } else if (stage === 'parse') {
+                label.textContent = `Разбор JSON (${formatSize(loaded)})...`;
+                fill.style.width = '100%';
+            } else {
+                label.textContent = 'Анализ проектов...';
+            }
+        }
 
         async function loadConfig() {
             try {
-                const response = await fetch('/api/config');
-                const data = await response.json();
+                const data = await callWorker('load');
 
                 document.getElementById('config-path').textContent = data.path;
                 config = data.config;
+                configSize = data.totalSize;
+                loadedVersion = data.version;
+                loadedSession = data.session;
+                applySessionState({ dirty: false, canUndo: false, canRedo: false });
 
-                processConfig();
+                if (data.listing) processListing(data.listing);
                 renderAllTabs();
+                loadMcpProbeHistory();
+                scanProjects();
+                loadTreemap();
+                loadTopValues();
+                loadDuplicates();
+                loadArchive();
+                loadDiff();
+                loadMetrics();
+                loadCompactions();
             } catch (error) {
                 showMessage('Ошибка загрузки конфига: ' + error.message, 'error');
+            } finally {
+                document.getElementById('load-progress').classList.add('hidden');
             }
         }
 
-        function processConfig() {
-            projects = [];
+        async function syncConfigKey(key) {
+            const result = await callWorker('setKey', { key, value: config[key] });
+            configSize = result.totalSize;
+            applySessionState(result.state);
+            renderOverview();
+        }
 
-            if (config.projects) {
-                for (const [path, data] of Object.entries(config.projects)) {
-                    const dataStr = JSON.stringify(data);
-                    projects.push({
-                        path: path,
-                        data: data,
-                        historyCount: data.history ? data.history.length : 0,
-                        size: dataStr.length,
-                        selected: false
-                    });
-                }
+        function processListing(listing) {
+            setProjectColumns(listing.paths, listing.size, listing.historyCount, new Array(listing.paths.length).fill(null));
+            selectedPaths = new Set();
+            selectedBytes = 0;
+        }
+
+        function setProjectColumns(paths, sizes, history, scans) {
+            projectPaths = paths;
+            projectPathsLower = null;
+            projectSizes = sizes;
+            projectHistory = history;
+            projectScans = scans;
+            projectIndex = new Map();
+            paths.forEach((path, i) => projectIndex.set(path, i));
+            invalidateProjectOrders();
+            updateMaxProjectSize();
+        }
+
+        function removeProjectsFromColumns(removed) {
+            const keep = [];
+            for (let i = 0; i < projectPaths.length; i++) {
+                if (!removed.has(projectPaths[i])) keep.push(i);
+            }
+            setProjectColumns(
+                keep.map(i => projectPaths[i]),
+                Uint32Array.from(keep, i => projectSizes[i]),
+                Uint32Array.from(keep, i => projectHistory[i]),
+                keep.map(i => projectScans[i])
+            );
+        }
+
+        function lowerProjectPaths() {
+            // Строки в нижнем регистре нужны только для поиска: создаются при первом запросе
+            if (projectPathsLower === null) projectPathsLower = projectPaths.map(p => p.toLowerCase());
+            return projectPathsLower;
+        }
+
+        function updateMaxProjectSize() {
+            // Без Math.max(...array): на больших массивах упирается в лимит аргументов
+            maxProjectSize = 0;
+            for (let i = 0; i < projectSizes.length; i++) {
+                if (projectSizes[i] > maxProjectSize) maxProjectSize = projectSizes[i];
             }
         }
 
@@ -615,8 +4749,8 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
         }
 
         function renderOverview() {
-            const totalSize = JSON.stringify(config).length;
-            const projectsCount = config.projects ? Object.keys(config.projects).length : 0;
+            const totalSize = configSize;
+            const projectsCount = projectPaths.length;
             const mcpCount = config.mcpServers ? Object.keys(config.mcpServers).length : 0;
 
             document.getElementById('overview-size').textContent = formatSize(totalSize);
@@ -645,70 +4779,776 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             document.getElementById('quick-analysis').innerHTML = analysis;
         }
 
-        function renderProjects() {
-            const tbody = document.getElementById('projects-body');
-            const searchTerm = document.getElementById('projects-search').value.toLowerCase();
+        async function simulatePolicies() {
+            const container = document.getElementById('policies-result');
+            try {
+                const policies = JSON.parse(document.getElementById('policies-input').value);
+                const data = await fetchJson('/api/policies/simulate', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ policies })
+                });
+                const base = data.baseline;
+                container.innerHTML = `
+                    <table>
+                        <thead><tr><th>Политика</th><th>Размер</th><th>Экономия</th><th>Проекты</th><th>Записи истории</th></tr></thead>
+                        <tbody>
+                            <tr>
+                                <td>Сейчас</td>
+                                <td>${formatSize(base.bytes)}</td>
+                                <td></td>
+                                <td>${base.projects}</td>
+                                <td>${base.historyEntries}</td>
+                            </tr>
+                            ${data.policies.map(p => `
+                                <tr>
+                                    <td>${escapeHtml(p.name)}</td>
+                                    <td>${formatSize(p.bytes)}</td>
+                                    <td style="color: #4ec9b0;">−${formatSize(p.savedBytes)} (${(p.savedBytes / base.bytes * 100).toFixed(1)}%)</td>
+                                    <td>${p.projects} (−${p.droppedProjects})</td>
+                                    <td>${p.historyEntries} (−${p.droppedEntries})</td>
+                                </tr>
+                            `).join('')}
+                        </tbody>
+                    </table>
+                    <div class="selection-stats" style="margin-top: 10px;">
+                        Расчёт: ${data.elapsedMs} мс (таблица: ${data.tableMs} мс).
+                        Данные об активности есть для ${data.scanned} из ${base.projects} проектов.
+                    </div>
+                `;
+            } catch (error) {
+                container.innerHTML = `<div class="no-data">Ошибка: ${escapeHtml(error.message)}</div>`;
+            }
+        }
 
-            document.getElementById('projects-badge').textContent = projects.length;
+        async function runQuery() {
+            const container = document.getElementById('query-result');
+            try {
+                const data = await fetchJson('/api/query', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ sql: document.getElementById('query-input').value })
+                });
+                const cell = value => value === null ? '<span style="color: #808080;">NULL</span>' : escapeHtml(String(value));
+                container.innerHTML = `
+                    <div style="max-height: 400px; overflow: auto;">
+                        <table>
+                            <thead><tr>${data.columns.map(c => `<th>${escapeHtml(c)}</th>`).join('')}</tr></thead>
+                            <tbody>${data.rows.map(row => `<tr>${row.map(v => `<td>${cell(v)}</td>`).join('')}</tr>`).join('')}</tbody>
+                        </table>
+                    </div>
+                    <div class="selection-stats" style="margin-top: 10px;">
+                        ${data.rows.length}${data.truncated ? '+' : ''} строк за ${data.elapsedMs} мс.
+                        Обновление индекса: ${data.index.elapsedMs} мс, проектов обновлено: ${data.index.changedProjects}.
+                    </div>
+                `;
+            } catch (error) {
+                container.innerHTML = `<div class="no-data">Ошибка: ${escapeHtml(error.message)}</div>`;
+            }
+        }
+
+        async function measureStartupImpact() {
+            const button = document.getElementById('startup-btn');
+            const container = document.getElementById('startup-impact');
+            const keep = Number(document.getElementById('archive-keep').value) || 0;
+            const scenarios = [];
+            if (selectedPaths.size > 0) {
+                scenarios.push({ name: `Без выбранных проектов (${selectedPaths.size})`, removeProjects: [...selectedPaths] });
+            }
+            scenarios.push({ name: 'Без дубликатов истории', dedupe: true });
+            scenarios.push({ name: `История до ${keep} записей`, keepHistory: keep });
+            scenarios.push({
+                name: 'Всё вместе',
+                removeProjects: [...selectedPaths],
+                dedupe: true,
+                keepHistory: keep
+            });
+
+            button.disabled = true;
+            button.textContent = '⏳ Замер...';
+            try {
+                const data = await fetchJson('/api/startup-impact', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ scenarios })
+                });
+                const row = (name, bytes, ms, savedBytes, savedMs) => `
+                    <tr>
+                        <td>${escapeHtml(name)}</td>
+                        <td>${formatSize(bytes)}</td>
+                        <td>${ms.toFixed(1)} мс</td>
+                        <td style="color: #4ec9b0;">${savedBytes === null ? '' : '−' + formatSize(savedBytes) + ' / −' + savedMs.toFixed(1) + ' мс'}</td>
+                    </tr>
+                `;
+                container.innerHTML = `
+                    <table><tbody>
+                        ${row('Сейчас', data.baseline.bytes, data.baseline.parseMs, null, 0)}
+                        ${data.scenarios.map(s => row(s.name, s.bytes, s.parseMs, s.savedBytes, s.savedMs)).join('')}
+                    </tbody></table>
+                    <div class="selection-stats" style="margin-top: 10px;">
+                        Медиана ${data.runs} разборов через ${data.engine === 'node' ? 'Node.js JSON.parse' : 'Python json.loads (node не найден)'}
+                        по сохранённой версии файла.
+                    </div>
+                `;
+            } catch (error) {
+                container.innerHTML = `<div class="no-data">Ошибка замера: ${escapeHtml(error.message)}</div>`;
+            } finally {
+                button.disabled = false;
+                button.textContent = 'Замерить';
+            }
+        }
 
-            if (projects.length === 0) {
-                tbody.innerHTML = '<tr><td colspan="4" class="no-data">Нет проектов</td></tr>';
+        async function loadTopValues() {
+            const k = Number(document.getElementById('top-values-k').value) || 20;
+            const types = document.getElementById('top-values-types').value;
+            const container = document.getElementById('top-values');
+            container.innerHTML = '<div class="no-data">Поиск...</div>';
+            try {
+                const data = await fetchJson(`/api/top-values?k=${k}&types=${types}`);
+                topValues = data.values;
+                renderTopValues();
+            } catch (error) {
+                container.innerHTML = `<div class="no-data">Ошибка: ${escapeHtml(error.message)}</div>`;
+            }
+        }
+
+        function renderTopValues() {
+            const container = document.getElementById('top-values');
+            if (topValues.length === 0) {
+                container.innerHTML = '<div class="no-data">Ничего не найдено</div>';
                 return;
             }
 
-            const sorted = [...projects].sort((a, b) => {
-                let aVal, bVal;
-                if (sortColumn === 'path') {
-                    aVal = a.path;
-                    bVal = b.path;
-                } else if (sortColumn === 'history') {
-                    aVal = a.historyCount;
-                    bVal = b.historyCount;
-                } else {
-                    aVal = a.size;
-                    bVal = b.size;
+            const rows = topValues.map((item, i) => {
+                const length = item.type === 'string' ? `${item.length} симв.` : `${item.length} элем.`;
+                const status = item.edited ? `<span class="raw-summary">${item.edited}</span>` : `
+                    <button class="small" onclick="editTopValue(${i}, 'truncate')">Обрезать</button>
+                    <button class="danger small" onclick="editTopValue(${i}, 'delete')">Удалить</button>`;
+                return `
+                    <tr>
+                        <td class="value-path">${escapeHtml(item.path.join(' › '))}</td>
+                        <td style="color: #858585;">${length}</td>
+                        <td>${formatSize(item.size)}</td>
+                        <td style="white-space: nowrap;">${status}</td>
+                    </tr>
+                `;
+            }).join('');
+            container.innerHTML = `<table><tbody>${rows}</tbody></table>`;
+        }
+
+        function isPathPrefix(prefix, path) {
+            return prefix.length <= path.length && prefix.every((key, i) => key === path[i]);
+        }
+
+        async function editTopValue(index, action) {
+            const item = topValues[index];
+            const keep = item.type === 'string' ? TRUNCATE_KEEP_CHARS : TRUNCATE_KEEP_ITEMS;
+            try {
+                applyEditResult(await callWorker('editPath', { path: item.path, action, keep }));
+            } catch (error) {
+                showMessage('Ошибка: ' + error.message, 'error');
+                return;
+            }
+
+            const parent = item.path.slice(0, -1);
+            const last = item.path[item.path.length - 1];
+            if (action === 'delete') {
+                topValues = topValues.filter(v => v === item || !isPathPrefix(item.path, v.path));
+                // Удаление из массива сдвигает индексы соседей
+                if (typeof last === 'number') {
+                    for (const v of topValues) {
+                        const i = v.path[parent.length];
+                        if (v !== item && isPathPrefix(parent, v.path) && typeof i === 'number' && i > last) {
+                            v.path = [...v.path];
+                            v.path[parent.length] = i - 1;
+                        }
+                    }
+                }
+                item.edited = 'удалено';
+            } else {
+                if (item.type === 'array') {
+                    topValues = topValues.filter(v => v === item || !isPathPrefix(item.path, v.path)
+                        || v.path[item.path.length] < keep);
                 }
+                item.edited = 'обрезано';
+            }
+
+            markChanged();
+            renderTopValues();
+        }
+
+        function updateProjectRow(row) {
+            const i = projectIndex.get(row.path);
+            if (i === undefined) return;
+            if (selectedPaths.has(row.path)) selectedBytes += row.size - projectSizes[i];
+            projectSizes[i] = row.size;
+            projectHistory[i] = row.historyCount;
+        }
+
+        function applyEditResult(result) {
+            // Результат правки, отмены или повтора: изменённые проекты и ключи верхнего уровня
+            configSize = result.totalSize;
+
+            const removed = result.removedProjects.filter(path => projectIndex.has(path));
+            for (const path of removed) setProjectSelected(projectIndex.get(path), false);
+            if (removed.length > 0) removeProjectsFromColumns(new Set(removed));
+
+            const added = result.projects.filter(row => !projectIndex.has(row.path));
+            if (added.length > 0) {
+                setProjectColumns(
+                    projectPaths.concat(added.map(row => row.path)),
+                    Uint32Array.from([...projectSizes, ...added.map(row => row.size)]),
+                    Uint32Array.from([...projectHistory, ...added.map(row => row.historyCount)]),
+                    projectScans.concat(added.map(() => null))
+                );
+            }
+            result.projects.forEach(updateProjectRow);
+            if (result.projects.length > 0 || removed.length > 0) {
+                invalidateProjectOrders();
+                updateMaxProjectSize();
+                updateSelectionStats();
+                renderProjects();
+            }
+
+            const keys = Object.keys(result.keys);
+            for (const key of keys) {
+                if (result.keys[key] === undefined) delete config[key];
+                else config[key] = result.keys[key];
+            }
+            if (keys.length > 0) {
+                renderMcpServers();
+                renderSettings();
+            }
+            applySessionState(result.state);
+            renderOverview();
+        }
+
+        function applySessionState(state) {
+            if (!state) return;
+            hasChanges = state.dirty;
+            const saveBtn = document.getElementById('save-btn');
+            saveBtn.disabled = !state.dirty;
+            if (state.dirty) saveBtn.textContent = '💾 Сохранить все изменения';
+            document.getElementById('undo-btn').disabled = !state.canUndo;
+            document.getElementById('redo-btn').disabled = !state.canRedo;
+        }
 
-                if (sortDirection === 'asc') {
-                    return aVal > bVal ? 1 : -1;
+        async function undoEdit() {
+            try {
+                applyEditResult(await callWorker('undo'));
+            } catch (error) {
+                showMessage('Ошибка отмены: ' + error.message, 'error');
+            }
+        }
+
+        async function redoEdit() {
+            try {
+                applyEditResult(await callWorker('redo'));
+            } catch (error) {
+                showMessage('Ошибка повтора: ' + error.message, 'error');
+            }
+        }
+
+        const DIFF_OPS = { added: '+', removed: '−', changed: '~' };
+
+        function formatJsonPath(path) {
+            return path.map(key => typeof key === 'number' ? `[${key}]` : `.${key}`).join('') || '(корень)';
+        }
+
+        async function loadDiff() {
+            const container = document.getElementById('diff-list');
+            try {
+                const data = await fetchJson('/api/diff?from=backup');
+                if (data.changes.length === 0) {
+                    container.innerHTML = '<div class="no-data">Отличий нет</div>';
+                    return;
+                }
+                container.innerHTML = `
+                    <table><tbody>${data.changes.slice(0, 200).map(change => `
+                        <tr>
+                            <td style="width: 20px; color: ${change.op === 'added' ? '#4ec9b0' : change.op === 'removed' ? '#f48771' : '#dcdcaa'};">
+                                ${DIFF_OPS[change.op]}
+                            </td>
+                            <td class="value-path">${escapeHtml(formatJsonPath(change.path))}</td>
+                        </tr>
+                    `).join('')}</tbody></table>
+                    <div class="selection-stats" style="margin-top: 10px;">
+                        Изменений: ${data.changes.length}${data.truncated ? '+' : ''}${data.changes.length > 200 ? ' (показаны первые 200)' : ''}.
+                        Сравнение: ${data.elapsedMs} мс.
+                    </div>
+                `;
+            } catch (error) {
+                container.innerHTML = `<div class="no-data">${escapeHtml(error.message)}</div>`;
+            }
+        }
+
+        const METRICS_CHARTS = [
+            { key: 'size', title: 'Размер файла', format: formatSize },
+            { key: 'historyEntries', title: 'Записей истории', format: v => String(Math.round(v)) },
+            { key: 'projects', title: 'Проектов', format: v => String(Math.round(v)) },
+            { key: 'largestProject', title: 'Самый большой проект', format: formatSize }
+        ];
+
+        function renderMetricChart(points, column, threshold) {
+            const width = 300, height = 80;
+            const values = points.map(p => p[column]);
+            const t0 = points[0][0], t1 = points[points.length - 1][0];
+            let min = Math.min(...values), max = Math.max(...values);
+            // Порог на графике, только если он не сплющит саму линию
+            const showThreshold = threshold != null && threshold <= max * 1.5;
+            if (showThreshold) max = Math.max(max, threshold);
+            if (max === min) { max += 1; min -= 1; }
+            const x = t => t1 === t0 ? width : (t - t0) / (t1 - t0) * width;
+            const y = v => height - 4 - (v - min) / (max - min) * (height - 8);
+            const line = points.map(p => `${x(p[0]).toFixed(1)},${y(p[column]).toFixed(1)}`).join(' ');
+            return `
+                <svg viewBox="0 0 ${width} ${height}" preserveAspectRatio="none">
+                    ${showThreshold ? `<line x1="0" x2="${width}" y1="${y(threshold)}" y2="${y(threshold)}" stroke="#f48771" stroke-dasharray="4 3"/>` : ''}
+                    <polyline points="${line}" fill="none" stroke="#4ec9b0" stroke-width="1.5" vector-effect="non-scaling-stroke"/>
+                </svg>
+            `;
+        }
+
+        async function loadMetrics() {
+            const range = document.getElementById('metrics-range').value;
+            const summary = document.getElementById('metrics-summary');
+            try {
+                const data = await fetchJson('/api/metrics' + (range ? '?range=' + range : ''));
+                if (data.points.length === 0) {
+                    document.getElementById('metrics-charts').innerHTML = '';
+                    summary.textContent = `Замеров ещё нет: они делаются раз в ${Math.round(data.interval / 60)} мин.`;
+                    return;
+                }
+                const last = data.points[data.points.length - 1];
+                document.getElementById('metrics-charts').innerHTML = METRICS_CHARTS.map(chart => {
+                    const column = data.columns.indexOf(chart.key);
+                    const perDay = data.perDay[chart.key];
+                    const threshold = data.thresholds[chart.key];
+                    const eta = threshold != null && perDay > 0 && last[column] < threshold
+                        ? ` · порог ${chart.format(threshold)} через ${((threshold - last[column]) / perDay).toFixed(1)} дн.` : '';
+                    return `
+                        <div class="metrics-chart">
+                            <div class="selection-stats" style="margin-bottom: 5px;">
+                                ${chart.title}: <b>${chart.format(last[column])}</b>
+                                ${perDay !== undefined ? ` (${perDay >= 0 ? '+' : '−'}${chart.format(Math.abs(perDay))}/сут.)` : ''}
+                                <span style="color: ${data.alerts[chart.key] ? '#f48771' : '#858585'};">${eta}${threshold != null && last[column] >= threshold ? ' · порог превышен' : ''}</span>
+                            </div>
+                            ${renderMetricChart(data.points, column, threshold)}
+                        </div>
+                    `;
+                }).join('');
+                summary.textContent = `Точек: ${data.points.length}` +
+                    (data.step ? `, по максимуму за ${data.step >= 86400 ? 'сутки' : 'час'}` : '') +
+                    (data.largestPath ? `. Самый большой проект: ${data.largestPath}` : '') + '.';
+            } catch (error) {
+                summary.textContent = 'Ошибка загрузки замеров: ' + error.message;
+            }
+        }
+
+        const COMPACTION_STATES = {
+            'idle': 'ещё не проверялся',
+            'under-threshold': 'пороги не превышены',
+            'waiting-quiet': 'ждёт, пока файл перестанет меняться',
+            'rate-limited': 'пауза после прошлой очистки',
+            'nothing-to-do': 'политика ничего не убирает',
+            'changed-during-compaction': 'файл изменился во время очистки, повтор при следующей проверке',
+            'compacted': 'очищен'
+        };
+
+        async function loadCompactions() {
+            try {
+                const data = await fetchJson('/api/compactions');
+                const section = document.getElementById('compaction-section');
+                section.hidden = !data.enabled;
+                if (!data.enabled) return;
+                const thresholds = Object.entries(data.thresholds).filter(([, v]) => v != null)
+                    .map(([k, v]) => k === 'size' ? 'размер ' + formatSize(v) : k + ' ' + v).join(', ');
+                document.getElementById('compaction-summary').textContent =
+                    `Политика «${data.policy.name || ''}», пороги: ${thresholds}. ` +
+                    `Состояние: ${COMPACTION_STATES[data.state] || data.state}.`;
+                document.getElementById('compaction-runs').innerHTML = data.runs.length === 0 ? '' : `
+                    <table>
+                        <thead><tr><th>Когда</th><th>Причина</th><th>Проекты</th><th>Записи истории</th><th>Размер</th></tr></thead>
+                        <tbody>${data.runs.slice().reverse().map(run => `
+                            <tr>
+                                <td>${new Date(run.t * 1000).toLocaleString()}</td>
+                                <td>${escapeHtml(run.skipped || run.reasons.join(', '))}</td>
+                                <td>−${run.droppedProjects}${run.truncatedProjects ? `, обрезано ${run.truncatedProjects}` : ''}</td>
+                                <td>−${run.droppedEntries}</td>
+                                <td>${formatSize(run.sizeBefore)}${run.sizeAfter !== undefined ? ' → ' + formatSize(run.sizeAfter) : ''}${run.archived ? ' (в архиве)' : ''}</td>
+                            </tr>
+                        `).join('')}</tbody>
+                    </table>
+                `;
+            } catch (error) {
+                document.getElementById('compaction-summary').textContent = 'Ошибка: ' + error.message;
+            }
+        }
+
+        async function loadDuplicates() {
+            const summary = document.getElementById('duplicates-summary');
+            try {
+                const data = await fetchJson('/api/duplicates');
+                summary.textContent = data.groups === 0
+                    ? `Дубликатов нет (проверено записей: ${data.entries}).`
+                    : `Групп: ${data.groups}, лишних записей: ${data.duplicateEntries} из ${data.entries}, ` +
+                      `занимают ${formatSize(data.duplicateBytes)}. Останется новейшая копия каждой записи.`;
+                document.getElementById('dedupe-btn').disabled = data.groups === 0;
+
+                document.getElementById('duplicates-list').innerHTML = data.top.length === 0 ? '' : `
+                    <table><tbody>${data.top.slice(0, 20).map(group => `
+                        <tr>
+                            <td class="value-path">${escapeHtml(group.preview) || '<span class="raw-summary">(без текста)</span>'}</td>
+                            <td style="color: #858585; white-space: nowrap;">
+                                ${group.count} копий в ${group.projects} пр.${group.exact ? '' : ' · похожие'}
+                            </td>
+                            <td style="white-space: nowrap;">${formatSize(group.duplicateBytes)}</td>
+                        </tr>
+                    `).join('')}</tbody></table>
+                `;
+            } catch (error) {
+                summary.textContent = 'Ошибка поиска дубликатов: ' + error.message;
+            }
+        }
+
+        async function dedupeHistory() {
+            if (!confirm('Удалить повторяющиеся записи истории, оставив новейшую копию каждой?')) return;
+            try {
+                const plan = await fetchJson('/api/duplicates/plan');
+                const result = await callWorker('removeHistoryEntries', { removals: plan.removals });
+                applyEditResult(result);
+                markChanged();
+                document.getElementById('dedupe-btn').disabled = true;
+
+                const skipped = result.skipped ? ` Пропущено ${result.skipped}: записи уже изменены.` : '';
+                showMessage(`Удалено дубликатов: ${result.removed}.${skipped} Нажмите "Сохранить".`, 'success');
+            } catch (error) {
+                showMessage('Ошибка удаления дубликатов: ' + error.message, 'error');
+            }
+        }
+
+        async function loadTreemap(path = []) {
+            try {
+                const query = `path=${encodeURIComponent(JSON.stringify(path))}&depth=${TREEMAP_DEPTH}`;
+                const data = await fetchJson('/api/treemap?' + query);
+                treemapPath = path;
+                if (data.categories) renderTreemapCategories(data.total, data.categories);
+                renderTreemapPath();
+                renderTreemap(data.tree, path);
+            } catch (error) {
+                document.getElementById('treemap').innerHTML =
+                    `<div class="no-data">Не удалось построить карту: ${escapeHtml(error.message)}</div>`;
+            }
+        }
+
+        function renderTreemapCategories(total, categories) {
+            const labels = {
+                pastedContents: 'Вставленный контент в истории',
+                historyOther: 'Остальная история',
+                projectSettings: 'Настройки проектов',
+                mcpServers: 'MCP серверы',
+                other: 'Прочее'
+            };
+            document.getElementById('treemap-categories').innerHTML = Object.entries(labels).map(([key, label]) => {
+                const share = total ? (categories[key] / total * 100).toFixed(1) : 0;
+                return `<span>${label}: <strong>${formatSize(categories[key])}</strong> (${share}%)</span>`;
+            }).join('');
+        }
+
+        function renderTreemapPath() {
+            const parts = ['<a data-depth="0">файл</a>'];
+            treemapPath.forEach((key, i) => parts.push(`<a data-depth="${i + 1}">${escapeHtml(String(key))}</a>`));
+            const container = document.getElementById('treemap-path');
+            container.innerHTML = parts.join(' / ');
+            container.querySelectorAll('a').forEach(a => {
+                a.onclick = () => loadTreemap(treemapPath.slice(0, Number(a.dataset.depth)));
+            });
+        }
+
+        function renderTreemap(tree, path) {
+            const container = document.getElementById('treemap');
+            const width = container.clientWidth || 1000;
+            const height = container.clientHeight || 400;
+            const fragment = document.createDocumentFragment();
+            const palette = ['#0e639c', '#107c10', '#8a5a00', '#6b2fa0', '#a1260d', '#00707a', '#5c5c5c'];
+
+            const draw = (node, nodePath, x, y, w, h, colorIndex) => {
+                const children = (node.children || []).filter(c => c.size > 0);
+                if (children.length === 0 || w < 30 || h < 20 || nodePath.length - path.length >= TREEMAP_DEPTH) {
+                    const cell = document.createElement('div');
+                    const drillable = (node.children || node.container) && !node.rest;
+                    cell.className = 'treemap-cell' + (drillable ? '' : ' leaf');
+                    cell.style.cssText = `left:${x}px;top:${y}px;width:${w}px;height:${h}px;background:${palette[colorIndex % palette.length]}`;
+                    cell.textContent = w > 60 && h > 16 ? `${node.name} · ${formatSize(node.size)}` : '';
+                    cell.title = `${[...nodePath].join(' / ')}: ${formatSize(node.size)}`;
+                    if (drillable) cell.onclick = () => loadTreemap(nodePath);
+                    fragment.appendChild(cell);
+                    return;
+                }
+                squarify(children, x, y, w, h).forEach((rect, i) => {
+                    const child = children[i];
+                    const childPath = child.rest ? nodePath : [...nodePath, child.name];
+                    const childColor = nodePath.length === path.length ? i : colorIndex;
+                    draw(child, childPath, rect.x, rect.y, rect.w, rect.h, childColor);
+                });
+            };
+
+            draw(tree, path, 0, 0, width, height, 0);
+            container.replaceChildren(fragment);
+        }
+
+        function squarify(items, x, y, w, h) {
+            // Squarified treemap: строки набираются, пока не ухудшается соотношение сторон
+            const total = items.reduce((sum, item) => sum + item.size, 0);
+            const scale = (w * h) / total;
+            const areas = items.map(item => item.size * scale);
+            const rects = [];
+            let start = 0;
+
+            while (start < areas.length) {
+                const side = Math.min(w, h);
+                let end = start + 1;
+                let rowArea = areas[start];
+                const worst = (area, max, min) => {
+                    const s2 = side * side;
+                    return Math.max(s2 * max / (area * area), (area * area) / (s2 * min));
+                };
+                let max = areas[start], min = areas[start];
+                while (end < areas.length) {
+                    const next = areas[end];
+                    const newMax = Math.max(max, next), newMin = Math.min(min, next);
+                    if (worst(rowArea + next, newMax, newMin) > worst(rowArea, max, min)) break;
+                    rowArea += next;
+                    max = newMax;
+                    min = newMin;
+                    end++;
+                }
+
+                const thickness = rowArea / side;
+                let offset = 0;
+                for (let i = start; i < end; i++) {
+                    const length = areas[i] / thickness;
+                    if (w >= h) rects.push({ x: x, y: y + offset, w: thickness, h: length });
+                    else rects.push({ x: x + offset, y: y, w: length, h: thickness });
+                    offset += length;
+                }
+                if (w >= h) {
+                    x += thickness;
+                    w -= thickness;
                 } else {
-                    return aVal < bVal ? 1 : -1;
+                    y += thickness;
+                    h -= thickness;
+                }
+                start = end;
+            }
+            return rects;
+        }
+
+        function renderProjects() {
+            updateProjectView();
+            updateSelectionStats();
+            renderVisibleRows();
+        }
+
+        function invalidateProjectOrders() {
+            sortOrders = {};
+            viewState = null;
+            projectsRevision++;
+        }
+
+        function projectOrder(column) {
+            // Перестановка индексов по возрастанию; пересчитывается только при изменении projects
+            if (!sortOrders[column]) {
+                const values = column === 'path' ? projectPaths : column === 'history' ? projectHistory : projectSizes;
+                const order = new Uint32Array(projectPaths.length);
+                for (let i = 0; i < order.length; i++) order[i] = i;
+                order.sort((a, b) => {
+                    const aVal = values[a];
+                    const bVal = values[b];
+                    if (aVal < bVal) return -1;
+                    if (aVal > bVal) return 1;
+                    return a - b;
+                });
+                sortOrders[column] = order;
+            }
+            return sortOrders[column];
+        }
+
+        function daysSince(timestamp) {
+            return Math.floor((Date.now() / 1000 - timestamp) / 86400);
+        }
+
+        function activityFilter() {
+            const mode = document.getElementById('projects-activity').value;
+            const days = Number(document.getElementById('projects-inactive-days').value) || 0;
+            if (mode === 'dead') return { key: 'dead', test: i => !!projectScans[i] && projectScans[i].exists === false };
+            if (mode === 'inactive') {
+                const cutoff = Date.now() / 1000 - days * 86400;
+                return {
+                    key: 'inactive:' + days,
+                    test: i => !!projectScans[i] && (projectScans[i].exists === false ||
+                        (!!projectScans[i].exists && projectScans[i].mtime < cutoff))
+                };
+            }
+            return { key: 'all', test: null };
+        }
+
+        function updateProjectView() {
+            const searchTerm = document.getElementById('projects-search').value.toLowerCase();
+            const activity = activityFilter();
+
+            document.getElementById('projects-badge').textContent = projectPaths.length;
+
+            const sameOrder = viewState !== null
+                && viewState.column === sortColumn
+                && viewState.direction === sortDirection
+                && viewState.activity === activity.key;
+
+            if (sameOrder && viewState.term === searchTerm) return;
+
+            if (sameOrder && searchTerm.includes(viewState.term)) {
+                // Уточнение запроса: результат - подмножество текущего вида
+                const lower = lowerProjectPaths();
+                projectView = projectView.filter(i => lower[i].includes(searchTerm));
+            } else {
+                const order = projectOrder(sortColumn);
+                const lower = searchTerm ? lowerProjectPaths() : null;
+                const view = [];
+                const asc = sortDirection === 'asc';
+                for (let k = 0; k < order.length; k++) {
+                    const i = order[asc ? k : order.length - 1 - k];
+                    if (searchTerm && !lower[i].includes(searchTerm)) continue;
+                    if (activity.test && !activity.test(i)) continue;
+                    view.push(i);
                 }
+                projectView = view;
+            }
+
+            viewState = { column: sortColumn, direction: sortDirection, term: searchTerm, activity: activity.key };
+        }
+
+        function scheduleVisibleRows() {
+            if (rowsFrame !== null) return;
+            rowsFrame = requestAnimationFrame(() => {
+                rowsFrame = null;
+                renderVisibleRows();
             });
+        }
+
+        function buildRowPool(tbody) {
+            const poolSize = Math.ceil(window.innerHeight / ROW_HEIGHT) + 2 * ROW_OVERSCAN;
+            const fragment = document.createDocumentFragment();
+
+            const topSpacer = createSpacerRow();
+            fragment.appendChild(topSpacer);
+            rowPool = [];
+            for (let i = 0; i < poolSize; i++) {
+                const row = createProjectRow();
+                rowPool.push(row);
+                fragment.appendChild(row);
+            }
+            const bottomSpacer = createSpacerRow();
+            fragment.appendChild(bottomSpacer);
+
+            rowPool.topSpacer = topSpacer.firstChild;
+            rowPool.bottomSpacer = bottomSpacer.firstChild;
+            tbody.replaceChildren(fragment);
+        }
+
+        function createSpacerRow() {
+            const tr = document.createElement('tr');
+            tr.className = 'spacer-row';
+            const td = document.createElement('td');
+            td.colSpan = 5;
+            tr.appendChild(td);
+            return tr;
+        }
+
+        function createProjectRow() {
+            const tr = document.createElement('tr');
+            tr.className = 'project-row';
+            tr.innerHTML = `
+                <td><input type="checkbox"></td>
+                <td class="project-path"></td>
+                <td class="project-history"></td>
+                <td class="project-activity"></td>
+                <td>
+                    <div class="size-bar">
+                        <div class="size-bar-fill"></div>
+                        <span class="size-text"></span>
+                    </div>
+                </td>
+            `;
+            tr._checkbox = tr.querySelector('input');
+            tr._path = tr.querySelector('.project-path');
+            tr._history = tr.querySelector('.project-history');
+            tr._activity = tr.querySelector('.project-activity');
+            tr._fill = tr.querySelector('.size-bar-fill');
+            tr._sizeText = tr.querySelector('.size-text');
+            tr._index = -1;
+            return tr;
+        }
+
+        function patchProjectRow(tr, i) {
+            // Индексы переиспользуются после удаления/правки, поэтому сверяется и ревизия колонок
+            if (tr._index !== i || tr._revision !== projectsRevision || tr._maxSize !== maxProjectSize) {
+                tr._index = i;
+                tr._revision = projectsRevision;
+                tr._maxSize = maxProjectSize;
+                tr._path.textContent = projectPaths[i];
+                tr._path.title = projectPaths[i];
+                tr._history.textContent = projectHistory[i];
+                tr._fill.style.width = (maxProjectSize ? projectSizes[i] / maxProjectSize * 100 : 0) + '%';
+                tr._sizeText.textContent = formatSize(projectSizes[i]);
+            }
+            if (tr._scan !== projectScans[i]) {
+                tr._scan = projectScans[i];
+                const scan = projectScans[i];
+                tr._activity.classList.toggle('dead', !!scan && scan.exists === false);
+                tr._activity.title = scan && scan.error ? scan.error : '';
+                if (!scan) tr._activity.textContent = '…';
+                else if (scan.exists === null) tr._activity.textContent = '⚠️ нет доступа';
+                else if (!scan.exists) tr._activity.textContent = '❌ папки нет';
+                else tr._activity.textContent = daysSince(scan.mtime) + ' дн.' + (scan.git ? '' : ' · не git');
+            }
+            const selected = selectedPaths.has(projectPaths[i]);
+            if (tr._selected !== selected) {
+                tr._selected = selected;
+                tr.classList.toggle('selected', selected);
+                tr._checkbox.checked = selected;
+            }
+        }
+
+        function renderVisibleRows() {
+            const tbody = document.getElementById('projects-body');
 
-            const filtered = searchTerm
-                ? sorted.filter(p => p.path.toLowerCase().includes(searchTerm))
-                : sorted;
+            if (projectView.length === 0) {
+                rowPool = [];
+                const text = projectPaths.length === 0 ? 'Нет проектов' : 'Ничего не найдено';
+                tbody.innerHTML = `<tr><td colspan="5" class="no-data">${text}</td></tr>`;
+                return;
+            }
 
-            const maxSize = Math.max(...projects.map(p => p.size));
+            if (rowPool.length === 0) buildRowPool(tbody);
 
-            tbody.innerHTML = filtered.map(project => {
-                const percentage = (project.size / maxSize) * 100;
-                let sizeClass = 'small';
-                if (project.size > 500000) sizeClass = 'large';
-                else if (project.size > 100000) sizeClass = 'medium';
+            const viewport = document.getElementById('projects-viewport');
+            const maxFirst = Math.max(0, projectView.length - rowPool.length);
+            const first = Math.min(maxFirst, Math.max(0, Math.floor(viewport.scrollTop / ROW_HEIGHT) - ROW_OVERSCAN));
+            const count = Math.min(rowPool.length, projectView.length - first);
 
-                return `
-                    <tr class="${project.selected ? 'selected' : ''}" onclick="toggleProject('${escapeHtml(project.path)}')">
-                        <td>
-                            <input type="checkbox" ${project.selected ? 'checked' : ''}
-                                   onclick="event.stopPropagation(); toggleProject('${escapeHtml(project.path)}')">
-                        </td>
-                        <td style="font-family: 'Monaco', monospace; font-size: 12px;">
-                            ${escapeHtml(project.path)}
-                        </td>
-                        <td style="text-align: center; color: #858585;">
-                            ${project.historyCount}
-                        </td>
-                        <td>
-                            <div class="size-bar">
-                                <div class="size-bar-fill" style="width: ${percentage}%"></div>
-                                <span class="size-text">${formatSize(project.size)}</span>
-                            </div>
-                        </td>
-                    </tr>
-                `;
-            }).join('');
+            rowPool.topSpacer.style.height = (first * ROW_HEIGHT) + 'px';
+            rowPool.bottomSpacer.style.height = ((projectView.length - first - count) * ROW_HEIGHT) + 'px';
+
+            for (let i = 0; i < rowPool.length; i++) {
+                const row = rowPool[i];
+                if (i < count) {
+                    row.hidden = false;
+                    patchProjectRow(row, projectView[first + i]);
+                } else if (!row.hidden) {
+                    row.hidden = true;
+                    row._index = -1;
+                }
+            }
         }
 
         function renderMcpServers() {
@@ -736,12 +5576,57 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
                             ${server.args ? '<div><strong>Args:</strong> ' + JSON.stringify(server.args) + '</div>' : ''}
                             ${server.env ? '<div><strong>Env:</strong> ' + JSON.stringify(server.env) + '</div>' : ''}
                             ${server.cwd ? '<div><strong>CWD:</strong> ' + escapeHtml(server.cwd) + '</div>' : ''}
+                            ${renderMcpProbe(name)}
                         </div>
                     </div>
                 `;
             }).join('');
         }
 
+        function renderMcpProbe(name) {
+            const runs = mcpProbeHistory.filter(run => run.results.some(r => r.name === name));
+            if (runs.length === 0) return '';
+
+            const results = runs.map(run => run.results.find(r => r.name === name));
+            const last = results[results.length - 1];
+            const status = last.ok
+                ? `✅ готов за ${last.latencyMs} мс`
+                : `❌ ${escapeHtml(last.status)}: ${escapeHtml(last.error || '')}`;
+            const history = results.map(r => r.ok ? r.latencyMs : '✕').join(', ');
+            return `
+                <div><strong>Запуск:</strong> ${status}</div>
+                <div><strong>История, мс:</strong> ${history}</div>
+            `;
+        }
+
+        async function loadMcpProbeHistory() {
+            try {
+                const data = await fetchJson('/api/mcp/history');
+                mcpProbeHistory = data.runs;
+                renderMcpServers();
+            } catch (error) {
+                showMessage('Ошибка загрузки истории проверок: ' + error.message, 'error');
+            }
+        }
+
+        async function runMcpProbe() {
+            if (hasChanges) {
+                showMessage('Проверяются серверы из сохранённого файла. Сохраните изменения, чтобы проверить новые.', 'error');
+            }
+            const button = document.getElementById('mcp-probe-btn');
+            button.disabled = true;
+            button.textContent = '⏳ Проверка...';
+            try {
+                await fetchJson('/api/mcp/probe', { method: 'POST' });
+                await loadMcpProbeHistory();
+            } catch (error) {
+                showMessage('Ошибка проверки MCP: ' + error.message, 'error');
+            } finally {
+                button.disabled = false;
+                button.textContent = '🩺 Проверить запуск';
+            }
+        }
+
         function renderSettings() {
             const container = document.getElementById('settings-list');
             const settings = {
@@ -766,9 +5651,179 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             container.innerHTML = html;
         }
 
+        async function fetchJson(url, options) {
+            const response = await fetch(apiUrl(url), options);
+            const data = await response.json();
+            if (!response.ok || data.error) throw new Error(data.error || response.statusText);
+            return data;
+        }
+
         function renderRawJson() {
+            // Просмотр строится по кэшированной на сервере версии файла и только когда вкладка открыта
+            if (!document.getElementById('tab-raw').classList.contains('active')) {
+                rawJsonStale = true;
+                return;
+            }
+            rawJsonStale = false;
+            rawLineBlocks = new Map();
+
+            document.getElementById('raw-json-note').textContent = hasChanges
+                ? 'Показана сохранённая версия файла, несохранённые изменения в ней не видны.'
+                : '';
+
+            const container = document.getElementById('raw-json');
+            container.onscroll = null;
+            container.scrollTop = 0;
+
+            if (rawMode === 'tree') {
+                const list = document.createElement('div');
+                container.replaceChildren(list);
+                loadRawChildren(list, [], 0);
+            } else {
+                const spacer = document.createElement('div');
+                spacer.className = 'raw-text';
+                spacer.appendChild(document.createElement('pre'));
+                container.replaceChildren(spacer);
+                container.onscroll = () => {
+                    if (rawTextFrame !== null) return;
+                    rawTextFrame = requestAnimationFrame(() => {
+                        rawTextFrame = null;
+                        drawRawText();
+                    });
+                };
+                drawRawText();
+            }
+        }
+
+        function setRawMode(mode) {
+            rawMode = mode;
+            renderRawJson();
+        }
+
+        async function loadRawChildren(list, path, offset) {
+            try {
+                const query = `path=${encodeURIComponent(JSON.stringify(path))}&offset=${offset}`;
+                const data = await fetchJson('/api/raw/node?' + query);
+                const fragment = document.createDocumentFragment();
+
+                for (const child of data.children) {
+                    fragment.appendChild(createRawNode(child, [...path, child.key]));
+                }
+
+                const shown = offset + data.children.length;
+                if (shown < data.total) {
+                    const more = document.createElement('button');
+                    more.className = 'small';
+                    more.textContent = `Показать ещё (${data.total - shown})`;
+                    more.onclick = () => {
+                        more.remove();
+                        loadRawChildren(list, path, shown);
+                    };
+                    fragment.appendChild(more);
+                }
+                list.appendChild(fragment);
+            } catch (error) {
+                showMessage('Ошибка загрузки JSON: ' + error.message, 'error');
+            }
+        }
+
+        function createRawNode(child, path) {
+            const node = document.createElement('div');
+            const line = document.createElement('div');
+            line.className = 'raw-line';
+
+            const toggle = document.createElement('span');
+            toggle.className = 'raw-toggle';
+            const key = document.createElement('span');
+            key.className = 'json-key';
+            key.textContent = typeof child.key === 'number' ? child.key + ': ' : JSON.stringify(child.key) + ': ';
+            line.append(toggle, key);
+
+            if (child.type === 'object' || child.type === 'array') {
+                const summary = document.createElement('span');
+                summary.className = 'raw-summary';
+                summary.textContent = child.type === 'object'
+                    ? `{…} ${child.count} ключей`
+                    : `[…] ${child.count} элементов`;
+                line.appendChild(summary);
+                line.classList.add('container');
+                toggle.textContent = '▸';
+
+                let children = null;
+                line.onclick = () => {
+                    if (children === null) {
+                        // Поддерево запрашивается с сервера только при первом раскрытии
+                        children = document.createElement('div');
+                        children.className = 'raw-children';
+                        node.appendChild(children);
+                        loadRawChildren(children, path, 0);
+                    } else {
+                        children.hidden = !children.hidden;
+                    }
+                    toggle.textContent = children.hidden ? '▸' : '▾';
+                };
+            } else {
+                const value = document.createElement('span');
+                value.className = child.type === 'string' ? 'json-string' : 'json-number';
+                value.textContent = child.value;
+                line.appendChild(value);
+                if (child.truncated) {
+                    const rest = document.createElement('span');
+                    rest.className = 'raw-summary';
+                    rest.textContent = ` … (${formatSize(child.truncated)})`;
+                    line.appendChild(rest);
+                }
+            }
+
+            node.appendChild(line);
+            return node;
+        }
+
+        async function getRawLineBlock(index) {
+            if (rawLineBlocks.has(index)) {
+                const block = rawLineBlocks.get(index);
+                rawLineBlocks.delete(index);
+                rawLineBlocks.set(index, block);
+                return block;
+            }
+
+            const data = await fetchJson(`/api/raw/lines?start=${index * RAW_BLOCK_LINES}&count=${RAW_BLOCK_LINES}`);
+            rawLineTotal = data.total;
+            rawLineBlocks.set(index, data.lines);
+            // Держим ограниченное число блоков, чтобы память не росла при прокрутке
+            while (rawLineBlocks.size > RAW_MAX_BLOCKS) {
+                rawLineBlocks.delete(rawLineBlocks.keys().next().value);
+            }
+            return data.lines;
+        }
+
+        async function drawRawText() {
+            const seq = ++rawTextSeq;
             const container = document.getElementById('raw-json');
-            container.textContent = JSON.stringify(config, null, 2);
+            const first = Math.floor(container.scrollTop / RAW_LINE_HEIGHT);
+            const count = Math.ceil(container.clientHeight / RAW_LINE_HEIGHT) + 1;
+
+            try {
+                const lines = [];
+                const lastBlock = Math.floor((first + count - 1) / RAW_BLOCK_LINES);
+                for (let block = Math.floor(first / RAW_BLOCK_LINES); block <= lastBlock; block++) {
+                    const blockLines = await getRawLineBlock(block);
+                    const blockStart = block * RAW_BLOCK_LINES;
+                    for (let i = Math.max(first, blockStart); i < Math.min(first + count, blockStart + blockLines.length); i++) {
+                        lines.push(blockLines[i - blockStart]);
+                    }
+                }
+                if (seq !== rawTextSeq || rawMode !== 'text') return;
+
+                const spacer = container.querySelector('.raw-text');
+                if (!spacer) return;
+                spacer.style.height = (rawLineTotal * RAW_LINE_HEIGHT) + 'px';
+                const pre = spacer.firstChild;
+                pre.style.top = (first * RAW_LINE_HEIGHT) + 'px';
+                pre.textContent = lines.join('\\n');
+            } catch (error) {
+                showMessage('Ошибка загрузки JSON: ' + error.message, 'error');
+            }
         }
 
         function formatSize(bytes) {
@@ -789,44 +5844,130 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
 
             event.target.classList.add('active');
             document.getElementById('tab-' + tabName).classList.add('active');
+
+            if (tabName === 'raw' && rawJsonStale) renderRawJson();
         }
 
-        function toggleProject(path) {
-            const project = projects.find(p => p.path === path);
-            if (project) {
-                project.selected = !project.selected;
-                markChanged();
-                renderProjects();
+        async function scanProjects() {
+            // Сначала показываем кэш прошлой проверки, затем обновляем в фоне
+            const status = document.getElementById('projects-scan-status');
+            try {
+                applyProjectScan(await fetchJson('/api/projects/scan'));
+                await fetchJson('/api/projects/scan', { method: 'POST' });
+                for (;;) {
+                    const scan = await fetchJson('/api/projects/scan');
+                    status.textContent = scan.running ? `Проверка папок: ${scan.done}/${scan.total}` : '';
+                    if (!scan.running) {
+                        applyProjectScan(scan);
+                        break;
+                    }
+                    await new Promise(resolve => setTimeout(resolve, 500));
+                }
+            } catch (error) {
+                status.textContent = 'Проверка папок не удалась: ' + error.message;
             }
         }
 
-        function toggleAllProjects(checked) {
-            const searchTerm = document.getElementById('projects-search').value.toLowerCase();
-            const filtered = searchTerm
-                ? projects.filter(p => p.path.toLowerCase().includes(searchTerm))
-                : projects;
+        function applyProjectScan(scan) {
+            for (const [path, result] of Object.entries(scan.results)) {
+                const i = projectIndex.get(path);
+                if (i !== undefined) projectScans[i] = result;
+            }
+            viewState = null;
+            renderProjects();
+        }
 
-            filtered.forEach(p => p.selected = checked);
+        function setProjectSelected(i, selected) {
+            const path = projectPaths[i];
+            if (selected === selectedPaths.has(path)) return;
+            if (selected) {
+                selectedPaths.add(path);
+                selectedBytes += projectSizes[i];
+            } else {
+                selectedPaths.delete(path);
+                selectedBytes -= projectSizes[i];
+            }
+        }
+
+        function updateSelectionStats() {
+            document.getElementById('projects-selected-count').textContent = selectedPaths.size;
+            document.getElementById('projects-selected-size').textContent = formatSize(selectedBytes);
+        }
+
+        function applySelection() {
+            // Пакетные операции меняют только selectedPaths и трогают DOM один раз
             markChanged();
-            renderProjects();
+            updateSelectionStats();
+            renderVisibleRows();
+        }
+
+        function toggleProject(path) {
+            const i = projectIndex.get(path);
+            if (i === undefined) return;
+
+            setProjectSelected(i, !selectedPaths.has(path));
+            markChanged();
+            updateSelectionStats();
+
+            const row = rowPool.find(r => r._index === i);
+            if (row) patchProjectRow(row, i);
+        }
+
+        function toggleAllProjects(checked) {
+            for (const i of projectView) setProjectSelected(i, checked);
+            applySelection();
         }
 
         function selectAllProjects() {
             document.getElementById('select-all-projects').checked = true;
-            toggleAllProjects(true);
+            for (let i = 0; i < projectPaths.length; i++) setProjectSelected(i, true);
+            applySelection();
         }
 
         function deselectAllProjects() {
             document.getElementById('select-all-projects').checked = false;
-            toggleAllProjects(false);
+            selectedPaths.clear();
+            selectedBytes = 0;
+            applySelection();
         }
 
-        function selectLargestProjects() {
-            deselectAllProjects();
-            const sorted = [...projects].sort((a, b) => b.size - a.size);
-            sorted.slice(0, 10).forEach(p => p.selected = true);
-            markChanged();
-            renderProjects();
+        function selectLargestProjects(k = 10) {
+            selectedPaths.clear();
+            selectedBytes = 0;
+            for (const i of largestProjects(k)) setProjectSelected(i, true);
+            applySelection();
+        }
+
+        function largestProjects(k) {
+            // Min-heap индексов на k элементов: O(n log k) вместо полной сортировки
+            const heap = [];
+            const size = (h) => projectSizes[heap[h]];
+            const siftDown = (i) => {
+                for (;;) {
+                    const l = 2 * i + 1, r = l + 1;
+                    let m = i;
+                    if (l < heap.length && size(l) < size(m)) m = l;
+                    if (r < heap.length && size(r) < size(m)) m = r;
+                    if (m === i) return;
+                    [heap[i], heap[m]] = [heap[m], heap[i]];
+                    i = m;
+                }
+            };
+            for (let p = 0; p < projectPaths.length; p++) {
+                if (heap.length < k) {
+                    heap.push(p);
+                    for (let i = heap.length - 1; i > 0;) {
+                        const parent = (i - 1) >> 1;
+                        if (size(parent) <= size(i)) break;
+                        [heap[i], heap[parent]] = [heap[parent], heap[i]];
+                        i = parent;
+                    }
+                } else if (k > 0 && projectSizes[p] > size(0)) {
+                    heap[0] = p;
+                    siftDown(0);
+                }
+            }
+            return heap;
         }
 
         function sortProjects(column) {
@@ -840,11 +5981,93 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
         }
 
         function filterProjects() {
-            renderProjects();
+            clearTimeout(filterTimer);
+            filterTimer = setTimeout(renderProjects, FILTER_DEBOUNCE_MS);
+        }
+
+        async function archiveSelectedProjects(oldHistoryOnly) {
+            const selected = [...selectedPaths];
+            if (selected.length === 0) {
+                alert('Ничего не выбрано');
+                return;
+            }
+            if (hasChanges && !confirm('Архив работает с сохранённым файлом, несохранённые изменения будут потеряны. Продолжить?')) {
+                return;
+            }
+
+            const keep = Number(document.getElementById('archive-keep').value) || 0;
+            const question = oldHistoryOnly
+                ? `Перенести в архив историю старше ${keep} записей для ${selected.length} проектов?`
+                : `Перенести в архив ${selected.length} проектов?`;
+            if (!confirm(question)) return;
+
+            try {
+                const result = await fetchJson('/api/archive', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ projects: selected, keepHistory: oldHistoryOnly ? keep : null })
+                });
+                await reloadAfterServerWrite();
+                showMessage(`В архив перенесено проектов: ${result.archived.length}.`, 'success');
+            } catch (error) {
+                showMessage('Ошибка архивации: ' + error.message, 'error');
+            }
+        }
+
+        async function restoreArchivedProject(path) {
+            if (hasChanges && !confirm('Восстановление работает с сохранённым файлом, несохранённые изменения будут потеряны. Продолжить?')) {
+                return;
+            }
+            try {
+                const result = await fetchJson('/api/archive/restore', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ path })
+                });
+                await reloadAfterServerWrite();
+                showMessage(`Проект восстановлен, записей истории: ${result.entries}.`, 'success');
+            } catch (error) {
+                showMessage('Ошибка восстановления: ' + error.message, 'error');
+            }
+        }
+
+        async function loadArchive() {
+            const container = document.getElementById('archive-list');
+            try {
+                const data = await fetchJson('/api/archive');
+                const entries = Object.entries(data.projects).sort((a, b) => b[1].archivedAt - a[1].archivedAt);
+                document.getElementById('archive-badge').textContent = entries.length;
+                if (entries.length === 0) {
+                    container.innerHTML = '<div class="no-data">Архив пуст</div>';
+                    return;
+                }
+                container.innerHTML = `<table><tbody>${entries.map(([path, item], i) => `
+                    <tr>
+                        <td class="value-path">${escapeHtml(path)}</td>
+                        <td style="color: #858585; white-space: nowrap;">
+                            ${item.whole ? 'проект целиком' : 'старая история'} · ${item.entries} записей
+                        </td>
+                        <td style="white-space: nowrap;">${formatSize(item.size)} → ${formatSize(item.compressed)}</td>
+                        <td><button class="small" data-archive="${i}">Восстановить</button></td>
+                    </tr>
+                `).join('')}</tbody></table>`;
+                container.querySelectorAll('button[data-archive]').forEach(button => {
+                    button.onclick = () => restoreArchivedProject(entries[Number(button.dataset.archive)][0]);
+                });
+            } catch (error) {
+                container.innerHTML = `<div class="no-data">Ошибка: ${escapeHtml(error.message)}</div>`;
+            }
+        }
+
+        async function reloadAfterServerWrite() {
+            // Файл изменён на сервере: перечитываем его целиком
+            hasChanges = false;
+            document.getElementById('save-btn').disabled = true;
+            await loadConfig();
         }
 
         function deleteSelectedProjects() {
-            const selected = projects.filter(p => p.selected);
+            const selected = [...selectedPaths];
             if (selected.length === 0) {
                 alert('Ничего не выбрано');
                 return;
@@ -852,11 +6075,16 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
 
             if (!confirm(`Удалить историю для ${selected.length} проектов?`)) return;
 
-            selected.forEach(project => {
-                delete config.projects[project.path];
-            });
+            callWorker('deleteProjects', { paths: selected }).then(result => {
+                configSize = result.totalSize;
+                applySessionState(result.state);
+                renderOverview();
+            }).catch(error => showMessage('Ошибка удаления: ' + error.message, 'error'));
 
-            projects = projects.filter(p => !p.selected);
+            removeProjectsFromColumns(selectedPaths);
+            selectedPaths.clear();
+            selectedBytes = 0;
+            updateSelectionStats();
             markChanged();
             renderAllTabs();
 
@@ -867,6 +6095,7 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             if (!confirm(`Удалить MCP сервер "${name}"?`)) return;
 
             delete config.mcpServers[name];
+            syncConfigKey('mcpServers');
             markChanged();
             renderAllTabs();
 
@@ -887,6 +6116,7 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
                 args: []
             };
 
+            syncConfigKey('mcpServers');
             markChanged();
             renderAllTabs();
             showMessage(`MCP сервер "${name}" добавлен.`, 'success');
@@ -903,20 +6133,43 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             saveBtn.textContent = '⏳ Сохранение...';
 
             try {
-                const response = await fetch('/api/save', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(config)
-                });
-
-                const result = await response.json();
+                let overwrite = await confirmOverwriteExternalChanges();
+                if (overwrite === false) {
+                    saveBtn.disabled = false;
+                    saveBtn.textContent = '💾 Сохранить все изменения';
+                    return;
+                }
+                let result = await callWorker('save', { overwrite });
+                while (result.conflict) {
+                    // Файл записали уже после проверки выше
+                    if (!confirm('Файл снова изменён на диске (например, самим Claude Code). Перезаписать эти изменения?')) {
+                        throw new Error(result.error);
+                    }
+                    overwrite = result.version;
+                    result = await callWorker('save', { overwrite });
+                }
+                if (!result.success && result.validation) {
+                    const list = result.validation.errors.slice(0, 10)
+                        .map(e => `  ${formatJsonPath(e.path)}: ${e.message}`).join('\\n');
+                    const more = result.validation.count > 10 ? `\\n  … и ещё ${result.validation.count - 10}` : '';
+                    if (!confirm(`Конфиг не прошёл проверку, Claude Code может не запуститься:\\n${list}${more}\\n\\nВсё равно сохранить?`)) {
+                        throw new Error(result.error);
+                    }
+                    result = await callWorker('save', { force: true, overwrite });
+                }
 
                 if (result.success) {
-                    hasChanges = false;
+                    applySessionState(result.state);
+                    loadedVersion = result.version;
                     const now = new Date().toLocaleTimeString('ru-RU');
                     document.getElementById('last-save').textContent = now;
                     showMessage('✅ Конфиг сохранён! Перезапустите Claude Code.', 'success');
                     saveBtn.textContent = '💾 Сохранено';
+                    renderRawJson();
+                    loadTreemap();
+                    loadTopValues();
+                    loadDuplicates();
+                    loadDiff();
                 } else {
                     throw new Error(result.error);
                 }
@@ -927,6 +6180,29 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             }
         }
 
+        async function confirmOverwriteExternalChanges() {
+            // Файл мог измениться на диске (например, его записал сам Claude Code).
+            // Возвращает версию файла, которую можно перезаписать, null - если
+            // файл не менялся, false - если пользователь отказался
+            if (loadedVersion === null) return null;
+            let diff;
+            try {
+                const response = await fetch(apiUrl('/api/diff?from=' + encodeURIComponent(loadedVersion)));
+                diff = await response.json();
+                if (!response.ok || diff.error) throw new Error(diff.error || response.statusText);
+            } catch (error) {
+                // Версия страницы вытеснена из истории или конфиг выгружали: что
+                // изменилось, не узнать, поэтому считаем, что файл изменён
+                const message = `Не удалось сравнить с версией, загруженной на страницу (${error.message}).\\n` +
+                    'Файл мог измениться на диске.\\n\\nСохранить, перезаписав возможные изменения?';
+                return confirm(message) ? (diff && diff.version) || null : false;
+            }
+            if (diff.changes.length === 0) return diff.to;
+            const list = diff.changes.slice(0, 10).map(c => `  ${DIFF_OPS[c.op]} ${formatJsonPath(c.path)}`).join('\\n');
+            const more = diff.changes.length > 10 ? `\\n  … и ещё ${diff.changes.length - 10}` : '';
+            return confirm(`Файл изменён на диске после загрузки:\\n${list}${more}\\n\\nПерезаписать эти изменения?`) ? diff.to : false;
+        }
+
         function reloadConfig() {
             if (hasChanges && !confirm('Несохранённые изменения будут потеряны. Продолжить?')) {
                 return;
@@ -934,8 +6210,8 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             location.reload();
         }
 
-        function createBackup() {
-            const blob = new Blob([JSON.stringify(config, null, 2)], { type: 'application/json' });
+        async function createBackup() {
+            const blob = new Blob([await callWorker('pretty')], { type: 'application/json' });
             const url = URL.createObjectURL(blob);
             const a = document.createElement('a');
             const timestamp = new Date().toISOString().replace(/[:.]/g, '-');
@@ -946,9 +6222,9 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             showMessage('Бэкап создан и скачан', 'success');
         }
 
-        function copyRawJson() {
-            const text = JSON.stringify(config, null, 2);
-            navigator.clipboard.writeText(text);
+        async function copyRawJson() {
+            const response = await fetch(apiUrl('/api/raw/text'));
+            await navigator.clipboard.writeText(await response.text());
             showMessage('JSON скопирован в буфер обмена', 'success');
         }
 
@@ -970,20 +6246,308 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(html.encode('utf-8'))
 
-    def send_config(self):
+    def send_page(self, html):
+        body = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_worker(self):
+        body = CONFIG_WORKER_JS.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'application/javascript; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200):
+        body = JSON_BACKEND.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_raw_node(self, query):
+        try:
+            path = json.loads(query.get('path', ['[]'])[0])
+            offset = int(query.get('offset', ['0'])[0])
+            limit = min(int(query.get('limit', [str(RAW_NODE_LIMIT)])[0]), RAW_NODE_LIMIT)
+            self.send_json(json_node_children(self.entry.doc.load(), path, offset, limit))
+        except (KeyError, IndexError, ValueError) as e:
+            self.send_json({'error': f'Некорректный путь: {e}'}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_treemap(self, query):
+        try:
+            path = tuple(json.loads(query.get('path', ['[]'])[0]))
+            depth = max(1, min(int(query.get('depth', [str(TREEMAP_DEPTH)])[0]), TREEMAP_MAX_DEPTH))
+            attribution = self.entry.doc.derived(
+                ('treemap', path, depth),
+                lambda config: ByteAttribution(config, path, depth).to_json()
+            )
+            self.send_json(attribution)
+        except (KeyError, IndexError, ValueError) as e:
+            self.send_json({'error': f'Некорректный путь: {e}'}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_top_values(self, query):
+        try:
+            k = max(1, min(int(query.get('k', [str(TOP_VALUES_K)])[0]), TOP_VALUES_MAX_K))
+            types = tuple(sorted(set(query.get('types', ['string,array'])[0].split(',')) & {'string', 'array'}))
+            if not types:
+                raise ValueError('types должен содержать string и/или array')
+            values = self.entry.doc.derived(('top-values', k, types), lambda config: top_json_values(config, k, types))
+            self.send_json({'k': k, 'types': list(types), 'values': values})
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_duplicates(self, plan):
+        try:
+            duplicates = self.entry.doc.derived('duplicates', build_history_duplicates)
+            if plan:
+                self.send_json({'removals': duplicates.removals})
+            else:
+                self.send_json(duplicates.summary())
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_raw_lines(self, query):
+        try:
+            start = int(query.get('start', ['0'])[0])
+            count = min(int(query.get('count', ['200'])[0]), 1000)
+            rendering = self.entry.doc.derived('pretty', PrettyRendering)
+            self.send_json({
+                'total': rendering.line_count,
+                'start': start,
+                'lines': rendering.lines(start, count)
+            })
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_raw_text(self):
+        try:
+            body = self.entry.doc.derived('pretty', PrettyRendering).text
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def run_mcp_probe(self):
+        # Запускаем только серверы из сохранённого файла, а не из тела запроса
+        try:
+            servers = self.entry.doc.load().get('mcpServers') or {}
+            self.send_json({'results': probe_mcp_servers(servers, self.entry.mcp_log)})
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_project_scan(self):
+        try:
+            paths = (self.entry.doc.load().get('projects') or {}).keys()
+            self.send_json(PROJECT_SCANNER.status(paths))
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def start_project_scan(self):
+        try:
+            paths = (self.entry.doc.load().get('projects') or {}).keys()
+            self.send_json({'started': PROJECT_SCANNER.start(paths)})
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_project_listing(self, query):
+        try:
+            listing, version = self.entry.doc.snapshot('project-listing', build_project_listing)
+            if query.get('format', ['rows'])[0] == 'columnar':
+                self.send_json({**listing, 'version': version})
+                return
+
+            paths = decode_listing_paths(listing)
+            self.send_json({
+                'version': version,
+                'projects': [
+                    {'path': path, 'historyCount': count, 'size': size}
+                    for path, count, size in zip(paths, listing['historyCount'], listing['size'])
+                ]
+            })
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_metrics(self, query):
+        try:
+            seconds = int(query['range'][0]) if 'range' in query else None
+            series = self.entry.metrics.series
+            step, points = series.points(seconds)
+            self.send_json({
+                'columns': METRICS_COLUMNS,
+                'step': step,
+                'points': points,
+                'largestPath': series.largest_path,
+                'perDay': series.forecast(),
+                'thresholds': self.entry.metrics.thresholds,
+                'alerts': series.alerts,
+                'interval': self.entry.metrics.interval
+            })
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_fleet_summary(self):
+        try:
+            self.send_json(FLEET_AGENT.summary())
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_fleet_rollup(self, query):
+        if FLEET_COLLECTOR is None:
+            self.send_json({'error': 'Коллектор не включён (--collector)'}, 404)
+            return
+        try:
+            threshold = int(query['threshold'][0]) if 'threshold' in query else None
+            self.send_json(FLEET_COLLECTOR.store.rollup(threshold))
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def ingest_fleet_summaries(self):
+        if FLEET_COLLECTOR is None:
+            self.send_json({'error': 'Коллектор не включён (--collector)'}, 404)
+            return
+        try:
+            summaries = self.read_json_body().get('summaries')
+            if not isinstance(summaries, list):
+                raise ValueError('Ожидается {"summaries": [...]}')
+            result = FLEET_COLLECTOR.store.ingest(summaries, ['push'] * len(summaries))
+            self.send_json(result, 400 if result['rejected'] else 200)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_diff(self, query):
+        """Изменения от версии from (backup или метка версии) к текущему файлу."""
         try:
-            with open(CLAUDE_CONFIG_PATH, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            source = query.get('from', ['backup'])[0]
+            started = time.perf_counter()
+            current, version = self.entry.doc.snapshot('merkle', merkle_tree)
+            self.entry.merkle.put(version, current)
+
+            if source == 'backup':
+                if not self.entry.backup.path.exists():
+                    self.send_json({'error': 'Резервной копии нет'}, 404)
+                    return
+                old = self.entry.backup.derived('merkle', merkle_tree)
+            else:
+                old = self.entry.merkle.get(source)
+                if old is None:
+                    # Текущая версия нужна странице, чтобы перезаписать её после подтверждения
+                    self.send_json({'error': 'Версия %s неизвестна' % source, 'version': version}, 404)
+                    return
+
+            changes = merkle_diff(old, current)
+            self.send_json({
+                'from': source,
+                'to': version,
+                'changes': changes,
+                'truncated': len(changes) >= DIFF_CHANGES_LIMIT,
+                'elapsedMs': round((time.perf_counter() - started) * 1000, 2)
+            })
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def session_action(self, action):
+        try:
+            body = self.read_json_body()
+            if action == 'close':
+                self.entry.sessions.close(body.get('session'))
+                self.send_json({'success': True})
+                return
+
+            copy = self.entry.sessions.get(body.get('session'))
+            with copy.lock:
+                response = {}
+                if action == 'edit':
+                    patches, result = copy.edit(body.get('op'), body)
+                    response = {'patches': patches, 'result': result}
+                elif action == 'undo':
+                    response = {'patches': copy.undo()}
+                elif action == 'redo':
+                    response = {'patches': copy.redo()}
+                elif action == 'commit':
+                    validation = self.entry.validator.validate(copy.current, body.get('session'), copy.version)
+                    if not validation['valid'] and not body.get('force'):
+                        self.send_json({
+                            'success': False,
+                            'error': f'Конфиг не прошёл проверку: ошибок {validation["count"]}',
+                            'validation': validation
+                        }, 422)
+                        return
+                    try:
+                        written = copy.commit(body.get('overwrite'))
+                    except ConfigConflict as e:
+                        self.send_json({
+                            'success': False,
+                            'conflict': True,
+                            'error': 'Файл изменён на диске после загрузки',
+                            'version': e.version
+                        }, 409)
+                        return
+                    response = {
+                        'success': True,
+                        'backup': written['backup'],
+                        'version': written['version'],
+                        'coalesced': written['coalesced'],
+                        'validation': validation
+                    }
+                else:
+                    self.send_json({'error': f'Неизвестное действие: {action}'}, 404)
+                    return
+                response['state'] = copy.state()
+            self.send_json(response)
+        except KeyError:
+            self.send_json({'error': 'Сессия истекла, перезагрузите страницу'}, 410)
+        except (ValueError, TypeError) as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
+
+    def send_config(self, query):
+        try:
+            session = query.get('session', [None])[0]
+            if session:
+                copy = self.entry.sessions.get(session)
+                config, version = copy.current, copy.version
+            else:
+                config, version = self.entry.doc.snapshot()
+            # Хэши загруженной версии: потом по ним видно, что поменялось на диске
+            self.entry.merkle.remember_async(version, config)
 
             response = {
-                'path': str(CLAUDE_CONFIG_PATH),
+                'path': str(self.entry.path),
+                'version': version,
                 'config': config
             }
+            body = JSON_BACKEND.dumps(response)
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
+            # Content-Length нужен воркеру для прогресса загрузки
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self.wfile.write(body)
         except Exception as e:
             self.send_response(500)
             self.send_header('Content-type', 'application/json')
@@ -991,50 +6555,362 @@ class ClaudeConfigHandler(http.server.SimpleHTTPRequestHandler):
             error = {'error': str(e)}
             self.wfile.write(json.dumps(error).encode('utf-8'))
 
-    def save_config(self):
+    def read_json_body(self):
+        content_length = int(self.headers['Content-Length'])
+        return json.loads(self.rfile.read(content_length).decode('utf-8'))
+
+    def simulate_policies(self):
         try:
-            content_length = int(self.headers['Content-Length'])
-            body = self.rfile.read(content_length)
-            new_config = json.loads(body.decode('utf-8'))
+            policies = self.read_json_body().get('policies') or []
+            started = time.perf_counter()
+            table = self.entry.doc.derived('project-stats', ProjectStatsTable)
+            built = time.perf_counter()
+            mtimes, scanned = project_mtimes(table.paths)
+            now = time.time()
+            results = [table.simulate(policy, mtimes, now) for policy in policies]
+            self.send_json({
+                'baseline': {
+                    'bytes': table.total_bytes,
+                    'projects': len(table.paths),
+                    'historyEntries': sum(table.history_count)
+                },
+                'policies': results,
+                'scanned': scanned,
+                'tableMs': round((built - started) * 1000, 2),
+                'elapsedMs': round((time.perf_counter() - built) * 1000, 2)
+            })
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
 
-            # Backup
-            backup_path = CLAUDE_CONFIG_PATH.with_suffix('.json.backup')
-            if CLAUDE_CONFIG_PATH.exists():
-                import shutil
-                shutil.copy2(CLAUDE_CONFIG_PATH, backup_path)
+    def run_query(self):
+        try:
+            body = self.read_json_body()
+            limit = max(1, min(int(body.get('limit', QUERY_ROWS_LIMIT)), QUERY_ROWS_LIMIT))
+            self.send_json(self.entry.index.query(body.get('sql') or '', body.get('params') or [], limit))
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
 
-            # Save
-            with open(CLAUDE_CONFIG_PATH, 'w', encoding='utf-8') as f:
-                json.dump(new_config, f, indent=2, ensure_ascii=False)
+    def send_startup_impact(self):
+        try:
+            body = self.read_json_body()
+            runs = max(1, min(int(body.get('runs', STARTUP_PARSE_RUNS)), STARTUP_MAX_RUNS))
+            scenarios = body.get('scenarios') or []
+            duplicates = None
+            if any(s.get('dedupe') for s in scenarios):
+                duplicates = self.entry.doc.derived('duplicates', build_history_duplicates)
+            self.send_json(estimate_startup_impact(self.entry.doc.load(), scenarios, runs, duplicates))
+        except (ValueError, TypeError) as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.send_json({'error': str(e)}, 500)
 
-            response = {'success': True, 'backup': str(backup_path)}
+    def archive_projects(self):
+        try:
+            body = self.read_json_body()
+            keep = body.get('keepHistory')
+            keep = None if keep is None else max(0, int(keep))
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            def change(config):
+                archived = self.entry.archive.archive(config, body.get('projects') or [], keep)
+                return bool(archived), archived
+
+            written = self.entry.writer.update(change).result()
+            self.send_json({'success': True, 'archived': written['result'], 'version': written['version']})
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            error = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(error).encode('utf-8'))
+            self.send_json({'success': False, 'error': str(e)}, 500)
+
+    def restore_project(self):
+        try:
+            project_path = self.read_json_body()['path']
+            written = self.entry.writer.update(
+                lambda config: (True, self.entry.archive.restore(config, project_path))
+            ).result()
+            # Архив удаляется, только когда проект действительно есть в файле:
+            # запись могла быть перекрыта следующей заменой конфига
+            projects = self.entry.doc.load().get('projects') or {}
+            if project_path not in projects:
+                self.send_json({
+                    'success': False,
+                    'error': 'Конфиг перезаписан во время восстановления, архив сохранён'
+                }, 409)
+                return
+            self.entry.archive.forget(project_path)
+            self.send_json({
+                'success': True,
+                'path': project_path,
+                'entries': len(written['result']['history']),
+                'version': written['version']
+            })
+        except KeyError as e:
+            self.send_json({'success': False, 'error': f'Нет архива для {e}'}, 404)
+        except Exception as e:
+            self.send_json({'success': False, 'error': str(e)}, 500)
 
     def log_message(self, format, *args):
         pass
 
+def print_mcp_probe(entry, timeout):
+    servers = entry.doc.load().get('mcpServers') or {}
+    if not servers:
+        print("🔌 MCP серверы не настроены")
+        return
+
+    print(f"🩺 Проверка {len(servers)} MCP серверов...\n")
+    for result in sorted(probe_mcp_servers(servers, entry.mcp_log, timeout), key=lambda r: r['name']):
+        if result['ok']:
+            print(f"  ✅ {result['name']}: {result['latencyMs']} мс")
+        else:
+            print(f"  ❌ {result['name']}: {result['status']} - {result.get('error', '')}")
+
+
+def print_json_benchmark(path):
+    """Замер бэкендов JSON на выбранном конфиге (или синтетическом, если его нет)."""
+    sample = None
+    if path is not None and path.exists():
+        with open(path, 'rb') as f:
+            sample = json.loads(f.read())
+    backend, report = select_json_backend(sample, runs=5)
+
+    print(f"⚙️  JSON бэкенды ({'текущий конфиг' if sample is not None else 'синтетический конфиг'}):\n")
+    for r in report:
+        if not r['compatible']:
+            print(f"  ❌ {r['name']}: вывод не совпадает с json.dump(indent=2), не используется")
+            continue
+        print(f"  {'✅' if r['backend'] is backend else '  '} {r['name']}: разбор {r['loadsMs']:.1f} мс, "
+              f"запись {r['dumpsMs']:.1f} мс, ускорение x{r['speedup']:.2f}")
+    missing = [name for name, module in (('orjson', orjson), ('ujson', ujson)) if module is None]
+    if missing:
+        print(f"\n  Не установлены: {', '.join(missing)}")
+    print(f"\nВыбран: {backend.name}")
+
+
+def print_config_summary(path):
+    """Сводка по конфигу: размеры, число проектов и записей, самые большие проекты."""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    started = time.perf_counter()
+    config = JSON_BACKEND.loads(data)
+    listing = build_project_listing(config)
+    elapsed = time.perf_counter() - started
+
+    paths = decode_listing_paths(listing)
+
+    print(f"📊 {path}: {len(data) / 1024 / 1024:.1f} МБ, разбор {elapsed * 1000:.0f} мс\n")
+    print(f"  Проектов: {listing['count']}")
+    print(f"  Записей истории: {sum(listing['historyCount'])}")
+    print(f"  MCP серверов: {len(config.get('mcpServers') or {})}")
+    print("\n  Самые большие проекты:")
+    for i in heapq.nlargest(10, range(listing['count']), key=listing['size'].__getitem__):
+        print(f"    {listing['size'][i] / 1024:>10.1f} КБ  {listing['historyCount'][i]:>5} зап.  {paths[i]}")
+
+
+def print_query(entry, sql):
+    """Выполняет SELECT по SQLite-индексу и печатает результат таблицей."""
+    result = entry.index.query(sql)
+    rows = [[('NULL' if value is None else str(value))[:80] for value in row] for row in result['rows']]
+    widths = [max([len(column)] + [len(row[i]) for row in rows]) for i, column in enumerate(result['columns'])]
+    print('  '.join(column.ljust(width) for column, width in zip(result['columns'], widths)))
+    print('  '.join('-' * width for width in widths))
+    for row in rows:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+    index = result['index']
+    print(f"\n{len(rows)}{'+' if result['truncated'] else ''} строк за {result['elapsedMs']} мс "
+          f"(индекс: {index['elapsedMs']} мс, обновлено проектов: {index['changedProjects']})")
+
+
+def register_configs(registry_file, items):
+    """Основной ~/.claude.json (если есть), затем файл реестра {имя: путь} и --config имя=путь."""
+    configs = {}
+    if CLAUDE_CONFIG_PATH.exists():
+        configs[DEFAULT_CONFIG_NAME] = CLAUDE_CONFIG_PATH
+    if registry_file:
+        with open(registry_file, 'r', encoding='utf-8') as f:
+            configs.update(json.load(f))
+    for item in items or []:
+        name, sep, path = item.partition('=')
+        if not sep:
+            raise ValueError(f'Ожидается имя=путь: {item}')
+        configs[name] = path
+    for name, path in configs.items():
+        CONFIG_REGISTRY.register(name, path)
+
+
 def main():
-    if not CLAUDE_CONFIG_PATH.exists():
+    parser = argparse.ArgumentParser(description='Редактор ~/.claude.json')
+    parser.add_argument('--probe-mcp', action='store_true',
+                        help='проверить запуск MCP серверов и выйти')
+    parser.add_argument('--timeout', type=float, default=MCP_PROBE_TIMEOUT,
+                        help='таймаут проверки одного MCP сервера, с')
+    parser.add_argument('--json-benchmark', action='store_true',
+                        help='сравнить доступные JSON бэкенды и выйти')
+    parser.add_argument('--summary', action='store_true',
+                        help='вывести сводку по конфигу и выйти')
+    parser.add_argument('--query', metavar='SQL',
+                        help='выполнить SELECT по SQLite-индексу конфига и выйти')
+    parser.add_argument('--config', action='append', metavar='ИМЯ=ПУТЬ',
+                        help='добавить конфиг в реестр (можно несколько раз); на странице - ?config=ИМЯ')
+    parser.add_argument('--registry', metavar='FILE',
+                        help='JSON-файл реестра конфигов {"имя": "путь"}')
+    parser.add_argument('--use', metavar='ИМЯ',
+                        help='конфиг из реестра для --query, --summary, --probe-mcp и --json-benchmark')
+    parser.add_argument('--memory-budget', type=float, metavar='MB', default=CONFIG_MEMORY_BUDGET / 1024 / 1024,
+                        help='сколько памяти держать под разобранные конфиги, МБ')
+    parser.add_argument('--port', type=int, default=PORT,
+                        help='порт веб-интерфейса')
+    parser.add_argument('--host', default=HOST,
+                        help='адрес, на котором слушать (0.0.0.0 - для коллектора парка); '
+                             'редактор всё равно доступен только с localhost')
+    parser.add_argument('--instance', metavar='ИМЯ',
+                        help='имя экземпляра в сводках для коллектора (по умолчанию хост:порт)')
+    parser.add_argument('--push-to', metavar='URL',
+                        help='отправлять сводку конфигов коллектору по этому адресу')
+    parser.add_argument('--collector', action='store_true',
+                        help='режим коллектора: принимать и хранить сводки экземпляров, страница /fleet')
+    parser.add_argument('--collect-from', action='append', metavar='URL',
+                        help='адрес экземпляра, который коллектор опрашивает сам (можно несколько раз)')
+    parser.add_argument('--auto-compact', action='store_true',
+                        help='чистить конфиги по политике, когда они перерастают пороги')
+    parser.add_argument('--daemon', action='store_true',
+                        help='без веб-интерфейса: только замеры и автоочистка (включает --auto-compact)')
+    parser.add_argument('--compact-policy', metavar='JSON',
+                        help=f'политика автоочистки, JSON или @файл (по умолчанию {json.dumps(DEFAULT_COMPACT_POLICY)})')
+    parser.add_argument('--compact-size', type=float, metavar='MB',
+                        help='порог размера файла для автоочистки, МБ (по умолчанию как --alert-size)')
+    parser.add_argument('--compact-history', type=int, metavar='N',
+                        help='порог числа записей истории для автоочистки')
+    parser.add_argument('--compact-projects', type=int, metavar='N',
+                        help='порог числа проектов для автоочистки')
+    parser.add_argument('--compact-quiet', type=float, metavar='S', default=COMPACT_QUIET_SECONDS,
+                        help='сколько секунд файл не должен меняться перед очисткой')
+    parser.add_argument('--compact-interval', type=float, metavar='S', default=COMPACT_MIN_INTERVAL,
+                        help='не чаще одной очистки за столько секунд')
+    parser.add_argument('--alert-webhook', metavar='URL',
+                        help='куда отправлять POST с тревогой о росте конфига')
+    parser.add_argument('--alert-size', type=float, metavar='MB', default=ALERT_THRESHOLDS['size'] / 1024 / 1024,
+                        help='порог размера файла, МБ')
+    parser.add_argument('--alert-history', type=int, metavar='N',
+                        help='порог числа записей истории')
+    parser.add_argument('--alert-projects', type=int, metavar='N',
+                        help='порог числа проектов')
+    parser.add_argument('--alert-project-size', type=float, metavar='MB',
+                        help='порог размера самого большого проекта, МБ')
+    args = parser.parse_args()
+
+    if not args.json_benchmark:
+        use_json_backend(select_json_backend()[0])
+
+    CONFIG_REGISTRY.budget = int(args.memory_budget * 1024 * 1024)
+    try:
+        register_configs(args.registry, args.config)
+    except (OSError, ValueError) as e:
+        print(f"❌ Реестр конфигов: {e}")
+        return
+
+    if args.json_benchmark:
+        try:
+            entry = CONFIG_REGISTRY.get(args.use) if CONFIG_REGISTRY.entries() else None
+        except KeyError:
+            print(f"❌ Конфиг не зарегистрирован: {args.use}")
+            return
+        print_json_benchmark(entry.path if entry else None)
+        return
+
+    # Коллектору собственные конфиги не нужны
+    if not CONFIG_REGISTRY.entries() and not args.collector:
         print(f"❌ Файл не найден: {CLAUDE_CONFIG_PATH}")
         return
 
+    if args.probe_mcp or args.query or args.summary:
+        try:
+            entry = CONFIG_REGISTRY.get(args.use)
+        except KeyError:
+            print(f"❌ Конфиг не зарегистрирован: {args.use}")
+            return
+        if not entry.path.exists():
+            print(f"❌ Файл не найден: {entry.path}")
+            return
+
+    if args.probe_mcp:
+        print_mcp_probe(entry, args.timeout)
+        return
+
+    if args.query:
+        try:
+            print_query(entry, args.query)
+        except sqlite3.Error as e:
+            print(f"❌ {e}")
+        return
+
+    if args.summary:
+        print_config_summary(entry.path)
+        return
+
+    thresholds = {
+        'size': int(args.alert_size * 1024 * 1024),
+        'historyEntries': args.alert_history,
+        'projects': args.alert_projects,
+        'largestProject': int(args.alert_project_size * 1024 * 1024) if args.alert_project_size else None
+    }
+    for entry in CONFIG_REGISTRY.entries():
+        entry.metrics.webhook = args.alert_webhook
+        entry.metrics.thresholds.update(thresholds)
+    CONFIG_REGISTRY.start_sampling()
+
+    FLEET_AGENT.instance = args.instance or f'{socket.gethostname()}:{args.port}'
+    if args.push_to:
+        FLEET_AGENT.start_push(args.push_to)
+    if args.collector:
+        global FLEET_COLLECTOR
+        FLEET_COLLECTOR = FleetCollector(FleetStore(STATE_DIR / FLEET_DB_NAME), args.collect_from or [])
+        FLEET_COLLECTOR.start()
+
+    if args.auto_compact or args.daemon:
+        try:
+            policy = parse_compact_policy(args.compact_policy)
+        except (OSError, ValueError) as e:
+            print(f"❌ Политика автоочистки: {e}")
+            return
+        compact_thresholds = {
+            'size': int((args.compact_size or args.alert_size) * 1024 * 1024),
+            'historyEntries': args.compact_history,
+            'projects': args.compact_projects
+        }
+        for entry in CONFIG_REGISTRY.entries():
+            entry.compactor = AutoCompactor(entry, policy, compact_thresholds, args.compact_quiet, args.compact_interval)
+        threading.Thread(target=run_auto_compaction, args=(CONFIG_REGISTRY,), daemon=True).start()
+        print(f"🧹 Автоочистка: {json.dumps(policy, ensure_ascii=False)}, пороги: "
+              f"{json.dumps({k: v for k, v in compact_thresholds.items() if v is not None})}")
+
+    if args.daemon:
+        print(f"👀 Слежу за {len(CONFIG_REGISTRY.entries())} конфигами, Ctrl+C для остановки")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("\n👋 Остановка...")
+        return
+
     print("🚀 Claude Config Editor")
-    print(f"📁 Конфиг: {CLAUDE_CONFIG_PATH}")
-    print(f"🌐 http://localhost:{PORT}")
+    for entry in CONFIG_REGISTRY.entries():
+        print(f"📁 Конфиг {entry.name}: {entry.path}" + ('' if entry.path.exists() else ' (файла нет)'))
+    print(f"⚙️  JSON: {JSON_BACKEND.name}, память под конфиги: {CONFIG_REGISTRY.budget // 1024 // 1024} МБ")
+    print(f"🌐 http://localhost:{args.port}" + ('' if is_loopback(args.host) else
+                                                f" (слушаю {args.host}, с других машин - только /fleet и /api/fleet/*)"))
+    if FLEET_COLLECTOR:
+        print(f"🛰  Коллектор: http://localhost:{args.port}/fleet, опрос экземпляров: {len(FLEET_COLLECTOR.sources)}")
+    if args.push_to:
+        print(f"📤 Сводка отправляется на {args.push_to} как {FLEET_AGENT.instance}")
     print("\n✨ Откройте браузер")
     print("   Ctrl+C для остановки\n")
 
-    with socketserver.TCPServer(("", PORT), ClaudeConfigHandler) as httpd:
+    # Запросы обрабатываются параллельно; запись в каждый файл всё равно одна - через его ConfigWriter
+    socketserver.ThreadingTCPServer.daemon_threads = True
+    with socketserver.ThreadingTCPServer((args.host, args.port), ClaudeConfigHandler) as httpd:
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
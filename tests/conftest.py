@@ -0,0 +1,14 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).resolve().parent.parent / 'claude-config-editor.py'
+
+
+@pytest.fixture(scope='session')
+def editor():
+    spec = importlib.util.spec_from_file_location('claude_config_editor', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
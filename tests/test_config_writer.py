@@ -0,0 +1,91 @@
+import json
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture
+def writer(editor, tmp_path):
+    path = tmp_path / '.claude.json'
+    path.write_text(json.dumps({'projects': {'/a': {'history': []}}}))
+    document = editor.ConfigDocument(path)
+    # Окно побольше, чтобы все задачи теста попали в одну пачку
+    return editor.ConfigWriter(document, editor.MerkleHistory(), window=0.5)
+
+
+def read(writer):
+    return json.loads(writer.document.path.read_text())
+
+
+def add_project(name):
+    def change(config):
+        config['projects'][name] = {'history': []}
+        return True, name
+    return change
+
+
+def test_updates_coalesce_into_one_write(writer):
+    first = writer.update(add_project('/b'))
+    second = writer.update(add_project('/c'))
+    assert first.result()['coalesced'] == 2
+    assert second.result()['version'] == first.result()['version']
+    assert writer.writes == 1
+    assert set(read(writer)['projects']) == {'/a', '/b', '/c'}
+
+
+def test_update_before_replace_is_written_first(writer):
+    restored = writer.update(add_project('/b'))
+    saved = writer.replace({'projects': {'/a': {'history': []}}})
+    assert restored.result()['version'] != saved.result()['version']
+    assert writer.writes == 2
+    assert set(read(writer)['projects']) == {'/a'}
+    backup = json.loads(Path(saved.result()['backup']).read_text())
+    assert set(backup['projects']) == {'/a', '/b'}
+
+
+def test_update_after_replace_does_not_touch_callers_tree(writer):
+    tree = {'projects': {'/a': {'history': []}, '/x': {'history': []}}}
+    saved = writer.replace(tree)
+    archived = writer.update(lambda config: (config['projects'].pop('/x') is not None, None))
+    saved.result()
+    archived.result()
+    assert set(tree['projects']) == {'/a', '/x'}
+    assert set(read(writer)['projects']) == {'/a'}
+
+
+def test_failed_update_does_not_block_others(writer):
+    def broken(config):
+        raise ValueError('broken')
+
+    failed = writer.update(broken)
+    ok = writer.update(add_project('/b'))
+    with pytest.raises(ValueError):
+        failed.result()
+    assert ok.result()['result'] == '/b'
+    assert '/b' in read(writer)['projects']
+
+
+def test_update_with_expected_version_is_checked_before_write(writer, editor):
+    version = writer.document.version_tag()
+
+    def change(config):
+        # Файл меняется, пока правка уже применяется к копии
+        writer.document.path.write_text(json.dumps({'projects': {'/other': {'history': []}}}))
+        config['projects']['/b'] = {'history': []}
+        return True, True
+
+    with pytest.raises(editor.ConfigConflict):
+        writer.update(change, expected=version).result()
+    assert writer.writes == 0
+    assert set(read(writer)['projects']) == {'/other'}
+
+
+def test_write_config_replaces_file_and_keeps_mode(editor, tmp_path):
+    path = tmp_path / '.claude.json'
+    path.write_text(json.dumps({'projects': {}}))
+    path.chmod(0o600)
+    backup = editor.write_config({'projects': {'/a': {}}}, path)
+    assert json.loads(path.read_text()) == {'projects': {'/a': {}}}
+    assert json.loads(backup.read_text()) == {'projects': {}}
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['.claude.json', '.claude.json.backup']
@@ -0,0 +1,103 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+DAY = 86400
+START = 100 * DAY + 3600
+
+
+def summary(instance, **sizes):
+    return {'instance': instance, 'configs': [
+        {'name': name, 'version': f'v-{size}', 'size': size, 'projects': 1, 'historyEntries': 0}
+        for name, size in sizes.items()
+    ]}
+
+
+@pytest.fixture
+def store(editor, tmp_path):
+    return editor.FleetStore(tmp_path / 'fleet.sqlite')
+
+
+@pytest.fixture
+def instances():
+    """Локальные экземпляры: адрес -> сводка, которую он отдаёт (None - отвечает 500)."""
+    responses = {}
+    servers = []
+
+    def start(reply):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(responses[url]).encode() if responses[url] is not None else b''
+                self.send_response(200 if responses[url] is not None else 500)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        responses[url] = reply
+        return url
+
+    yield start, responses
+    for server in servers:
+        server.shutdown()
+
+
+def test_daily_history_carries_unchanged_configs_forward(store):
+    store.ingest([summary('a', default=200), summary('b', default=300)], ['push', 'push'], now=START)
+    # День 2: a не менялся (та же версия), b вырос
+    store.ingest([summary('a', default=200), summary('b', default=250)], ['push', 'push'], now=START + DAY)
+    # День 3: никто не присылал новых версий
+    rollup = store.rollup(now=START + 2 * DAY)
+
+    assert rollup['totalSize'] == 450
+    assert rollup['history'] == [
+        [100 * DAY, 500, 2],
+        [101 * DAY, 450, 2],
+        [102 * DAY, 450, 2],
+    ]
+
+
+def test_removed_config_leaves_the_history(store):
+    store.ingest([summary('a', default=200, work=100)], ['push'], now=START)
+    store.ingest([summary('a', default=200)], ['push'], now=START + DAY)
+    rollup = store.rollup(now=START + DAY)
+
+    assert rollup['totalSize'] == 200
+    assert rollup['history'] == [[100 * DAY, 300, 2], [101 * DAY, 200, 1]]
+
+
+def test_pull_from_local_instances_keys_errors_by_instance(editor, store, instances):
+    start, responses = instances
+    healthy = start(summary('a', default=100))
+    broken = start(summary('b', default=300))
+    never = start(None)
+    collector = editor.FleetCollector(store, [healthy, broken, never])
+
+    result = collector.pull()
+    assert result['configs'] == 2
+    assert store.rollup()['totalSize'] == 400
+
+    # b перестаёт отвечать, a присылает сводку не по формату
+    responses[broken] = None
+    responses[healthy] = {'instance': 'a', 'configs': [{'name': 'default'}]}
+    collector.pull()
+
+    problems = {p['instance']: p for p in store.rollup()['problems']}
+    assert set(problems) == {'a', 'b', never}
+    assert problems['b']['lastSeen'] is not None
+    assert 'не по формату' in problems['a']['error']
+
+    # После ответа экземпляр снова без ошибки, записи по адресу не остаётся
+    responses[broken] = summary('b', default=300)
+    responses[healthy] = summary('a', default=100)
+    responses[never] = summary('c', default=50)
+    collector.pull()
+    assert store.rollup()['problems'] == []
+    assert store.rollup()['instances'] == 3
@@ -0,0 +1,74 @@
+import json
+import sys
+
+import pytest
+
+# Заглушка stdio MCP сервера: отвечает на initialize по режиму из argv
+STUB_SERVER = '''
+import json, sys, time
+mode = sys.argv[1]
+if mode == 'exit':
+    sys.exit(3)
+request = json.loads(sys.stdin.readline())
+if mode == 'hang':
+    time.sleep(30)
+# Шум и уведомления до ответа пропускаются
+print('starting...', flush=True)
+print(json.dumps({'jsonrpc': '2.0', 'method': 'notifications/message', 'params': {}}), flush=True)
+if mode == 'error':
+    reply = {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32603, 'message': 'no token'}}
+else:
+    reply = {'jsonrpc': '2.0', 'id': request['id'], 'result': {
+        'protocolVersion': request['params']['protocolVersion'],
+        'serverInfo': {'name': 'stub', 'version': '0.1'}}}
+print(json.dumps(reply), flush=True)
+sys.stdin.readline()
+'''
+
+
+@pytest.fixture
+def stub(tmp_path):
+    path = tmp_path / 'stub_server.py'
+    path.write_text(STUB_SERVER)
+    return lambda mode: {'command': sys.executable, 'args': [str(path), mode]}
+
+
+def test_probe_reports_healthy_and_failing_servers(editor, stub, tmp_path):
+    log_path = tmp_path / 'mcp-probe.jsonl'
+    servers = {
+        'healthy': stub('ok'),
+        'broken': stub('error'),
+        'crashed': stub('exit'),
+        'remote': {'type': 'sse', 'url': 'http://localhost:1/sse'}
+    }
+    results = {r['name']: r for r in editor.probe_mcp_servers(servers, log_path, timeout=10)}
+
+    healthy = results['healthy']
+    assert healthy['ok'] and healthy['status'] == 'ready'
+    assert healthy['serverInfo'] == {'name': 'stub', 'version': '0.1'}
+    assert healthy['protocolVersion'] == editor.MCP_PROTOCOL_VERSION
+    assert healthy['latencyMs'] > 0
+
+    assert not results['broken']['ok']
+    assert results['broken']['status'] == 'error'
+    assert results['broken']['error'] == 'no token'
+    assert results['crashed']['status'] == 'exited'
+    assert 'кодом 3' in results['crashed']['error']
+    assert results['remote']['status'] == 'skipped'
+
+    runs = editor.read_mcp_probe_history(log_path)
+    assert len(runs) == 1
+    assert {r['name']: r['ok'] for r in runs[0]['results']} == {
+        'healthy': True, 'broken': False, 'crashed': False, 'remote': False}
+
+
+def test_probe_times_out_on_silent_server(editor, stub):
+    result = editor.probe_mcp_server('silent', stub('hang'), timeout=0.5)
+    assert not result['ok']
+    assert result['status'] == 'timeout'
+    assert result['latencyMs'] is None
+
+
+def test_probe_reports_missing_command(editor, tmp_path):
+    result = editor.probe_mcp_server('missing', {'command': str(tmp_path / 'no-such-server')})
+    assert result['status'] == 'spawn-failed'
@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.mark.parametrize('name', ['.', '..', '.hidden', '-x', 'a.b', 'a/b', ''])
+def test_unsafe_config_names_are_rejected(editor, tmp_path, name):
+    with pytest.raises(ValueError):
+        editor.ConfigRegistry().register(name, tmp_path / '.claude.json')
+
+
+def test_plain_config_name_is_accepted(editor, tmp_path):
+    entry = editor.ConfigRegistry().register('work_2-b', tmp_path / '.claude.json')
+    assert entry.state_dir.name == 'work_2-b'
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def sessions(editor, tmp_path):
+    path = tmp_path / '.claude.json'
+    path.write_text(json.dumps({'projects': {'/a': {'history': []}}}))
+    document = editor.ConfigDocument(path)
+    writer = editor.ConfigWriter(document, editor.MerkleHistory(), window=0)
+    return editor.WorkingCopies(document, editor.ConfigValidator(), writer, limit=2)
+
+
+def make_dirty(sessions, session):
+    sessions.get(session).edit('setKey', {'key': 'theme', 'value': 'dark'})
+
+
+def test_clean_session_is_evicted_first(sessions):
+    dirty, _ = sessions.create()
+    clean, _ = sessions.create()
+    make_dirty(sessions, dirty)
+    # Грязная копия давнее чистой, но вытесняется чистая
+    sessions.get(clean).touched_at = sessions.get(dirty).touched_at + 1
+    sessions.create()
+    assert len(sessions) == 2
+    sessions.get(dirty)
+    with pytest.raises(KeyError):
+        sessions.get(clean)
+
+
+def test_dirty_sessions_are_never_evicted(sessions):
+    first, _ = sessions.create()
+    second, _ = sessions.create()
+    make_dirty(sessions, first)
+    make_dirty(sessions, second)
+    with pytest.raises(ValueError):
+        sessions.create()
+    sessions.get(first)
+    sessions.get(second)
+
+    sessions.close(second)
+    assert sessions.create()
@@ -0,0 +1,47 @@
+import pytest
+
+
+@pytest.fixture
+def counted(editor):
+    calls = []
+
+    def test(value):
+        calls.append(value)
+        return isinstance(value, str)
+
+    schema = editor.ObjectSchema({'projects': editor.ObjectSchema(values=editor.ObjectSchema(
+        values=editor.ScalarSchema('строка', test)))})
+    return editor.ConfigValidator(schema), calls
+
+
+def config(*names):
+    return {'projects': {name: {'display': name} for name in names}}
+
+
+def test_each_session_keeps_its_own_previous_result(counted):
+    validator, calls = counted
+    first, second = config('/a', '/b'), config('/c', '/d')
+    validator.validate(first, 's1')
+    validator.validate(second, 's2')
+    calls.clear()
+
+    # Правка в первой сессии делит с прошлой версией всё, кроме нового проекта
+    edited = {'projects': dict(first['projects'], **{'/e': {'display': '/e'}})}
+    assert validator.validate(edited, 's1')['valid']
+    assert calls == ['/e']
+
+
+def test_new_session_starts_from_its_file_version(counted):
+    validator, calls = counted
+    base = config('/a', '/b')
+    validator.validate(base, 'v1')
+    calls.clear()
+    validator.validate(base, 's1', 'v1')
+    assert calls == []
+
+
+def test_null_projects_is_rejected(editor):
+    result = editor.ConfigValidator().validate({'projects': None})
+    assert not result['valid']
+    assert result['errors'][0]['path'] == ['projects']
+    assert editor.ConfigValidator().validate({'projects': {}, 'theme': None})['valid']